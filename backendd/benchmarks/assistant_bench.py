@@ -0,0 +1,350 @@
+"""
+assistant_bench.py — offline benchmarks for the assistant pipeline
+==================================================================
+
+Runs the agent, its tools and the vector stack on synthetic data with the
+offline backends (``firebase_config/offline.py``): a scripted model, the hash
+embedding and an in-memory Qdrant. No network, no credentials, so regressions
+in the assistant's own code show up on any laptop. Three suites:
+
+1. ``sync`` — vector sync throughput: synthetic Firestore changes are fed
+   through ``CollectionSync`` and flushed into Qdrant (inserts, then updates
+   of a tenth of the documents, then deletes), in documents per second.
+2. ``tools`` — tool latency: hybrid semantic search with and without
+   filters, a list tool paging / aggregating synthetic rows, and the
+   ``bound_output`` / ``presentation.render`` steps every result goes through.
+3. ``agent`` — agent overhead: full runs of the function-calling and ReAct
+   agents with scripted model turns, including a step of three parallel calls.
+   ``FAKE_LLM_LATENCY_MS`` and ``--tool-latency-ms`` simulate the provider and
+   the database. ``overhead_ms`` is the wall time minus that simulated
+   waiting, i.e. the time spent in our own code.
+
+Timings are reported as mean / p50 / p95 / max milliseconds. Run it from
+``backendd``::
+
+    python -m benchmarks.assistant_bench                         # all suites
+    python -m benchmarks.assistant_bench agent --runs 100 --llm-latency-ms 50
+    python -m benchmarks.assistant_bench --docs 5000 --out bench.json
+
+The offline defaults are set before anything is imported. Exported
+``EMBEDDING_BACKEND`` / ``QDRANT_MODE`` / ``LLM_BACKEND`` values still win,
+e.g. ``EMBEDDING_BACKEND=local`` to time the real model.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+
+os.environ.setdefault("OFFLINE_MODE", "true")
+os.environ.setdefault("ANSWER_CACHE_ENABLED", "false")
+
+SUITES = ("sync", "tools", "agent")
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("suites", nargs="*", help=f"suites to run: {', '.join(SUITES)} (default: all)")
+parser.add_argument("--docs", type=int, default=1000, help="synthetic orders (clients and items scale with it)")
+parser.add_argument("--queries", type=int, default=200, help="timed calls per tool benchmark")
+parser.add_argument("--runs", type=int, default=50, help="timed runs per agent benchmark")
+parser.add_argument("--tool-latency-ms", type=float, default=5.0, help="simulated database latency of agent tools")
+parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated model latency (FAKE_LLM_LATENCY_MS)")
+parser.add_argument("--seed", type=int, default=7)
+parser.add_argument("--out", help="also write the JSON report here")
+args = parser.parse_args()
+if set(args.suites) - set(SUITES):
+    parser.error(f"unknown suite(s): {', '.join(sorted(set(args.suites) - set(SUITES)))}")
+os.environ.setdefault("FAKE_LLM_LATENCY_MS", str(args.llm_latency_ms))
+
+from langchain.tools import Tool  # noqa: E402
+
+from firebase_config import offline, presentation  # noqa: E402
+from firebase_config.function_agent import run_function_agent  # noqa: E402
+from firebase_config.llama_index_configs.embeddings import EMBEDDING_BACKEND  # noqa: E402
+from firebase_config.llama_index_configs.global_settings import QDRANT_MODE  # noqa: E402
+from firebase_config.llama_index_configs.semantic_search import semantic_tool_func  # noqa: E402
+from firebase_config.llama_index_configs.vector_points import ensure_collection  # noqa: E402
+from firebase_config.llama_index_configs.vector_sync import CollectionSync  # noqa: E402
+from firebase_config.tool_outputs import bound_output, list_tool  # noqa: E402
+
+FIRST_NAMES = ["Apollo", "Sunrise", "City", "Lotus", "Care", "Metro", "Shree", "Life", "Green", "Unity"]
+LAST_NAMES = ["Hospital", "Clinic", "Diagnostics", "Pharma", "Medicals", "Healthcare", "Nursing Home"]
+PRODUCTS = ["Oximeter", "BP Monitor", "Glucometer", "Nebulizer", "Wheelchair", "Thermometer", "Syringe Pump",
+            "ECG Machine", "Oxygen Concentrator", "Surgical Gloves", "Face Mask", "Stethoscope"]
+CATEGORIES = ["Diagnostics", "Consumables", "Mobility", "Respiratory", "Monitoring"]
+STATUSES = ["pending", "delivered", "cancelled"]
+PAYMENT_STATUSES = ["paid", "partial", "unpaid"]
+
+
+# ---------------------------------------------------------------------------
+# Synthetic data
+# ---------------------------------------------------------------------------
+def synthetic_data(orders: int, seed: int) -> Dict[str, Dict[str, Dict]]:
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    clients = {
+        f"C{i:04d}": {
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}",
+            "due_amount": rng.randrange(0, 200_000, 500),
+            "address": f"{rng.randint(1, 300)} Main Road, Sector {rng.randint(1, 60)}",
+        }
+        for i in range(1, max(orders // 10, 5) + 1)
+    }
+    items = {
+        f"I{i:04d}": {
+            "name": f"{product} {model}",
+            "category": rng.choice(CATEGORIES),
+            "stock_quantity": rng.randint(0, 500),
+            "low_stock_threshold": 20,
+            "batches": [{"batch_number": f"B{i}{b}", "Expiry": "2026-12", "quantity": rng.randint(1, 100)} for b in range(2)],
+        }
+        for i, (product, model) in enumerate(((p, m) for m in ("Pro", "Lite", "Max", "X") for p in PRODUCTS), start=1)
+    }
+    client_ids, item_ids = list(clients), list(items)
+    order_docs = {}
+    for i in range(1, orders + 1):
+        client_id = rng.choice(client_ids)
+        lines = [
+            {"name": items[item_id]["name"], "quantity": rng.randint(1, 20), "price": rng.randrange(200, 20_000, 50)}
+            for item_id in rng.sample(item_ids, rng.randint(1, 4))
+        ]
+        total = sum(line["quantity"] * line["price"] for line in lines)
+        created = start + timedelta(hours=rng.randint(0, 24 * 365))
+        order_docs[f"O{i:06d}"] = {
+            "order_type": "sale" if rng.random() < 0.8 else "purchase",
+            "invoice_number": f"INV-{i:06d}",
+            "order_date": created,
+            "created_at": created,
+            "updated_at": created,
+            "client_id": client_id,
+            "client_name": clients[client_id]["name"],
+            "total_amount": total,
+            "amount_paid": rng.choice([0, total // 2, total]),
+            "payment_status": rng.choice(PAYMENT_STATUSES),
+            "status": rng.choice(STATUSES),
+            "items": lines,
+        }
+    return {"orders": order_docs, "clients": clients, "items": items}
+
+
+# ---------------------------------------------------------------------------
+# Measurement helpers
+# ---------------------------------------------------------------------------
+def _summary(samples_ms: List[float]) -> Dict:
+    ordered = sorted(samples_ms)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def timed(fn: Callable, calls: List) -> Dict:
+    """Call ``fn(arg)`` for every arg (after one untimed warm-up call) and summarise the latencies."""
+    fn(calls[0])
+    samples = []
+    for arg in calls:
+        started = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - started) * 1000)
+    return _summary(samples)
+
+
+class _MemoryDoc:
+    """Stand-in for the ``vector_sync_state`` document."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self):
+        return SimpleNamespace(exists=bool(self.data), to_dict=lambda: dict(self.data))
+
+    def set(self, data, merge=False):
+        self.data = {**self.data, **data} if merge else dict(data)
+
+
+def _change(kind: str, doc_id: str, data: Dict):
+    return SimpleNamespace(type=SimpleNamespace(name=kind), document=SimpleNamespace(id=doc_id, to_dict=lambda: data))
+
+
+def _sync_round(sync: CollectionSync, changes: List) -> Dict:
+    started = time.perf_counter()
+    sync.on_snapshot(None, changes, datetime.now(timezone.utc))
+    applied = sync.flush()
+    seconds = time.perf_counter() - started
+    return {"documents": applied, "seconds": round(seconds, 3), "docs_per_second": round(applied / seconds, 1)}
+
+
+# ---------------------------------------------------------------------------
+# Suites
+# ---------------------------------------------------------------------------
+def bench_sync(data: Dict, rng: random.Random) -> Dict:
+    report = {}
+    for name, docs in data.items():
+        ensure_collection(name)
+        sync = CollectionSync(name, state_ref=_MemoryDoc())
+        report[name] = {"insert": _sync_round(sync, [_change("ADDED", i, d) for i, d in docs.items()])}
+        updated = rng.sample(list(docs), max(len(docs) // 10, 1))
+        report[name]["update"] = _sync_round(
+            sync, [_change("MODIFIED", i, {**docs[i], "remarks": "revised"}) for i in updated]
+        )
+    removed = rng.sample(list(data["orders"]), max(len(data["orders"]) // 20, 1))
+    sync = CollectionSync("orders", state_ref=_MemoryDoc())
+    report["orders"]["delete"] = _sync_round(sync, [_change("REMOVED", i, {}) for i in removed])
+    for i in removed:
+        data["orders"].pop(i)
+    return report
+
+
+def bench_tools(data: Dict, queries: int, rng: random.Random) -> Dict:
+    search_orders = semantic_tool_func("orders")
+    search_items = semantic_tool_func("items")
+    clients = list(data["clients"].values())
+    products = [item["name"] for item in data["items"].values()]
+    rows = [{"id": doc_id, **order, "order_date": order["order_date"].date().isoformat()} for doc_id, order in data["orders"].items()]
+    list_orders = list_tool(lambda: rows)
+
+    return {
+        "semantic_search": timed(search_orders, [f"orders for {rng.choice(clients)['name']}" for _ in range(queries)]),
+        "semantic_search_filtered": timed(search_orders, [
+            {"query": rng.choice(products), "filters": {"order_type": "sale", "month": f"2024-{rng.randint(1, 12):02d}"}}
+            for _ in range(queries)
+        ]),
+        "semantic_search_items": timed(search_items, [f"{rng.choice(products)} stock" for _ in range(queries)]),
+        "list_page": timed(list_orders, [{"offset": rng.randrange(0, len(rows)), "limit": 20} for _ in range(queries)]),
+        "list_aggregate": timed(list_orders, [
+            {"aggregate": rng.choice(["sum", "avg"]), "field": "total_amount", "group_by": "client_name"}
+            for _ in range(queries)
+        ]),
+        "bound_output_full_list": timed(bound_output, [rows] * min(queries, 20)),
+        "render_table": timed(presentation.render, [rows[:rng.randint(1, 10)] for _ in range(queries)]),
+    }
+
+
+def _agent_tools(data: Dict, latency_ms: float) -> List[Tool]:
+    """Search tools over the in-memory collections plus lookups that sleep like a database round trip."""
+    clients = data["clients"]
+
+    def get_client_dues(client_id: str) -> dict:
+        time.sleep(latency_ms / 1000)
+        client = clients.get(client_id)
+        if client is None:
+            return {"error": f"Client {client_id} not found"}
+        return {"client_id": client_id, "name": client["name"], "due_amount": client["due_amount"]}
+
+    def get_client_orders(client_id: str) -> list:
+        time.sleep(latency_ms / 1000)
+        return [{"id": i, **o} for i, o in data["orders"].items() if o["client_id"] == client_id]
+
+    return [
+        Tool(name="OrderSemanticSearch", func=semantic_tool_func("orders"), description="Search orders by meaning."),
+        Tool(name="GetClientDues", func=get_client_dues, description="Due amount of a client by client ID."),
+        Tool(name="GetClientOrders", func=list_tool(get_client_orders), description="A client's orders, paged."),
+    ]
+
+
+def bench_agent(data: Dict, runs: int, tool_latency_ms: float, rng: random.Random) -> Dict:
+    from firebase_config.agent import _build_agent
+
+    client_ids = list(data["clients"])
+    tools = _agent_tools(data, tool_latency_ms)
+    llm_ms = offline.FAKE_LLM_LATENCY_MS
+    offline.set_script([
+        {"match": "^dues of", "calls": [{"name": "GetClientDues", "args": {"client_id": client_ids[0]}}]},
+        {"match": "^compare", "calls": [
+            {"name": "GetClientDues", "args": {"client_id": client_id}} for client_id in client_ids[:3]
+        ]},
+        {"match": "^orders and dues", "steps": [
+            [{"name": "GetClientOrders", "args": {"client_id": client_ids[1], "limit": 5}}],
+            [{"name": "GetClientDues", "args": {"client_id": client_ids[1]}}],
+        ]},
+    ])
+
+    # name -> (question, steps that wait on a database lookup). The scripted
+    # ReAct model makes only the first call of a step, so its "parallel" run
+    # does one lookup where the function-calling agent does three at once.
+    scenarios = {
+        "single_call": ("dues of C0001", 1),
+        "parallel_3_calls": ("compare the dues of our top three clients", 1),
+        "two_steps": ("orders and dues of the second client", 2),
+        "semantic_default": ("recent oximeter sales", 0),
+    }
+    report = {}
+    for mode in ("function_calling", "react"):
+        if mode == "react":
+            executor = _build_agent(tools)
+            executor.verbose = False  # the chain trace would bury the report
+            run = lambda question: executor.invoke({"input": question, "chat_history": ""})["output"]  # noqa: E731
+        else:
+            run = lambda question: run_function_agent(question, "", tools)  # noqa: E731
+        report[mode] = {}
+        for name, (question, tool_steps) in scenarios.items():
+            offline.llm_stats(reset=True)
+            result = timed(run, [question] * runs)
+            # timed() makes one extra warm-up run.
+            llm_calls = sum(offline.llm_stats(reset=True).values()) / (runs + 1)
+            simulated = llm_calls * llm_ms + tool_steps * tool_latency_ms
+            result["llm_calls_per_run"] = round(llm_calls, 2)
+            result["simulated_wait_ms"] = round(simulated, 3)
+            result["overhead_ms"] = round(result["mean_ms"] - simulated, 3)
+            report[mode][name] = result
+
+    # The streaming presentation pass for output too irregular to template.
+    mixed = [{"id": i, "note": "x" * rng.randint(10, 50)} if i % 2 else {"id": i} for i in range(40)]
+
+    def present(output):
+        async def drain():
+            return "".join([chunk async for chunk in presentation.stream(output)])
+
+        return asyncio.run(drain())
+
+    report["presentation_stream"] = timed(present, [mixed] * runs)
+    offline.set_script(None)
+    return report
+
+
+def main():
+    suites = args.suites or ["sync", "tools", "agent"]
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    data = synthetic_data(args.docs, args.seed)
+    report = {
+        "config": {
+            "embedding_backend": EMBEDDING_BACKEND,
+            "qdrant_mode": QDRANT_MODE,
+            "llm_backend": offline.LLM_BACKEND,
+            "orders": len(data["orders"]),
+            "clients": len(data["clients"]),
+            "items": len(data["items"]),
+            "llm_latency_ms": offline.FAKE_LLM_LATENCY_MS,
+            "tool_latency_ms": args.tool_latency_ms,
+            "python": sys.version.split()[0],
+        }
+    }
+    # Every suite searches the collections, so they are always loaded; timed only when asked for.
+    sync_report = bench_sync(data, rng)
+    if "sync" in suites:
+        report["sync"] = sync_report
+    if "tools" in suites:
+        report["tools"] = bench_tools(data, args.queries, rng)
+    if "agent" in suites:
+        report["agent"] = bench_agent(data, args.runs, args.tool_latency_ms, rng)
+    report["total_seconds"] = round(time.perf_counter() - started, 2)
+
+    text = json.dumps(report, indent=2, default=str)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,104 +4,422 @@ agent.py — LangChain conversational agent for the BHC AI assistant
 
 This wires together three pieces:
 
-1. The LLM  — Google Gemini (``gemini-2.0-flash``) via ``langchain-google-genai``.
-2. The tools — every database tool defined in ``firebase_config/tools.py``
-   (CRUD helpers + semantic search over the Qdrant vector store).
-3. Memory   — a conversation buffer so the agent keeps context across turns.
+1. The LLM  — Google Gemini (``gemini-2.0-flash``) via ``langchain-google-genai``,
+   or the scripted model of ``offline.py`` with ``LLM_BACKEND=fake``.
+2. The tools — the database tools defined in ``firebase_config/tools.py``
+   (CRUD helpers + semantic search over the Qdrant vector store). Each
+   question only sees the handful picked by ``tool_selection.select_tools``,
+   so the agent prompt stays small.
+3. Memory   — per-session history from ``firebase_config/chat_memory.py``: a
+   token-budgeted window of recent turns plus a rolling summary, rendered into
+   the agent prompt.
 
-The agent uses the ZERO_SHOT_REACT_DESCRIPTION strategy: on each query it reasons
-about which tool to call, calls it, then we run a second "presentation" pass that
-turns the raw tool output into a clean, user-facing answer.
+``AGENT_MODE`` picks how the tools are driven:
+
+- ``function_calling`` (default) — Gemini's structured function calling
+  (``function_agent.py``): typed tool schemas, several tool calls per step, run
+  in parallel. Compound questions take fewer LLM round trips.
+- ``react`` — the ZERO_SHOT_REACT_DESCRIPTION text agent, one tool per step.
+
+Either way, ``presentation.py`` turns the raw tool output into a clean,
+user-facing answer: a deterministic template when the output is small and
+regular, a second Gemini pass otherwise.
+
+Answers are reused through ``answer_cache.py`` while the data they were built
+from is unchanged; ``run_agent_streaming`` stores each completed answer.
+
+Every run is traced (``instrumentation.py``): model calls, tool calls,
+retrievals and the presentation step are recorded as spans. With
+``debug=True`` the run's trace is the last event. The LangChain stdout trace
+(``verbose``) is off unless ``AGENT_VERBOSE=true``.
 
 Public surface:
-    run_agent(user_input, messages)            -> str   (single, non-streaming reply)
-    run_agent_streaming(user_input, messages)  -> str   (used by POST /api/v1/chat)
+    run_agent(user_input, history)             -> str   (single, non-streaming reply)
+    run_agent_streaming(user_input, history, debug=False)
+                                               -> async iterator of queued/progress/token(/debug) events
+                                                  (used by POST /api/v1/chat)
+    agent_for(user_input)                      -> AgentExecutor (ReAct mode, tools selected for the question)
+    agent_gate                                 -> AgentGate (concurrency limit + bounded wait queue)
+    summarize_turns(previous_summary, turns)   -> str   (rolling summary for chat_memory)
 """
 
+import asyncio
+import json
+import logging
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Deque, Optional
 
-from langchain_google_genai import ChatGoogleGenerativeAI
+from cachetools import LRUCache
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain.agents import initialize_agent
 from langchain.agents.agent_types import AgentType
-from langchain.memory import ConversationBufferMemory
 
-from firebase_config.tools import all_tools
+from firebase_config import answer_cache, instrumentation, presentation
+from firebase_config.chat_memory import CHAT_SUMMARY_TOKEN_BUDGET, count_tokens
+from firebase_config.function_agent import run_function_agent
+from firebase_config.intent_router import route_question
+from firebase_config.offline import chat_model
+from firebase_config.tool_outputs import TOOL_OUTPUT_TOKEN_BUDGET
+from firebase_config.tool_selection import select_tools
 from firebase_config.llama_index_configs import global_settings  # noqa: F401  (triggers embedding config)
 
+logger = logging.getLogger(__name__)
+
 # ---------------------------------------------------------------------------
-# LLM, memory, and agent are initialised once at import time and reused.
+# LLM and agent are initialised once at import time and reused. Conversation
+# memory is per session (chat_memory) and passed in as rendered text.
 # ---------------------------------------------------------------------------
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Concurrent agent runs, requests allowed to wait for one, and the wall-clock
+# budget of a single run (tool phase + presentation pass).
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "4"))
+AGENT_QUEUE_SIZE = int(os.getenv("AGENT_QUEUE_SIZE", "16"))
+AGENT_TIMEOUT_SECONDS = float(os.getenv("AGENT_TIMEOUT_SECONDS", "60"))
+QUEUE_POLL_SECONDS = 0.5
+
+# "function_calling" (parallel, typed tool calls) or "react" (text agent).
+AGENT_MODE = os.getenv("AGENT_MODE", "function_calling").lower()
+# LangChain's chain trace on stdout; the structured spans are always recorded.
+AGENT_VERBOSE = os.getenv("AGENT_VERBOSE", "false").lower() == "true"
+
+# The agent, its tools and memory are synchronous; they run here so a chat
+# request never holds the event loop that serves the CRUD endpoints.
+_agent_pool = ThreadPoolExecutor(max_workers=AGENT_MAX_CONCURRENCY, thread_name_prefix="agent")
+
+llm = chat_model(model="gemini-2.0-flash", temperature=0)
+
+# The default ZERO_SHOT_REACT suffix with the session history added.
+AGENT_SUFFIX = """Begin!
+
+Conversation so far (may be empty):
+{chat_history}
+
+Question: {input}
+Thought:{agent_scratchpad}"""
+
+AGENT_CACHE_SIZE = 64
+
+
+def _build_agent(tools):
+    return initialize_agent(
+        tools=tools,
+        llm=llm,
+        agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+        agent_kwargs={"suffix": AGENT_SUFFIX, "input_variables": ["input", "chat_history", "agent_scratchpad"]},
+        verbose=AGENT_VERBOSE,
+        # Stop reasoning on the worker thread once the request budget is spent.
+        max_execution_time=AGENT_TIMEOUT_SECONDS,
+    )
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    temperature=0,
-    google_api_key=GOOGLE_API_KEY,
-)
 
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+# Agents are cheap to build but their prompt depends on the tool set; the same
+# few tool sets come up again and again, so keep the recent ones.
+_agents: LRUCache = LRUCache(maxsize=AGENT_CACHE_SIZE)
+_agents_lock = threading.Lock()
 
-agent = initialize_agent(
-    tools=all_tools,
-    llm=llm,
-    agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-    memory=memory,
-    verbose=True,
-)
 
+def agent_for(user_input: str):
+    """An agent whose prompt lists only the tools selected for this question (blocking)."""
+    tools = select_tools(user_input)
+    key = tuple(tool.name for tool in tools)
+    with _agents_lock:
+        agent = _agents.get(key)
+        if agent is None:
+            agent = _agents[key] = _build_agent(tools)
+    return agent
 
-def run_agent(user_input: str, messages: list) -> str:
-    """Run the agent and return its raw final answer (non-streaming)."""
-    inputs = {"input": user_input, "chat_history": messages}
-    return agent.invoke(inputs)["output"]
 
+def run_agent(user_input: str, history: str = "") -> str:
+    """Answer from the fast-path router or the answer cache when possible, else run the agent (non-streaming)."""
+    routed = route_question(user_input)
+    if routed is not None:
+        return routed.text
+    cached = answer_cache.lookup(user_input, history)
+    if cached is not None:
+        return cached.answer
+    if AGENT_MODE == "function_calling":
+        return run_function_agent(
+            user_input, history, select_tools(user_input), deadline=time.monotonic() + AGENT_TIMEOUT_SECONDS
+        )
+    inputs = {"input": user_input, "chat_history": history}
+    return agent_for(user_input).invoke(
+        inputs, config={"callbacks": [instrumentation.InstrumentationHandler()]}
+    )["output"]
 
-def run_agent_streaming(user_input: str, messages: list):
-    """Run the agent, then reformat its output into a polished, user-facing reply.
 
-    The agent first decides which tool to call and produces raw structured data.
-    We then send that raw data through a second Gemini pass with a strict
-    presentation prompt so the end user only ever sees clean, summarised prose.
+def _invoke(user_input: str, inputs: dict, handler: "_ProgressHandler", trace: instrumentation.Trace):
+    """Worker-thread body: select tools, then run the agent with progress callbacks, spans going to ``trace``."""
+    with instrumentation.use_trace(trace):
+        return _run_tools_phase(user_input, inputs, handler)
+
+
+def _run_tools_phase(user_input: str, inputs: dict, handler: "_ProgressHandler"):
+    if AGENT_MODE == "function_calling":
+        tools = select_tools(user_input)
+        handler.tools_selected([tool.name for tool in tools])
+        output = run_function_agent(
+            user_input, inputs["chat_history"], tools,
+            on_call=handler.tool_called, on_result=handler.tool_returned,
+            deadline=time.monotonic() + AGENT_TIMEOUT_SECONDS,
+        )
+        return {"output": output}
+    agent = agent_for(user_input)
+    handler.tools_selected([tool.name for tool in agent.tools])
+    return agent.invoke(inputs, config={"callbacks": [handler, instrumentation.InstrumentationHandler()]})
+
+
+def summarize_turns(previous_summary: str, turns: list) -> str:
+    """Fold old turns into the session's rolling summary (blocking Gemini call)."""
+    transcript = "\n".join(f"User: {t['user']}\nAssistant: {t['assistant']}" for t in turns)
+    prompt = (
+        f"Update the running summary of a conversation between a Balaji Health Care employee and "
+        f"the business assistant. Keep names, IDs, amounts and open questions; drop pleasantries. "
+        f"Reply with the summary only, under {CHAT_SUMMARY_TOKEN_BUDGET} tokens.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}"
+    )
+    summary = llm.invoke(prompt, config={"callbacks": [instrumentation.InstrumentationHandler("summary")]})
+    summary = summary.content if hasattr(summary, "content") else str(summary)
+    # Hard cap in case the model ignores the limit (~4 characters per token).
+    if count_tokens(summary) > CHAT_SUMMARY_TOKEN_BUDGET:
+        summary = summary[: CHAT_SUMMARY_TOKEN_BUDGET * 4]
+    return summary.strip()
+
+
+class AgentBusyError(Exception):
+    """Every agent slot is taken and the wait queue is full."""
+
+
+class AgentTimeoutError(Exception):
+    """The agent run did not finish within AGENT_TIMEOUT_SECONDS."""
+
+
+class AgentGate:
+    """
+    Admission control for agent runs: at most ``slots`` run at once and at
+    most ``max_waiting`` wait, first come first served. A released slot is
+    handed straight to the next waiter.
     """
-    inputs = {"input": user_input, "chat_history": messages}
-    result = agent.invoke(inputs)
-    tool_output = result["output"]
 
-    # Stringify so any return type (list, dict, str) can be summarised.
-    data_to_format = str(tool_output)
+    def __init__(self, slots: int, max_waiting: int):
+        self.slots = slots
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.waiting: Deque[asyncio.Future] = deque()
 
-    prompt = f"""
-## ROLE AND GOAL
-You are 'Balaji AI', an expert business analyst and assistant for Balaji Health Care, a medical equipment business. Your primary goal is to convert raw, structured data from internal software tools into clear, professional, and actionable insights for the user. You must be concise, accurate, and helpful.
+    def reserve(self) -> Optional[asyncio.Future]:
+        """Take a slot now (returns None) or a place in the queue (returns a ticket)."""
+        if self.active < self.slots and not self.waiting:
+            self.active += 1
+            return None
+        if len(self.waiting) >= self.max_waiting:
+            raise AgentBusyError("The assistant is busy, please try again shortly.")
+        ticket = asyncio.get_running_loop().create_future()
+        self.waiting.append(ticket)
+        return ticket
 
-## CONTEXT
-The user, an employee, has asked a question. A software tool has returned the following raw data to answer it. The user should never see the raw data, only your final, well-formatted response.
+    def is_full(self) -> bool:
+        return self.active >= self.slots and len(self.waiting) >= self.max_waiting
 
-## TASK
-Analyze the raw data below. Synthesize the key information and present it as a helpful, natural language answer that directly addresses the user's original query (which you haven't seen).
+    def position(self, ticket: asyncio.Future) -> int:
+        try:
+            return self.waiting.index(ticket) + 1
+        except ValueError:
+            return 0
 
+    def abandon(self, ticket: asyncio.Future):
+        """Give up a queued ticket (client went away); passes the slot on if it was already granted."""
+        if ticket in self.waiting:
+            self.waiting.remove(ticket)
+            ticket.cancel()
+        elif ticket.done() and not ticket.cancelled():
+            self.release()
 
+    def release(self):
+        while self.waiting:
+            ticket = self.waiting.popleft()
+            if not ticket.done():
+                ticket.set_result(True)
+                return
+        self.active -= 1
 
-## FORMATTING RULES
-- Use markdown for structure (e.g., lists with `*`, bolding with `**`).
-- **For lists, ALWAYS put a space after the asterisk (e.g., `* List item`).**
-- **Use double newlines (`\n\n`) to create separate paragraphs for better spacing.**
-- Use bold (`**`) selectively for emphasis on **final summary totals**, **main entity names**, and final **status words**.
-- Do **not** bold every single number, ID, or label.
+    def stats(self) -> dict:
+        return {"active": self.active, "waiting": len(self.waiting),
+                "slots": self.slots, "max_waiting": self.max_waiting}
 
 
-## IMPORTANT RULES TO FOLLOW
-- **If the data is empty or shows no results (e.g., `[]`, `{{}}`, `None`):** Respond with a friendly, clear message like, "I couldn't find any records matching your request."
-- **If the data is a simple confirmation message (e.g., 'Task completed successfully'):** Relay it professionally, for example: "The task has been completed successfully."
-- **If the data is clearly an error message:** Translate it into a user-friendly message. For example, if the data is `'Error: Client not found'`, respond with "I'm sorry, I couldn't find a client with that information. Please double-check the details and try again."
-- **NEVER** just repeat the raw data. Your job is to interpret and summarize it.
-- **NEVER** invent information. If a detail isn't in the provided data, you don't know it.
+agent_gate = AgentGate(AGENT_MAX_CONCURRENCY, AGENT_QUEUE_SIZE)
 
-## RAW DATA FROM TOOL:
----
-{data_to_format}
----
-"""
 
-    final_response = llm.invoke(prompt)
-    return final_response.content if hasattr(final_response, "content") else final_response
+class _ProgressHandler(BaseCallbackHandler):
+    """Forwards the agent's tool calls (made on a worker thread) to the event loop as progress events."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        self.loop = loop
+        self.queue = queue
+        self.tool_names = {}
+        # Every tool the run called, for the answer cache's dependencies.
+        self.tools_used = []
+
+    def _emit(self, event: dict):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+    def tools_selected(self, names):
+        self._emit({"type": "progress", "stage": "tools_selected", "tools": names})
+
+    # Function-calling mode reports calls directly; several may run at once.
+    def tool_called(self, name, args):
+        self.tools_used.append(name)
+        self._emit({"type": "progress", "stage": "tool_start", "tool": name, "input": args})
+
+    def tool_returned(self, name):
+        self._emit({"type": "progress", "stage": "tool_end", "tool": name})
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = (serialized or {}).get("name")
+        self.tool_names[run_id] = name
+        self.tools_used.append(name)
+        self._emit({"type": "progress", "stage": "tool_start", "tool": name, "input": input_str})
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._emit({"type": "progress", "stage": "tool_end", "tool": self.tool_names.pop(run_id, None)})
+
+
+def _store_answer(user_input: str, history: str, answer: str, tool_names: list, versions: dict):
+    try:
+        answer_cache.store(user_input, history, answer, tool_names, versions)
+    except Exception as e:
+        logger.warning(f"Could not cache the answer: {e}")
+
+
+async def _remaining(deadline: float) -> float:
+    left = deadline - asyncio.get_running_loop().time()
+    if left <= 0:
+        raise AgentTimeoutError("The assistant took too long to answer.")
+    return left
+
+
+def _log_run(summary: dict):
+    totals = {key: value for key, value in summary.items() if key != "spans"}
+    logger.info(f"📊 Agent run {json.dumps(totals, default=str)}")
+
+
+async def run_agent_streaming(user_input: str, history: str = "", debug: bool = False) -> AsyncIterator[dict]:
+    """Run the agent, then stream a polished, user-facing reply.
+
+    ``history`` is the session's rendered memory (``chat_memory.render_history``).
+
+    Yields events as they happen:
+        {"type": "queued", "position": n}   while waiting for a free agent slot
+        {"type": "progress", "stage": "thinking" | "tools_selected" | "tool_start" | "tool_end" | "formatting", ...}
+        {"type": "token", "text": "..."}
+        {"type": "debug", "total_ms": ..., "by_kind": {...}, "spans": [...]}   last, with ``debug=True``
+
+    Raises AgentBusyError when the wait queue is full and AgentTimeoutError
+    when the run exceeds its budget.
+
+    The agent itself is synchronous, so it runs on the dedicated agent thread
+    pool and never blocks the event loop; its tool calls are reported as
+    progress events. The raw data is then rendered by a template or, when it
+    is large or irregular, by a second Gemini pass with a strict presentation
+    prompt, streamed token by token. The whole run is bounded by
+    AGENT_TIMEOUT_SECONDS.
+    """
+    loop = asyncio.get_running_loop()
+    ticket = agent_gate.reserve()
+
+    holding = ticket is None
+    run = None
+    try:
+        # ---- Wait for a slot, reporting the queue position as it moves ----
+        last_position = None
+        while not holding:
+            position = agent_gate.position(ticket)
+            if position != last_position:
+                yield {"type": "queued", "position": position}
+                last_position = position
+            try:
+                await asyncio.wait_for(asyncio.shield(ticket), timeout=QUEUE_POLL_SECONDS)
+                holding = True
+            except asyncio.TimeoutError:
+                continue
+
+        deadline = loop.time() + AGENT_TIMEOUT_SECONDS
+        # Versions as of the start of the run; a write during it makes the answer stale.
+        versions = await asyncio.to_thread(answer_cache.current_versions)
+
+        # ---- Tool phase on the agent pool, traced ----
+        trace = instrumentation.Trace()
+        inputs = {"input": user_input, "chat_history": history}
+        queue: asyncio.Queue = asyncio.Queue()
+        handler = _ProgressHandler(loop, queue)
+        run = loop.run_in_executor(_agent_pool, partial(_invoke, user_input, inputs, handler, trace))
+
+        yield {"type": "progress", "stage": "thinking"}
+        while not run.done() or not queue.empty():
+            next_event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {next_event, run},
+                timeout=await _remaining(deadline),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if next_event in done:
+                yield next_event.result()
+            else:
+                next_event.cancel()
+        tool_output = run.result()["output"]
+
+        # ---- Presentation: a template when the output has an obvious rendering, else Gemini, streamed ----
+        yield {"type": "progress", "stage": "formatting"}
+        answer = []
+        started = time.perf_counter()
+        rendered = presentation.render(tool_output)
+        instrumentation.record(
+            "render", "template", (time.perf_counter() - started) * 1000, trace=trace, templated=rendered is not None
+        )
+        if rendered is not None:
+            answer.append(rendered)
+            yield {"type": "token", "text": rendered}
+        else:
+            started, first_token_ms = time.perf_counter(), None
+            stream = presentation.stream(tool_output).__aiter__()
+            while True:
+                try:
+                    text = await asyncio.wait_for(stream.__anext__(), timeout=await _remaining(deadline))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise AgentTimeoutError("The assistant took too long to answer.")
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - started) * 1000, 2)
+                answer.append(text)
+                yield {"type": "token", "text": text}
+            # Estimated: the data is held to the output budget, plus the fixed instructions.
+            data_tokens = min(instrumentation.payload_size(tool_output) // 4, TOOL_OUTPUT_TOKEN_BUDGET)
+            instrumentation.record(
+                "llm", "presentation", (time.perf_counter() - started) * 1000, trace=trace, first_token_ms=first_token_ms,
+                prompt_tokens=data_tokens + count_tokens(presentation.PRESENTATION_INSTRUCTIONS),
+                completion_tokens=count_tokens("".join(answer)), tokens_estimated=True,
+            )
+
+        summary = trace.summary()
+        _log_run(summary)
+        if debug:
+            yield {"type": "debug", "path": "agent", **summary}
+
+        # Cache off the request path; the client already has the full answer.
+        loop.run_in_executor(
+            None, partial(_store_answer, user_input, history, "".join(answer), handler.tools_used, versions)
+        )
+    finally:
+        if not holding:
+            agent_gate.abandon(ticket)
+        elif run is not None and not run.done():
+            # A timed-out or abandoned run keeps its worker thread until the
+            # agent stops; keep the slot until then so the limit stays true.
+            run.add_done_callback(lambda _: agent_gate.release())
+        else:
+            agent_gate.release()
@@ -0,0 +1,318 @@
+"""
+answer_cache.py — reuse agent answers while the underlying data is unchanged
+===========================================================================
+
+"Today's sales" and "low stock items" are asked again and again, and each
+one costs a full agent run plus a presentation pass. An answer is reused when:
+
+1. the question matches — exactly once normalised (case, punctuation,
+   spacing), or as a near duplicate: the embedding (shared model,
+   ``Settings.embed_model``) is at least ``ANSWER_CACHE_SIMILARITY`` cosine
+   *and* the question's specifics (numbers, IDs, months, relative dates,
+   proper nouns) are identical, so "sales in March" never answers "sales in
+   April";
+2. no collection the answer's tools read has been written since the run
+   started. Each collection has a version (the time of its last write) and an
+   answer records the versions it was built from;
+3. it is younger than ``ANSWER_CACHE_TTL_SECONDS``; answers about "today",
+   "this month", … also expire at midnight.
+
+Versions are bumped by the write endpoints (``invalidate_path``, called from
+a middleware in ``test.py``) and by the agent's own write tools. With
+``REDIS_URL`` set they live in Redis, so a write on one worker invalidates the
+answers of all of them. Answers stay in an in-process LRU. Writes made outside
+the API are covered by the TTL. Follow-ups that lean on the conversation ("and
+his dues?") and runs that used write tools are never cached.
+
+Public surface:
+    lookup(question, history="")                              -> CachedAnswer | None
+    store(question, history, answer, tool_names, versions)    -> bool
+    current_versions()                                        -> Dict[str, float]
+    invalidate(*collections)                                  -> None
+    invalidate_path(method, path)                             -> None
+    collections_for_tools(tool_names)                         -> Set[str]
+    stats()                                                   -> Dict
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, FrozenSet, Iterable, Optional, Set
+
+import numpy as np
+from llama_index.core import Settings
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() != "false"
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "900"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "500"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+REDIS_URL = os.getenv("REDIS_URL")
+
+# Any write bumps this too; answers whose tools could not be mapped depend on it.
+ALL = "*"
+
+# Tool-name keyword -> Firestore collections the tool reads.
+_TOOL_COLLECTIONS = (
+    (("Inventory", "Item", "Stock"), ("Inventory Items",)),
+    (("Client",), ("Clients", "Orders", "Payments")),
+    (("Supplier", "Supply"), ("Suppliers", "Orders", "Payments")),
+    (("Order", "Invoice", "Sales"), ("Orders",)),
+    (("Employee",), ("Employees", "Orders")),
+    (("Expense",), ("Expenses",)),
+    (("Payment", "Due"), ("Payments", "Clients", "Suppliers")),
+    (("Doc",), ("doc_counters",)),
+)
+_WRITE_TOOL_PREFIXES = ("Add", "Update", "Delete")
+
+# First path segment after /api/v1/ -> collections a successful write there changes.
+_WRITE_PATHS = {
+    "clients": ("Clients",),
+    "suppliers": ("Suppliers",),
+    "employees": ("Employees",),
+    "inventory": ("Inventory Items",),
+    "expenses": ("Expenses", "doc_counters"),
+    "orders": ("Orders", "Inventory Items", "Clients", "Suppliers", "Payments", "doc_counters"),
+    "doc-counters": ("doc_counters",),
+}
+_WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+_MONTHS = {
+    "january", "february", "march", "april", "may", "june", "july", "august",
+    "september", "october", "november", "december",
+    "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+}
+_RELATIVE = {"today", "yesterday", "tomorrow", "week", "month", "year", "last", "this", "next", "previous", "current", "ago", "now"}
+# Words that only make sense against the conversation so far.
+_FOLLOW_UP = re.compile(r"\b(he|she|it|they|him|her|his|hers|its|them|their|that|those|these|same|above|previous one)\b")
+_WORD = re.compile(r"[A-Za-z0-9][A-Za-z0-9\-/.]*")
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    question: str
+    similarity: float
+    age_seconds: float
+
+
+@dataclass
+class _Entry:
+    question: str
+    specifics: FrozenSet[str]
+    vector: np.ndarray
+    answer: str
+    versions: Dict[str, float]
+    created_at: float
+    expires_at: float
+
+
+# ---------------------------------------------------------------------------
+# Collection versions
+# ---------------------------------------------------------------------------
+class _LocalVersions:
+    def __init__(self):
+        self.versions: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def get_all(self) -> Dict[str, float]:
+        with self.lock:
+            return dict(self.versions)
+
+    def bump(self, collections: Iterable[str], at: float):
+        with self.lock:
+            for name in collections:
+                self.versions[name] = at
+
+
+class _RedisVersions:
+    KEY = "answer_cache:versions"
+
+    def __init__(self, url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    def get_all(self) -> Dict[str, float]:
+        return {k.decode(): float(v) for k, v in self.client.hgetall(self.KEY).items()}
+
+    def bump(self, collections: Iterable[str], at: float):
+        self.client.hset(self.KEY, mapping={name: at for name in collections})
+
+
+def _make_versions():
+    if REDIS_URL:
+        try:
+            versions = _RedisVersions(REDIS_URL)
+            versions.client.ping()
+            logger.info("Answer cache versions stored in Redis")
+            return versions
+        except Exception as e:
+            logger.warning(f"Redis unavailable for answer cache versions, using in-process: {e}")
+    return _LocalVersions()
+
+
+_versions = _make_versions()
+
+
+def current_versions() -> Dict[str, float]:
+    """Snapshot of every collection's version; take it before a run starts."""
+    return _versions.get_all()
+
+
+def invalidate(*collections: str):
+    """Mark ``collections`` as written now; answers that read them stop matching."""
+    _versions.bump(set(collections) | {ALL}, time.time())
+
+
+def invalidate_path(method: str, path: str):
+    """Bump the collections written by a successful ``method path`` request."""
+    if method.upper() not in _WRITE_METHODS or not path.startswith("/api/v1/"):
+        return
+    collections = _WRITE_PATHS.get(path[len("/api/v1/"):].split("/", 1)[0])
+    if collections:
+        invalidate(*collections)
+
+
+def collections_for_tools(tool_names: Iterable[str]) -> Set[str]:
+    """Collections the named tools read; ``ALL`` for a tool with no known mapping."""
+    collections: Set[str] = set()
+    for name in tool_names:
+        matched = [cols for keywords, cols in _TOOL_COLLECTIONS if any(k in name for k in keywords)]
+        if not matched:
+            collections.add(ALL)
+        for cols in matched:
+            collections.update(cols)
+    return collections
+
+
+# ---------------------------------------------------------------------------
+# Questions
+# ---------------------------------------------------------------------------
+def _normalize(question: str) -> str:
+    text = re.sub(r"[^\w\s\-/.]", " ", question.lower())
+    text = re.sub(r"\.(\s|$)", " ", text)
+    return " ".join(text.split())
+
+
+def _specifics(question: str) -> FrozenSet[str]:
+    """Tokens that change the answer even when the wording barely changes."""
+    specifics = set()
+    for position, word in enumerate(_WORD.findall(question)):
+        lowered = word.lower().rstrip(".")
+        if any(c.isdigit() for c in word) or lowered in _MONTHS or lowered in _RELATIVE:
+            specifics.add(lowered)
+        elif position > 0 and word[0].isupper():
+            specifics.add(lowered)  # proper noun: a client, supplier or item name
+    return frozenset(specifics)
+
+
+def _is_follow_up(question: str, history: str) -> bool:
+    return bool(history) and bool(_FOLLOW_UP.search(question.lower()))
+
+
+def _embed(question: str) -> np.ndarray:
+    vector = np.array(Settings.embed_model.get_query_embedding(question), dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def _expiry(now: float, specifics: FrozenSet[str]) -> float:
+    expires_at = now + ANSWER_CACHE_TTL_SECONDS
+    if specifics & _RELATIVE:
+        midnight = datetime.combine(datetime.fromtimestamp(now).date() + timedelta(days=1), datetime.min.time())
+        expires_at = min(expires_at, midnight.timestamp())
+    return expires_at
+
+
+# ---------------------------------------------------------------------------
+# Entries
+# ---------------------------------------------------------------------------
+_entries: "OrderedDict[str, _Entry]" = OrderedDict()
+_lock = threading.Lock()
+_counters = {"hits": 0, "near_hits": 0, "misses": 0, "stores": 0, "stale": 0}
+
+
+def _valid(entry: _Entry, versions: Dict[str, float], now: float) -> bool:
+    if now >= entry.expires_at:
+        return False
+    return all(versions.get(name, 0.0) == version for name, version in entry.versions.items())
+
+
+def lookup(question: str, history: str = "") -> Optional[CachedAnswer]:
+    """A still-valid answer to ``question`` or a near duplicate of it (blocking: may embed)."""
+    if not ANSWER_CACHE_ENABLED or _is_follow_up(question, history):
+        return None
+    key, now = _normalize(question), time.time()
+    versions = current_versions()
+
+    with _lock:
+        entry = _entries.get(key)
+    exact, similarity = entry is not None, 1.0
+    if entry is None:
+        with _lock:
+            candidates = [e for e in _entries.values() if e.specifics == _specifics(question)]
+        if candidates:
+            scores = np.stack([e.vector for e in candidates]) @ _embed(question)
+            best = int(np.argmax(scores))
+            if scores[best] >= ANSWER_CACHE_SIMILARITY:
+                entry, similarity = candidates[best], float(scores[best])
+
+    with _lock:
+        if entry is None:
+            _counters["misses"] += 1
+            return None
+        if not _valid(entry, versions, now):
+            _entries.pop(entry.question, None)
+            _counters["stale"] += 1
+            _counters["misses"] += 1
+            return None
+        _entries.move_to_end(entry.question)
+        _counters["hits" if exact else "near_hits"] += 1
+    return CachedAnswer(entry.answer, entry.question, round(similarity, 3), round(now - entry.created_at, 1))
+
+
+def store(question: str, history: str, answer: str, tool_names: Iterable[str], versions: Dict[str, float]) -> bool:
+    """
+    Cache ``answer`` under the versions snapshotted before the run. Runs that
+    used a write tool invalidate what they wrote and are not cached. Returns
+    whether the answer was stored.
+    """
+    tool_names = list(tool_names)
+    writes = [name for name in tool_names if name.startswith(_WRITE_TOOL_PREFIXES)]
+    if writes:
+        invalidate(*collections_for_tools(writes))
+        return False
+    if not ANSWER_CACHE_ENABLED or not answer.strip() or not tool_names or _is_follow_up(question, history):
+        return False
+
+    now = time.time()
+    specifics = _specifics(question)
+    read = collections_for_tools(tool_names)
+    entry = _Entry(
+        question=_normalize(question),
+        specifics=specifics,
+        vector=_embed(question),
+        answer=answer,
+        versions={name: versions.get(name, 0.0) for name in read},
+        created_at=now,
+        expires_at=_expiry(now, specifics),
+    )
+    with _lock:
+        _entries[entry.question] = entry
+        _entries.move_to_end(entry.question)
+        while len(_entries) > ANSWER_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+        _counters["stores"] += 1
+    return True
+
+
+def stats() -> Dict:
+    with _lock:
+        return {"enabled": ANSWER_CACHE_ENABLED, "entries": len(_entries), **_counters}
@@ -0,0 +1,232 @@
+"""
+chat_memory.py — per-session conversation memory for the AI assistant
+======================================================================
+
+Each chat session (``session_id``, issued by ``POST /api/v1/chat``) keeps:
+
+1. ``turns``   — the most recent user/assistant exchanges, verbatim.
+2. ``summary`` — a rolling summary of everything older.
+
+When the verbatim turns exceed ``CHAT_HISTORY_TOKEN_BUDGET`` the oldest ones
+are folded into the summary by a caller-supplied summariser (a short Gemini
+call), so the history sent to the agent stays bounded no matter how long the
+conversation runs or how many users are chatting.
+
+Sessions live in an in-process LRU (``CHAT_MAX_SESSIONS``, idle expiry after
+``CHAT_SESSION_TTL_SECONDS``). Set ``REDIS_URL`` to keep them in Redis instead
+so they survive restarts and are shared between workers.
+
+Public surface:
+    new_session_id()                                -> str
+    render_history(session_id)                      -> str   (prompt-ready text)
+    seed_session(session_id, messages)              -> None  (legacy frontend history)
+    append_turn(session_id, user, assistant, summarize) -> None
+    count_tokens(text)                              -> int
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+CHAT_SUMMARY_TOKEN_BUDGET = int(os.getenv("CHAT_SUMMARY_TOKEN_BUDGET", "300"))
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "500"))
+CHAT_SESSION_TTL_SECONDS = int(os.getenv("CHAT_SESSION_TTL_SECONDS", str(6 * 3600)))
+REDIS_URL = os.getenv("REDIS_URL")
+
+# ---------------------------------------------------------------------------
+# Token counting. Gemini's tokenizer is not available offline; cl100k is a
+# close enough proxy for budgeting, and len/4 is the fallback.
+# ---------------------------------------------------------------------------
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken missing or its data cannot be fetched
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+TRUNCATION_MARKER = " …[truncated]"
+
+
+def _truncate(text: str, limit: int) -> str:
+    """``text`` cut to about ``limit`` tokens, marked when anything was cut."""
+    if count_tokens(text) <= limit:
+        return text
+    limit = max(0, limit - count_tokens(TRUNCATION_MARKER))
+    if _encoding is not None:
+        cut = _encoding.decode(_encoding.encode(text, disallowed_special=())[:limit])
+    else:
+        cut = text[: limit * 4]
+    return cut + TRUNCATION_MARKER
+
+
+def _fit_turn(turn: Dict) -> Dict:
+    """A turn cut down to the history budget; the user half gets at most half of it."""
+    user_limit = min(count_tokens(turn["user"]), CHAT_HISTORY_TOKEN_BUDGET // 2)
+    # A couple of tokens of slack: re-encoding a cut text can merge differently.
+    assistant_limit = max(0, CHAT_HISTORY_TOKEN_BUDGET - user_limit - 2)
+    return {"user": _truncate(turn["user"], user_limit), "assistant": _truncate(turn["assistant"], assistant_limit)}
+
+
+def _turn_tokens(turn: Dict) -> int:
+    if "tokens" not in turn:
+        turn["tokens"] = count_tokens(turn["user"]) + count_tokens(turn["assistant"])
+    return turn["tokens"]
+
+
+def _empty_session() -> Dict:
+    return {"summary": "", "turns": [], "updated_at": time.time()}
+
+
+# ---------------------------------------------------------------------------
+# Stores
+# ---------------------------------------------------------------------------
+class _LRUStore:
+    def __init__(self, max_sessions: int, ttl: int):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+            if time.time() - session["updated_at"] > self.ttl:
+                del self.sessions[session_id]
+                return None
+            self.sessions.move_to_end(session_id)
+            return json.loads(json.dumps(session))
+
+    def put(self, session_id: str, session: Dict):
+        with self.lock:
+            self.sessions[session_id] = session
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+
+class _RedisStore:
+    def __init__(self, url: str, ttl: int):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        raw = self.client.get(f"chat:session:{session_id}")
+        return json.loads(raw) if raw else None
+
+    def put(self, session_id: str, session: Dict):
+        self.client.set(f"chat:session:{session_id}", json.dumps(session), ex=self.ttl)
+
+
+def _make_store():
+    if REDIS_URL:
+        try:
+            store = _RedisStore(REDIS_URL, CHAT_SESSION_TTL_SECONDS)
+            store.client.ping()
+            logger.info("Chat sessions stored in Redis")
+            return store
+        except Exception as e:
+            logger.warning(f"Redis unavailable for chat sessions, using in-process LRU: {e}")
+    return _LRUStore(CHAT_MAX_SESSIONS, CHAT_SESSION_TTL_SECONDS)
+
+
+store = _make_store()
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def render_history(session_id: str) -> str:
+    """Summary plus recent turns, as plain text for the agent prompt."""
+    session = store.get(session_id)
+    if not session:
+        return ""
+    lines = []
+    if session["summary"]:
+        lines.append(f"Summary of the earlier conversation: {session['summary']}")
+    for turn in session["turns"]:
+        lines.append(f"User: {turn['user']}")
+        lines.append(f"Assistant: {turn['assistant']}")
+    return "\n".join(lines)
+
+
+def seed_session(session_id: str, messages: List[Dict]):
+    """
+    Start a session from history the frontend sent (``[{"type": "user" |
+    "assistant", "content": ...}]``), keeping only what fits the budget.
+    """
+    turns: List[Dict] = []
+    pending_user = None
+    for message in messages:
+        if message.get("type") == "user":
+            pending_user = message.get("content", "")
+        elif message.get("type") == "assistant" and pending_user is not None:
+            turns.append({"user": pending_user, "assistant": message.get("content", "")})
+            pending_user = None
+
+    kept, used = [], 0
+    for turn in reversed(turns):
+        used += _turn_tokens(turn)
+        if used > CHAT_HISTORY_TOKEN_BUDGET:
+            break
+        kept.append(turn)
+    session = _empty_session()
+    session["turns"] = list(reversed(kept))
+    store.put(session_id, session)
+
+
+def append_turn(
+    session_id: str,
+    user: str,
+    assistant: str,
+    summarize: Optional[Callable[[str, List[Dict]], str]] = None,
+):
+    """
+    Record one exchange. Turns that no longer fit the token budget are folded
+    into the rolling summary with ``summarize(previous_summary, turns)``;
+    without a summariser they are simply dropped. A new turn that alone is
+    over the budget is truncated. Blocking — call it off the event loop.
+    """
+    session = store.get(session_id) or _empty_session()
+    session["turns"].append({"user": user, "assistant": assistant})
+
+    overflow: List[Dict] = []
+    while len(session["turns"]) > 1 and sum(_turn_tokens(t) for t in session["turns"]) > CHAT_HISTORY_TOKEN_BUDGET:
+        overflow.append(session["turns"].pop(0))
+    # The newest turn is always kept, but one oversized answer (a pasted list,
+    # say) is cut down so the stored history stays within the budget.
+    if _turn_tokens(session["turns"][-1]) > CHAT_HISTORY_TOKEN_BUDGET:
+        session["turns"][-1] = _fit_turn(session["turns"][-1])
+
+    if overflow and summarize is not None:
+        try:
+            session["summary"] = summarize(session["summary"], overflow)
+        except Exception as e:
+            logger.warning(f"Could not summarise chat session {session_id}: {e}")
+
+    session["updated_at"] = time.time()
+    store.put(session_id, session)
@@ -3,6 +3,8 @@ from google.cloud import firestore
 from datetime import datetime
 from typing import List, Dict
 from google.cloud.firestore_v1 import FieldFilter
+from firebase_config.payments_ledger import list_payments
+from firebase_config.entity_stats import get_entity_stats
 # ------------------------ Clients ------------------------
 
 def get_next_id(prefix: str, counter_name: str) -> str:
@@ -64,16 +66,22 @@ def search_clients_by_partial_name(partial_name: str) -> list:
         if partial_name.lower() in doc.to_dict().get("name", "").lower()
     ]
 
-def get_client_order_history(client_id: str) -> list:
+def get_client_order_history(client_id: str, limit: int = 50) -> list:
     orders = (
         db.collection("Orders")
         .where(filter=FieldFilter("client_id", "==", client_id))
-        .where(filter=FieldFilter("type", "==", "sell"))
+        .where(filter=FieldFilter("order_type", "in", ["sale", "delivery_challan"]))
+        .order_by("created_at", direction=firestore.Query.DESCENDING)
+        .limit(limit)
         .stream()
     )
     return [doc.to_dict() | {"id": doc.id} for doc in orders]
 
 
+def get_client_order_stats(client_id: str) -> dict:
+    return get_entity_stats("client", client_id)
+
+
 def update_client_due(client_id: str, change_amount: float):
     doc_ref = db.collection("Clients").document(client_id)
     doc_ref.update({
@@ -82,8 +90,7 @@ def update_client_due(client_id: str, change_amount: float):
     })
 
 def get_client_payments(client_id: str) -> list:
-    docs = db.collection("Payments").where(filter=FieldFilter("client_id", "==", client_id)).stream()
-    return [doc.to_dict() | {"id": doc.id} for doc in docs]
+    return list_payments(limit=100, party_type="client", party_id=client_id)["entries"]
 
 # ------------------------ Utilities ------------------------
 
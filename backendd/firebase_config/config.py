@@ -1,11 +1,31 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
 
-# Initialize Firebase with service account credentials
-# Check if Firebase app is already initialized to avoid duplicate initialization
-if not firebase_admin._apps:
-    cred = credentials.Certificate("/etc/secrets/firebase_key.json")
-    firebase_admin.initialize_app(cred)
-
-# Initialize Firestore client
-db = firestore.client()
\ No newline at end of file
+FIREBASE_KEY_PATH = "/etc/secrets/firebase_key.json"
+
+
+class _LazyFirestore:
+    """
+    The Firestore client, created on first use rather than at import, so the
+    agent, tools and vector stack can be imported (benchmarks, offline runs)
+    on a machine without the service account key.
+    """
+
+    def __init__(self):
+        self._client = None
+
+    def _get(self):
+        if self._client is None:
+            # Check if Firebase app is already initialized to avoid duplicate initialization
+            if not firebase_admin._apps:
+                cred = credentials.Certificate(FIREBASE_KEY_PATH)
+                firebase_admin.initialize_app(cred)
+            self._client = firestore.client()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+
+# Initialize Firestore client (on first use)
+db = _LazyFirestore()
@@ -0,0 +1,219 @@
+"""
+Per-client / per-supplier order statistics
+==========================================
+
+``entity_stats/{party_type}_{party_id}`` holds the numbers the client and
+supplier pages used to compute by streaming every matching order:
+
+- order_count.{sale|delivery_challan|purchase} and total_orders (non-draft)
+- draft_count.{...}  (drafts still show up in history lists)
+- lifetime_value     sum of total_amount
+- total_paid         sum of amount_paid
+- outstanding_due    lifetime_value - total_paid
+- last_order_date
+- average_order_size (derived on read)
+
+The order write path keeps the document current with ``firestore.Increment``
+(``record_order_stats``), the same way ``doc_counters`` is maintained. When a
+document is missing (parties created before this existed) it is rebuilt once
+from aggregation queries and cached.
+
+Public surface
+--------------
+- record_order_created(...) -> None
+- record_order_deleted(...) -> None
+- record_order_stats(...)   -> None
+- refresh_last_order_date() -> None
+- get_entity_stats(...)     -> dict
+- rebuild_entity_stats(...) -> dict
+"""
+
+from datetime import datetime
+from typing import Dict, Optional
+
+from google.cloud import firestore
+from google.cloud.firestore_v1 import FieldFilter
+
+from firebase_config.config import db
+
+STATS_COLLECTION = "entity_stats"
+
+PARTY_ORDER_TYPES = {
+    "client": ("sale", "delivery_challan"),
+    "supplier": ("purchase",),
+}
+
+
+def party_for_order(order_data: Dict) -> Optional[tuple]:
+    """(party_type, party_id) an order belongs to, or None for walk-in orders."""
+    party_type = "supplier" if order_data.get("order_type") == "purchase" else "client"
+    party_id = order_data.get(f"{party_type}_id")
+    return (party_type, party_id) if party_id else None
+
+
+def _stats_ref(party_type: str, party_id: str):
+    return db.collection(STATS_COLLECTION).document(f"{party_type}_{party_id}")
+
+
+def record_order_stats(
+    order_data: Dict,
+    orders: int = 0,
+    value: float = 0,
+    paid: float = 0,
+    drafts: int = 0,
+    order_date: Optional[datetime] = None,
+):
+    """
+    Apply deltas for one order to its party's stats document.
+
+    ``orders``/``drafts`` are +1 on create and -1 on delete; ``value`` and
+    ``paid`` are total_amount / amount_paid deltas. ``order_date`` moves
+    ``last_order_date`` forward. Call it after the order itself is written.
+    """
+    party = party_for_order(order_data)
+    if not party:
+        return
+    party_type, party_id = party
+    order_type = order_data.get("order_type")
+
+    update = {
+        "party_type": party_type,
+        "party_id": party_id,
+        "updated_at": datetime.utcnow(),
+    }
+    name = order_data.get(f"{party_type}_name")
+    if name:
+        update["party_name"] = name
+    if orders:
+        update["order_count"] = {order_type: firestore.Increment(orders)}
+        update["total_orders"] = firestore.Increment(orders)
+    if drafts:
+        update["draft_count"] = {order_type: firestore.Increment(drafts)}
+    if value:
+        update["lifetime_value"] = firestore.Increment(value)
+    if paid:
+        update["total_paid"] = firestore.Increment(paid)
+    if value or paid:
+        update["outstanding_due"] = firestore.Increment(value - paid)
+
+    ref = _stats_ref(party_type, party_id)
+    snapshot = ref.get()
+    if not snapshot.exists:
+        # First write for a party that predates the stats documents: build it
+        # from Orders (which already reflect this change) instead of
+        # starting a partial document from zero.
+        rebuild_entity_stats(party_type, party_id)
+        return
+
+    if order_date is not None:
+        # Only move last_order_date forward.
+        last = (snapshot.to_dict() or {}).get("last_order_date")
+        if last is None or order_date.replace(tzinfo=None) >= last.replace(tzinfo=None):
+            update["last_order_date"] = order_date
+
+    ref.set(update, merge=True)
+
+
+def record_order_created(order_data: Dict):
+    if order_data.get("draft"):
+        record_order_stats(order_data, drafts=1)
+        return
+    record_order_stats(
+        order_data,
+        orders=1,
+        value=order_data.get("total_amount", 0),
+        paid=order_data.get("amount_paid", 0),
+        order_date=order_data.get("created_at"),
+    )
+
+
+def record_order_deleted(order_data: Dict):
+    """Call after the order document has been deleted."""
+    if order_data.get("draft"):
+        record_order_stats(order_data, drafts=-1)
+        return
+    record_order_stats(
+        order_data,
+        orders=-1,
+        value=-order_data.get("total_amount", 0),
+        paid=-order_data.get("amount_paid", 0),
+    )
+    party = party_for_order(order_data)
+    if party:
+        refresh_last_order_date(*party)
+
+
+def refresh_last_order_date(party_type: str, party_id: str):
+    """Recompute last_order_date after the latest order was deleted."""
+    docs = (
+        db.collection("Orders")
+        .where(filter=FieldFilter(f"{party_type}_id", "==", party_id))
+        .where(filter=FieldFilter("draft", "==", False))
+        .order_by("created_at", direction=firestore.Query.DESCENDING)
+        .select(["created_at"])
+        .limit(1)
+        .stream()
+    )
+    last = next((doc.to_dict().get("created_at") for doc in docs), None)
+    _stats_ref(party_type, party_id).set({"last_order_date": last}, merge=True)
+
+
+def _with_average(stats: Dict) -> Dict:
+    total = stats.get("total_orders", 0) or 0
+    stats["average_order_size"] = round(stats.get("lifetime_value", 0) / total, 2) if total else 0.0
+    return stats
+
+
+def rebuild_entity_stats(party_type: str, party_id: str) -> Dict:
+    """Recompute a party's stats from Orders with aggregation queries and store them."""
+    orders = db.collection("Orders").where(filter=FieldFilter(f"{party_type}_id", "==", party_id))
+    stats = {
+        "party_type": party_type,
+        "party_id": party_id,
+        "order_count": {},
+        "draft_count": {},
+        "total_orders": 0,
+        "lifetime_value": 0.0,
+        "total_paid": 0.0,
+    }
+    for order_type in PARTY_ORDER_TYPES[party_type]:
+        typed = orders.where(filter=FieldFilter("order_type", "==", order_type))
+        live = typed.where(filter=FieldFilter("draft", "==", False))
+        result = (
+            live.count(alias="count")
+            .sum("total_amount", alias="value")
+            .sum("amount_paid", alias="paid")
+            .get()
+        )
+        values = {item.alias: item.value for item in result[0]} if result else {}
+        drafts = typed.where(filter=FieldFilter("draft", "==", True)).count(alias="count").get()
+
+        stats["order_count"][order_type] = int(values.get("count") or 0)
+        stats["draft_count"][order_type] = int(drafts[0][0].value) if drafts else 0
+        stats["total_orders"] += stats["order_count"][order_type]
+        stats["lifetime_value"] += float(values.get("value") or 0)
+        stats["total_paid"] += float(values.get("paid") or 0)
+
+    stats["outstanding_due"] = stats["lifetime_value"] - stats["total_paid"]
+    latest = list(
+        orders.where(filter=FieldFilter("draft", "==", False))
+        .order_by("created_at", direction=firestore.Query.DESCENDING)
+        .select(["created_at"])
+        .limit(1)
+        .stream()
+    )
+    stats["last_order_date"] = latest[0].to_dict().get("created_at") if latest else None
+    stats["updated_at"] = datetime.utcnow()
+
+    _stats_ref(party_type, party_id).set(stats)
+    return _with_average(stats)
+
+
+def get_entity_stats(party_type: str, party_id: str) -> Dict:
+    """Single-document read of a party's order stats (rebuilt once if missing)."""
+    if party_type not in PARTY_ORDER_TYPES:
+        raise ValueError("party_type must be 'client' or 'supplier'")
+    snapshot = _stats_ref(party_type, party_id).get()
+    if not snapshot.exists:
+        return rebuild_entity_stats(party_type, party_id)
+    return _with_average(snapshot.to_dict())
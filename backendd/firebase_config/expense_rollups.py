@@ -0,0 +1,212 @@
+"""
+Expense rollups
+===============
+
+Pre-aggregated expense totals so dashboards and the agent never scan
+``Expenses``.
+
+One document per bucket in ``expense_rollups``, each holding ``count`` and
+``amount``:
+
+- ``month_{YYYY-MM}``                      dimension "month"
+- ``category_{key}``                       dimension "category"
+- ``payer_{key}``                          dimension "payer"
+- ``month_{YYYY-MM}_category_{key}``       dimension "month_category"
+- ``month_{YYYY-MM}_payer_{key}``          dimension "month_payer"
+
+The expense write paths call ``apply_expense`` (create: +1, delete: -1) or
+``move_expense`` (update) and all affected buckets change in one batch of
+``firestore.Increment`` writes. Bucket keys are case-insensitive, so
+"Travel" and "travel" roll up together. The month is taken from
+``created_at``.
+
+Each expense also stores ``search_terms`` for ``GET /expenses?search=``: the
+lower-cased prefixes (up to ``SEARCH_TERM_LENGTH`` characters) of every word
+of ``category``, ``paid_by`` and ``remarks``, and of the text running on from
+each word. A search is a single ``array_contains`` on ``search_key(text)``, so it
+matches case-insensitively anywhere a word starts in those fields. Expenses
+written before this change get the field from ``backfill_search_terms()``.
+
+Public surface
+--------------
+- apply_expense(expense, sign)  -> None
+- move_expense(old, new)        -> None
+- get_rollups(dimension, month) -> list[dict]
+- get_rollup(dimension, key, month) -> dict | None
+- rebuild_expense_rollups()     -> int
+- search_terms(expense)         -> list[str]
+- search_key(text)              -> str
+- backfill_search_terms()       -> int
+"""
+
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from google.cloud import firestore
+from google.cloud.firestore_v1 import FieldFilter
+
+from firebase_config.config import db
+
+ROLLUPS_COLLECTION = "expense_rollups"
+DIMENSIONS = ("month", "category", "payer", "month_category", "month_payer")
+
+SEARCH_FIELDS = ("category", "paid_by", "remarks")
+SEARCH_TERM_LENGTH = 30
+# Only the start of a long remark is searchable, which bounds the term count.
+_SEARCH_FIELD_CHARS = 100
+
+
+def rollup_key(value: Optional[str]) -> str:
+    # Document ids cannot contain "/"; whitespace is folded for stable ids.
+    key = re.sub(r"[/\s]+", "_", (value or "").strip().lower())
+    return key or "unspecified"
+
+
+def _month_of(expense: Dict) -> Optional[str]:
+    created_at = expense.get("created_at")
+    return created_at.strftime("%Y-%m") if isinstance(created_at, datetime) else None
+
+
+def _buckets(expense: Dict) -> List[tuple]:
+    """(doc_id, fields) for every bucket an expense counts towards."""
+    category = expense.get("category") or ""
+    payer = expense.get("paid_by") or ""
+    month = _month_of(expense)
+    buckets = [
+        (f"category_{rollup_key(category)}", {"dimension": "category", "key": category}),
+        (f"payer_{rollup_key(payer)}", {"dimension": "payer", "key": payer}),
+    ]
+    if month:
+        buckets += [
+            (f"month_{month}", {"dimension": "month", "key": month, "month": month}),
+            (f"month_{month}_category_{rollup_key(category)}",
+             {"dimension": "month_category", "key": category, "month": month}),
+            (f"month_{month}_payer_{rollup_key(payer)}",
+             {"dimension": "month_payer", "key": payer, "month": month}),
+        ]
+    return buckets
+
+
+def _add_to_batch(batch, expense: Dict, sign: int):
+    amount = float(expense.get("amount", 0) or 0) * sign
+    for doc_id, fields in _buckets(expense):
+        batch.set(db.collection(ROLLUPS_COLLECTION).document(doc_id), {
+            **fields,
+            "count": firestore.Increment(sign),
+            "amount": firestore.Increment(amount),
+            "updated_at": datetime.utcnow(),
+        }, merge=True)
+
+
+def apply_expense(expense: Dict, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) one expense from every rollup it belongs to."""
+    batch = db.batch()
+    _add_to_batch(batch, expense, sign)
+    batch.commit()
+
+
+def move_expense(old: Dict, new: Dict):
+    """Re-bucket an edited expense (amount, category or payer changed) atomically."""
+    batch = db.batch()
+    _add_to_batch(batch, old, -1)
+    _add_to_batch(batch, new, 1)
+    batch.commit()
+
+
+def get_rollups(dimension: str, month: Optional[str] = None) -> List[Dict]:
+    """All buckets of a dimension (optionally within one month), largest first."""
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"dimension must be one of {', '.join(DIMENSIONS)}")
+    query = db.collection(ROLLUPS_COLLECTION).where(filter=FieldFilter("dimension", "==", dimension))
+    if month:
+        query = query.where(filter=FieldFilter("month", "==", month))
+    rows = [doc.to_dict() | {"id": doc.id} for doc in query.stream()]
+    rows = [row for row in rows if row.get("count", 0) > 0]
+    return sorted(rows, key=lambda row: row.get("amount", 0), reverse=True)
+
+
+def get_rollup(dimension: str, key: str, month: Optional[str] = None) -> Optional[Dict]:
+    """Single bucket by its natural key, e.g. ("category", "travel", "2025-06")."""
+    if dimension == "month":
+        doc_id = f"month_{key}"
+    elif month:
+        doc_id = f"month_{month}_{dimension}_{rollup_key(key)}"
+    else:
+        doc_id = f"{dimension}_{rollup_key(key)}"
+    snapshot = db.collection(ROLLUPS_COLLECTION).document(doc_id).get()
+    return snapshot.to_dict() if snapshot.exists else None
+
+
+def rebuild_expense_rollups() -> int:
+    """Recompute every bucket from ``Expenses`` (one-off migration / repair)."""
+    totals: Dict[str, Dict] = {}
+    scanned = 0
+    for doc in db.collection("Expenses").select(["amount", "category", "paid_by", "created_at"]).stream():
+        expense = doc.to_dict()
+        scanned += 1
+        for doc_id, fields in _buckets(expense):
+            bucket = totals.setdefault(doc_id, {**fields, "count": 0, "amount": 0.0})
+            bucket["count"] += 1
+            bucket["amount"] += float(expense.get("amount", 0) or 0)
+
+    writes = [
+        (doc.reference, None)
+        for doc in db.collection(ROLLUPS_COLLECTION).select([]).stream()
+        if doc.id not in totals
+    ]
+    writes += [
+        (db.collection(ROLLUPS_COLLECTION).document(doc_id), bucket | {"updated_at": datetime.utcnow()})
+        for doc_id, bucket in totals.items()
+    ]
+    # Firestore batches are capped at 500 writes.
+    for start in range(0, len(writes), 450):
+        batch = db.batch()
+        for ref, data in writes[start:start + 450]:
+            if data is None:
+                batch.delete(ref)
+            else:
+                batch.set(ref, data)
+        batch.commit()
+    return scanned
+
+
+def search_key(text: Optional[str]) -> str:
+    """Lower-cased, whitespace-folded text, cut to the longest stored term."""
+    return " ".join(str(text or "").lower().split())[:SEARCH_TERM_LENGTH]
+
+
+def _words(text: Optional[str]) -> List[str]:
+    return str(text or "")[:_SEARCH_FIELD_CHARS].lower().split()
+
+
+def search_terms(expense: Dict) -> List[str]:
+    """Every term a search may match for this expense (see the module docstring)."""
+    terms = set()
+    for field in SEARCH_FIELDS:
+        words = _words(expense.get(field))
+        for start in range(len(words)):
+            tail = " ".join(words[start:])[:SEARCH_TERM_LENGTH]
+            terms.update(tail[:end] for end in range(1, len(tail) + 1))
+    terms.discard("")
+    return sorted(terms)
+
+
+def backfill_search_terms() -> int:
+    """Write ``search_terms`` on every expense (one-off migration); returns the count."""
+    updated = 0
+    batch = db.batch()
+    for doc in db.collection("Expenses").select(list(SEARCH_FIELDS)).stream():
+        batch.update(doc.reference, {"search_terms": search_terms(doc.to_dict())})
+        updated += 1
+        if updated % 450 == 0:
+            batch.commit()
+            batch = db.batch()
+    if updated % 450:
+        batch.commit()
+    return updated
+
+
+if __name__ == "__main__":
+    print(f"Rebuilt expense rollups from {rebuild_expense_rollups()} expenses.")
+    print(f"Wrote search terms on {backfill_search_terms()} expenses.")
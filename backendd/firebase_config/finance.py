@@ -1,29 +1,57 @@
 from firebase_config.config import db
 from google.cloud import firestore
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 from google.cloud.firestore_v1 import FieldFilter
+from firebase_config.payments_ledger import record_payment, list_payments, payment_totals, ledger_query
+from firebase_config.expense_rollups import apply_expense, move_expense, get_rollups, search_terms, SEARCH_FIELDS
+
+# Fields the expense tools return; search_terms is an index, not data.
+EXPENSE_FIELDS = ("amount", "category", "paid_by", "remarks", "created_at", "updated_at")
+
 # ------------------------ Payments ------------------------
 
 def add_payment(payment_data: dict) -> str:
-    payment_data["date"] = payment_data.get("date", firestore.SERVER_TIMESTAMP)
-    doc_ref = db.collection("Payments").add(payment_data)
-    return doc_ref[1].id
-
-def get_payments(client_id=None, start_date=None, end_date=None) -> list:
-    query = db.collection("Payments")
-    if client_id:
-        query = query.where(filter=FieldFilter("client_id", "==", client_id))
-    if start_date:
-        query = query.where(filter=FieldFilter("date", ">=", start_date))
-    if end_date:
-        query = query.where(filter=FieldFilter("date", "<=", end_date))
-    docs = query.stream()
-    return [doc.to_dict() | {"id": doc.id} for doc in docs]
+    # Manual client payments go through the same ledger as order payments.
+    return record_payment(
+        party_type="client",
+        party_id=payment_data.get("client_id"),
+        party_name=payment_data.get("client_name"),
+        amount=float(payment_data.get("amount", 0)),
+        direction="received",
+        order_id=payment_data.get("order_id"),
+        payment_method=payment_data.get("payment_method"),
+        recorded_by=payment_data.get("added_by", "system"),
+        kind="manual",
+        remarks=payment_data.get("remarks", ""),
+    )
+
+def payments_query(client_id=None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
+    """The client-payment ledger query behind get_payments, without order or limit."""
+    return ledger_query(
+        party_type="client" if client_id else None,
+        party_id=client_id,
+        date_from=start_date,
+        date_to=end_date,
+    )
+
+def get_payments(client_id=None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, limit: int = 100) -> list:
+    page = list_payments(
+        limit=limit,
+        party_type="client" if client_id else None,
+        party_id=client_id,
+        date_from=start_date,
+        date_to=end_date,
+    )
+    return page["entries"]
 
 def get_total_payments(client_id=None, start_date=None, end_date=None) -> float:
-    payments = get_payments(client_id, start_date, end_date)
-    return sum(p.get("amount", 0) for p in payments)
+    return payment_totals(
+        party_type="client" if client_id else None,
+        party_id=client_id,
+        date_from=start_date,
+        date_to=end_date,
+    )["amount"]
 
 def get_all_dues() -> list:
     docs = db.collection("clients").where(filter=FieldFilter("total_due", ">", 0)).stream()
@@ -32,55 +60,94 @@ def get_all_dues() -> list:
 # ------------------------ Expenses ------------------------
 
 def add_expense(expense_data: Dict) -> str:
+    now = datetime.utcnow()
     expense_doc = {
         "amount": float(expense_data.get("amount", 0)),
         "category": expense_data.get("category", ""),
         "paid_by": expense_data.get("paid_by", ""),
         "remarks": expense_data.get("remarks", ""),
-        "created_at": firestore.SERVER_TIMESTAMP,
-        "updated_at": firestore.SERVER_TIMESTAMP
+        # Concrete timestamps (not SERVER_TIMESTAMP) so the rollup month is known now.
+        "created_at": now,
+        "updated_at": now
     }
+    expense_doc["search_terms"] = search_terms(expense_doc)
     doc_ref = db.collection("Expenses").add(expense_doc)
+    apply_expense(expense_doc)
     return doc_ref[1].id
 
-def get_expenses(category=None, start_date=None, end_date=None) -> list:
-    query = db.collection("Expenses")
+def expenses_query(category=None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, paid_by=None):
+    """The Expenses query behind get_expenses, without order or limit (search_terms left out)."""
+    query = db.collection("Expenses").select(list(EXPENSE_FIELDS))
     if category:
         query = query.where(filter=FieldFilter("category", "==", category))
+    if paid_by:
+        query = query.where(filter=FieldFilter("paid_by", "==", paid_by))
     if start_date:
-        query = query.where(filter=FieldFilter("date", ">=", start_date))
+        query = query.where(filter=FieldFilter("created_at", ">=", start_date))
     if end_date:
-        query = query.where(filter=FieldFilter("date", "<=", end_date))
-    docs = query.stream()
+        query = query.where(filter=FieldFilter("created_at", "<=", end_date))
+    return query
+
+def get_expenses(category=None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, paid_by=None, limit: int = 100) -> list:
+    query = expenses_query(category, start_date, end_date, paid_by)
+    docs = query.order_by("created_at", direction=firestore.Query.DESCENDING).limit(limit).stream()
     return [doc.to_dict() | {"id": doc.id} for doc in docs]
 
 def update_expense(expense_id: str, updated_data: dict):
-    updated_data["updated_at"] = firestore.SERVER_TIMESTAMP
-    db.collection("Expenses").document(expense_id).update(updated_data)
+    doc_ref = db.collection("Expenses").document(expense_id)
+    old_data = doc_ref.get().to_dict() or {}
+    updated_data["updated_at"] = datetime.utcnow()
+    if any(field in updated_data for field in SEARCH_FIELDS):
+        updated_data["search_terms"] = search_terms({**old_data, **updated_data})
+    doc_ref.update(updated_data)
+    if any(field in updated_data for field in ("amount", "category", "paid_by")):
+        move_expense(old_data, {**old_data, **updated_data})
 
 def delete_expense(expense_id: str):
-    db.collection("Expenses").document(expense_id).delete()
+    doc_ref = db.collection("Expenses").document(expense_id)
+    snapshot = doc_ref.get()
+    doc_ref.delete()
+    if snapshot.exists:
+        apply_expense(snapshot.to_dict(), sign=-1)
 
 def get_total_expenses(category=None, start_date=None, end_date=None) -> float:
-    expenses = get_expenses(category, start_date, end_date)
-    return sum(e.get("amount", 0) for e in expenses)
-
-# ------------------------ Supplier Payments ------------------------
-from typing import List
-def get_supplier_payments(supplier_id=None, start_date=None, end_date=None) -> List[dict]:
-    query = db.collection("supplier_payments")
-    
-    if supplier_id:
-        query = query.where(filter=FieldFilter("supplier_id", "==", supplier_id))
+    query = db.collection("Expenses")
+    if category:
+        query = query.where(filter=FieldFilter("category", "==", category))
     if start_date:
-        query = query.where(filter=FieldFilter("date", ">=", start_date))
+        query = query.where(filter=FieldFilter("created_at", ">=", start_date))
     if end_date:
-        query = query.where(filter=FieldFilter("date", "<=", end_date))
-    
-    docs = query.stream()
-    return [doc.to_dict() | {"id": doc.id} for doc in docs]
-
+        query = query.where(filter=FieldFilter("created_at", "<=", end_date))
+    result = query.sum("amount", alias="amount").get()
+    return float(result[0][0].value or 0) if result else 0.0
+
+def get_expense_breakdown(group_by: str = "category", month: str = None) -> list:
+    """Expense totals per month, category or payer from the rollups (no Expenses scan)."""
+    dimension = f"month_{group_by}" if month and group_by in ("category", "payer") else group_by
+    return [
+        {"key": row.get("key"), "count": row.get("count", 0), "amount": row.get("amount", 0)}
+        for row in get_rollups(dimension, month)
+    ]
 
+# ------------------------ Supplier Payments ------------------------
+def supplier_payments_query(supplier_id=None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
+    """The supplier-payment ledger query behind get_supplier_payments, without order or limit."""
+    return ledger_query(
+        party_type="supplier",
+        party_id=supplier_id,
+        date_from=start_date,
+        date_to=end_date,
+    )
+
+def get_supplier_payments(supplier_id=None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, limit: int = 100) -> List[dict]:
+    page = list_payments(
+        limit=limit,
+        party_type="supplier",
+        party_id=supplier_id,
+        date_from=start_date,
+        date_to=end_date,
+    )
+    return page["entries"]
 
 
 def add_supplier_payment(payment_data: dict) -> str:
@@ -88,26 +155,44 @@ def add_supplier_payment(payment_data: dict) -> str:
     amount = payment_data.get("amount", 0)
     if not supplier_id or amount <= 0:
         raise ValueError("supplier_id and positive amount are required")
-    
-    payment_data["date"] = payment_data.get("date", firestore.SERVER_TIMESTAMP)
-    
-    # Add to `supplier_payments` collection
-    payment_ref = db.collection("supplier_payments").add(payment_data)
-    
-    # Update supplier's due_amount
-    supplier_ref = db.collection("suppliers").document(supplier_id)
-    
-    def update_due(transaction):
-        snapshot = transaction.get(supplier_ref)
-        current_due = snapshot.get("due_amount") or 0
-        new_due = max(0, current_due - amount)
+
+    # The ledger entry, the clamped due and the suppliers' total_due are
+    # written in one transaction, so a failure leaves none of them behind.
+    # Paying a supplier reduces what we owe them, never below zero; an
+    # overpayment stays visible in the ledger instead of as a negative due.
+    supplier_ref = db.collection("Suppliers").document(supplier_id)
+
+    @firestore.transactional
+    def _pay(transaction) -> str:
+        snapshot = supplier_ref.get(transaction=transaction)
+        if not snapshot.exists:
+            raise ValueError(f"Supplier {supplier_id} not found")
+        supplier = snapshot.to_dict() or {}
+        current_due = float(supplier.get("due") or 0)
+        new_due = max(0.0, current_due - float(amount))
+
+        entry_id = record_payment(
+            party_type="supplier",
+            party_id=supplier_id,
+            party_name=payment_data.get("supplier_name") or supplier.get("name"),
+            amount=float(amount),
+            direction="paid",
+            order_id=payment_data.get("order_id"),
+            payment_method=payment_data.get("payment_method"),
+            recorded_by=payment_data.get("added_by", "system"),
+            kind="manual",
+            remarks=payment_data.get("remarks", ""),
+            transaction=transaction,
+        )
         transaction.update(supplier_ref, {
-            "due_amount": new_due,
+            "due": new_due,
             "updated_at": firestore.SERVER_TIMESTAMP,
-            "updated_by": payment_data.get("added_by")
+            "updated_by": payment_data.get("added_by"),
         })
-    
-    db.run_transaction(update_due)
-    
-    return payment_ref[1].id
+        if current_due != new_due:
+            transaction.update(db.collection("doc_counters").document("suppliers"), {
+                "total_due": firestore.Increment(new_due - current_due),
+            })
+        return entry_id
 
+    return _pay(db.transaction())
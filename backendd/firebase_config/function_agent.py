@@ -0,0 +1,292 @@
+"""
+function_agent.py — Gemini function-calling agent with parallel tool calls
+=========================================================================
+
+The ReAct agent (``agent.py``) makes the model write ``Action:`` lines, parses
+them, and runs one tool per LLM round trip. "Compare the dues of these three
+clients" therefore costs at least four model calls. This agent uses Gemini's
+structured function calling instead:
+
+- every selected LangChain ``Tool`` is declared to Gemini as a typed function
+  (``function_declaration``). The schema is derived from the tool function
+  itself: the signature and annotations of named functions, the keys a
+  ``lambda data: ...`` reads from ``data``, or a ``parameters_schema`` the
+  function carries (the semantic tools);
+- each model step may request several function calls. Read calls run at once
+  on a thread pool; write calls (``Add…`` / ``Update…`` / ``Delete…``) run one
+  after another in the order the model gave them, since an order and the stock
+  update it implies must not race. All results go back to the model together;
+- the loop ends when the model answers in text, after
+  ``FUNCTION_AGENT_MAX_STEPS`` steps, or when the run's deadline passes.
+
+Every tool result is held to ``TOOL_OUTPUT_TOKEN_BUDGET`` (``tool_outputs.py``)
+before it goes back to the model. Each model step and tool call is recorded
+as a span of the current trace (``instrumentation.py``).
+
+The google-genai SDK is used directly: the pinned langchain-google-genai
+predates tool binding for Gemini. The client comes from ``offline.py``, so
+``LLM_BACKEND=fake`` runs the loop against a scripted model.
+
+Public surface:
+    run_function_agent(user_input, history, tools, on_call=None, on_result=None, deadline=None) -> str
+    function_declaration(tool)                                                                 -> Dict
+    FUNCTION_AGENT_MAX_STEPS, FUNCTION_AGENT_TOOL_WORKERS
+"""
+
+import ast
+import contextvars
+import inspect
+import json
+import logging
+import os
+import textwrap
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.genai import types
+from langchain.tools import Tool
+
+from firebase_config import instrumentation
+from firebase_config.offline import genai_client
+from firebase_config.tool_outputs import bound_output
+
+logger = logging.getLogger(__name__)
+
+FUNCTION_AGENT_MODEL = os.getenv("FUNCTION_AGENT_MODEL", "gemini-2.0-flash")
+FUNCTION_AGENT_MAX_STEPS = int(os.getenv("FUNCTION_AGENT_MAX_STEPS", "6"))
+FUNCTION_AGENT_TOOL_WORKERS = int(os.getenv("FUNCTION_AGENT_TOOL_WORKERS", "8"))
+
+# Tools whose names start with these change data; they never run concurrently.
+WRITE_TOOL_PREFIXES = ("Add", "Update", "Delete")
+
+STOPPED_MESSAGE = "Agent stopped due to iteration limit or time limit."
+
+SYSTEM_INSTRUCTION = """You are the data assistant of Balaji Health Care, a medical equipment business.
+Answer the employee's question using the provided functions; never invent records, IDs or amounts.
+When a question needs several independent lookups (e.g. the same figure for several clients),
+request all of those function calls in the same step. Answer in plain text once you have the data.
+
+Conversation so far (may be empty):
+{chat_history}"""
+
+_client = genai_client()
+_tool_pool = ThreadPoolExecutor(max_workers=FUNCTION_AGENT_TOOL_WORKERS, thread_name_prefix="agent-tool")
+
+_PYTHON_TYPES = {str: "STRING", int: "INTEGER", float: "NUMBER", bool: "BOOLEAN", datetime: "STRING", date: "STRING"}
+# Types of the keys that tool lambdas read out of their ``data`` dict.
+_KEY_TYPES = {"amount": "NUMBER", "limit": "INTEGER"}
+_JSON_HINT = "JSON object"
+
+
+# ---------------------------------------------------------------------------
+# Schemas
+# ---------------------------------------------------------------------------
+def _string(description: str) -> Dict:
+    return {"type": "STRING", "description": description}
+
+
+def _lambda_keys(func: Callable) -> Optional[List[str]]:
+    """Keys a one-argument lambda reads as ``param['key']``; None when it uses the argument whole."""
+    try:
+        source = textwrap.dedent(inspect.getsource(func)).strip()
+        tree = ast.parse(source.rstrip(","))
+    except (OSError, TypeError, SyntaxError):
+        return None
+    lambdas = [node for node in ast.walk(tree) if isinstance(node, ast.Lambda)]
+    if len(lambdas) != 1 or len(lambdas[0].args.args) != 1:
+        return None
+    param = lambdas[0].args.args[0].arg
+    keys, whole = [], False
+    subscripted = set()
+    for node in ast.walk(lambdas[0].body):
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == param:
+            subscripted.add(id(node.value))
+            if isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str):
+                keys.append(node.slice.value)
+    for node in ast.walk(lambdas[0].body):
+        if isinstance(node, ast.Name) and node.id == param and id(node) not in subscripted:
+            whole = True
+    return None if whole or not keys else list(dict.fromkeys(keys))
+
+
+def _key_schema(key: str) -> Dict:
+    if key.endswith("_fields"):
+        return _string(f"{_JSON_HINT} of the fields to change")
+    if key.endswith("_date"):
+        return _string("ISO date, YYYY-MM-DD")
+    return {"type": _KEY_TYPES.get(key, "STRING")}
+
+
+@lru_cache(maxsize=None)
+def _tool_spec(func: Callable) -> Tuple[str, Dict]:
+    """
+    ``(call_style, parameters)`` for a tool function. Call styles:
+    ``kwargs`` (named function, called with keyword arguments), ``dict`` (called
+    with one dict of the arguments), ``none`` (ignores its input) and ``input``
+    (one free-form string, parsed as JSON when it looks like an object).
+    """
+    schema = getattr(func, "parameters_schema", None)
+    if schema is not None:
+        return "dict", schema
+
+    if func.__name__ == "<lambda>":
+        params = list(inspect.signature(func).parameters)
+        if params == ["_"]:
+            return "none", {}
+        keys = _lambda_keys(func)
+        if keys:
+            return "dict", {"type": "OBJECT", "properties": {k: _key_schema(k) for k in keys}, "required": keys}
+        return "input", {
+            "type": "OBJECT",
+            "properties": {"input": _string(f"The tool input: an ID or name, or a {_JSON_HINT} for structured input")},
+            "required": ["input"],
+        }
+
+    properties, required = {}, []
+    for name, param in inspect.signature(func).parameters.items():
+        if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            continue
+        kind = _PYTHON_TYPES.get(param.annotation, "STRING")
+        properties[name] = _string("ISO date, YYYY-MM-DD") if param.annotation in (datetime, date) else {"type": kind}
+        if param.default is param.empty:
+            required.append(name)
+    if not properties:
+        return "none", {}
+    return "kwargs", {"type": "OBJECT", "properties": properties, "required": required}
+
+
+def function_declaration(tool: Tool) -> Dict:
+    """The Gemini function declaration for a LangChain tool."""
+    _, parameters = _tool_spec(tool.func)
+    declaration = {"name": tool.name, "description": tool.description}
+    if parameters:
+        declaration["parameters"] = parameters
+    return declaration
+
+
+# ---------------------------------------------------------------------------
+# Tool execution
+# ---------------------------------------------------------------------------
+def _coerce(func: Callable, args: Dict) -> Dict:
+    """Turn date strings into datetimes and JSON strings into objects where the function expects them."""
+    hints = {}
+    if func.__name__ != "<lambda>" and getattr(func, "parameters_schema", None) is None:
+        hints = {name: p.annotation for name, p in inspect.signature(func).parameters.items()}
+    coerced = {}
+    for key, value in args.items():
+        if hints.get(key) in (datetime, date) and isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        elif key.endswith("_date") and isinstance(value, str) and not hints:
+            value = datetime.fromisoformat(value)
+        elif key.endswith("_fields") and isinstance(value, str):
+            value = json.loads(value)
+        coerced[key] = value
+    return coerced
+
+
+def _call_tool(tool: Tool, args: Dict) -> Any:
+    style, _ = _tool_spec(tool.func)
+    args = _coerce(tool.func, dict(args or {}))
+    if style == "kwargs":
+        return tool.func(**args)
+    if style == "dict":
+        return tool.func(args)
+    if style == "none":
+        return tool.func("")
+    raw = str(args.get("input", "")).strip()
+    if raw.startswith("{"):
+        try:
+            return tool.func(json.loads(raw))
+        except json.JSONDecodeError:
+            pass
+    return tool.func(raw)
+
+
+def _run_call(tool: Optional[Tool], name: str, args: Dict) -> Dict:
+    """One function call -> the ``response`` payload sent back to Gemini."""
+    if tool is None:
+        return {"error": f"Unknown function {name}"}
+    try:
+        # List tools bound themselves already; this covers every other tool.
+        return {"result": bound_output(_call_tool(tool, args))}
+    except Exception as e:
+        logger.warning(f"Tool {name} failed: {e}")
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def _usage(response) -> Dict:
+    usage = response.usage_metadata
+    if usage is None or usage.prompt_token_count is None:
+        return {}
+    return {"prompt_tokens": usage.prompt_token_count, "completion_tokens": usage.candidates_token_count or 0}
+
+
+# ---------------------------------------------------------------------------
+# The loop
+# ---------------------------------------------------------------------------
+def run_function_agent(
+    user_input: str,
+    history: str,
+    tools: List[Tool],
+    on_call: Optional[Callable[[str, Dict], None]] = None,
+    on_result: Optional[Callable[[str], None]] = None,
+    deadline: Optional[float] = None,
+) -> str:
+    """
+    Answer ``user_input`` with ``tools`` (blocking). ``on_call(name, args)`` and
+    ``on_result(name)`` report each tool call; ``deadline`` is a
+    ``time.monotonic()`` value after which no further step starts.
+    """
+    by_name = {tool.name: tool for tool in tools}
+    config = types.GenerateContentConfig(
+        system_instruction=SYSTEM_INSTRUCTION.format(chat_history=history or "(none)"),
+        tools=[types.Tool(function_declarations=[function_declaration(tool) for tool in tools])],
+        automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=True),
+        temperature=0,
+    )
+    contents = [types.Content(role="user", parts=[types.Part(text=user_input)])]
+
+    for step in range(1, FUNCTION_AGENT_MAX_STEPS + 1):
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        with instrumentation.span("llm", "agent_step", step=step) as attrs:
+            response = _client.models.generate_content(model=FUNCTION_AGENT_MODEL, contents=contents, config=config)
+            attrs.update(_usage(response))
+        calls = response.function_calls or []
+        if not calls:
+            return response.text or ""
+
+        logger.info(f"🛠️ Step {step}: {', '.join(call.name for call in calls)}")
+        for call in calls:
+            if on_call:
+                on_call(call.name, dict(call.args or {}))
+
+        def run(call):
+            args = dict(call.args or {})
+            with instrumentation.span("tool", call.name, step=step, args_bytes=instrumentation.payload_size(args)) as attrs:
+                payload = _run_call(by_name.get(call.name), call.name, args)
+                attrs["result_bytes"] = instrumentation.payload_size(payload)
+                if "error" in payload:
+                    attrs["error"] = payload["error"]
+            if on_result:
+                on_result(call.name)
+            return payload
+
+        # Reads run in parallel, each with its own copy of the context so its spans
+        # land in this run's trace; writes run here, one by one, in the model's order.
+        futures = {
+            i: _tool_pool.submit(contextvars.copy_context().run, run, call)
+            for i, call in enumerate(calls) if not call.name.startswith(WRITE_TOOL_PREFIXES)
+        }
+        writes = {i: run(call) for i, call in enumerate(calls) if i not in futures}
+        payloads = [futures[i].result() if i in futures else writes[i] for i in range(len(calls))]
+        contents.append(response.candidates[0].content)
+        contents.append(types.Content(role="user", parts=[
+            types.Part(function_response=types.FunctionResponse(id=call.id, name=call.name, response=payload))
+            for call, payload in zip(calls, payloads)
+        ]))
+
+    return STOPPED_MESSAGE
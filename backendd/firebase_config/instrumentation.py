@@ -0,0 +1,266 @@
+"""
+instrumentation.py — where the assistant's time goes
+===================================================
+
+Every step of an agent run is recorded as a span:
+
+- ``llm``       — one model call: latency, prompt / completion tokens (the
+  provider's usage when it reports it, else estimated with ``count_tokens``
+  and flagged ``tokens_estimated``);
+- ``tool``      — one tool call: latency, size of the arguments and of the
+  result (bytes of JSON), error;
+- ``retrieval`` — one semantic search: latency, embedding and Qdrant time,
+  ``top_k``, hits and their scores;
+- ``embedding`` — one embedding call that missed the cache: texts, latency;
+- ``render``    — the presentation template.
+
+Spans nest (a tool's span includes the retrieval it ran), so per-kind times
+do not add up to the run's total.
+
+A run collects its spans in a ``Trace``, which lives in a context variable
+(``use_trace``). Tool threads and the search code therefore add to the right
+run without being passed it. Submit work to a pool with
+``contextvars.copy_context().run`` to carry the trace along. Each span also
+feeds process-wide aggregates per ``(kind, name)``: count, errors, latency
+mean / p50 / p95 / max over the last ``METRICS_WINDOW`` samples, and token
+and byte totals. ``metrics()`` serves ``GET /api/v1/chat/metrics`` and
+``Trace.summary()`` is the ``debug`` event of ``POST /api/v1/chat``.
+
+``InstrumentationHandler`` records the LangChain callbacks (ReAct agent,
+summaries). The function-calling agent, the presentation pass and the search
+code record their spans directly with ``span()`` / ``record()``.
+
+Public surface:
+    Trace()                                   (one run's spans; .summary())
+    use_trace(trace)                          -> context manager
+    current_trace()                           -> Trace | None
+    span(kind, name, **attrs)                 -> context manager yielding attrs (add to it)
+    record(kind, name, latency_ms, trace=None, **attrs) -> None
+    InstrumentationHandler(llm_name)          (LangChain callbacks)
+    metrics(reset=False)                      -> Dict
+    payload_size(value)                       -> int
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from firebase_config.chat_memory import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Latency samples kept per (kind, name) for the percentiles, and spans kept per run.
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "500"))
+TRACE_MAX_SPANS = 200
+
+# Span attributes that are totalled in the aggregates.
+_SUMMED = ("prompt_tokens", "completion_tokens", "args_bytes", "result_bytes", "hits", "texts")
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("assistant_trace", default=None)
+
+
+def payload_size(value: Any) -> int:
+    """Size in bytes of ``value`` as it travels (JSON, or the string itself)."""
+    if value is None:
+        return 0
+    if not isinstance(value, str):
+        value = json.dumps(value, default=str, ensure_ascii=False)
+    return len(value.encode("utf-8"))
+
+
+# ---------------------------------------------------------------------------
+# Per-run trace
+# ---------------------------------------------------------------------------
+class Trace:
+    """The spans of one agent run, in the order they finished; safe across threads."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def add(self, span: Dict):
+        with self.lock:
+            if len(self.spans) < TRACE_MAX_SPANS:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+    def summary(self) -> Dict:
+        """Totals by kind, token counts and the span list (offsets from the run start)."""
+        with self.lock:
+            spans = list(self.spans)
+        by_kind: Dict[str, Dict] = {}
+        for span in spans:
+            totals = by_kind.setdefault(span["kind"], {"count": 0, "ms": 0.0})
+            totals["count"] += 1
+            totals["ms"] += span["latency_ms"]
+        for totals in by_kind.values():
+            totals["ms"] = round(totals["ms"], 1)
+        llm = [span for span in spans if span["kind"] == "llm"]
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "by_kind": by_kind,
+            "prompt_tokens": sum(span.get("prompt_tokens", 0) for span in llm),
+            "completion_tokens": sum(span.get("completion_tokens", 0) for span in llm),
+            "spans": spans,
+            "dropped_spans": self.dropped,
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def use_trace(trace: Optional[Trace]) -> Iterator[Optional[Trace]]:
+    """Make ``trace`` the current one for this thread / context."""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+# ---------------------------------------------------------------------------
+# Process-wide aggregates
+# ---------------------------------------------------------------------------
+class _Series:
+    __slots__ = ("count", "errors", "latencies", "totals")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.latencies: Deque[float] = deque(maxlen=METRICS_WINDOW)
+        self.totals: Dict[str, float] = {}
+
+    def snapshot(self) -> Dict:
+        ordered = sorted(self.latencies)
+        latency = {}
+        if ordered:
+            latency = {
+                "mean": round(sum(ordered) / len(ordered), 2),
+                "p50": round(ordered[len(ordered) // 2], 2),
+                "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+                "max": round(ordered[-1], 2),
+            }
+        return {"count": self.count, "errors": self.errors, "latency_ms": latency, **self.totals}
+
+
+_series: Dict[str, Dict[str, _Series]] = {}
+_series_lock = threading.Lock()
+_since = time.time()
+
+
+def record(kind: str, name: str, latency_ms: float, trace: Optional[Trace] = None, **attrs):
+    """Record one finished span in ``trace`` (default: the current one) and in the aggregates."""
+    trace = trace or _current.get()
+    span = {"kind": kind, "name": name, "latency_ms": round(latency_ms, 2), **attrs}
+    if trace is not None:
+        span["end_ms"] = round((time.perf_counter() - trace.started) * 1000, 1)
+        trace.add(span)
+    with _series_lock:
+        series = _series.setdefault(kind, {}).get(name)
+        if series is None:
+            series = _series[kind][name] = _Series()
+        series.count += 1
+        series.latencies.append(latency_ms)
+        if attrs.get("error"):
+            series.errors += 1
+        for key in _SUMMED:
+            if isinstance(attrs.get(key), (int, float)):
+                series.totals[key] = series.totals.get(key, 0) + attrs[key]
+    logger.debug(f"span {json.dumps(span, default=str)}")
+
+
+@contextmanager
+def span(kind: str, name: str, **attrs) -> Iterator[Dict]:
+    """Time the block as a span; the yielded dict takes attributes learned inside it."""
+    started = time.perf_counter()
+    try:
+        yield attrs
+    except Exception as e:
+        attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record(kind, name, (time.perf_counter() - started) * 1000, **attrs)
+
+
+def metrics(reset: bool = False) -> Dict:
+    """Aggregates per kind and name since start (or the last reset)."""
+    global _since
+    with _series_lock:
+        snapshot = {kind: {name: s.snapshot() for name, s in names.items()} for kind, names in _series.items()}
+        since = _since
+        if reset:
+            _series.clear()
+            _since = time.time()
+    return {"since": since, "window": METRICS_WINDOW, "spans": snapshot}
+
+
+# ---------------------------------------------------------------------------
+# LangChain callbacks
+# ---------------------------------------------------------------------------
+def _usage(response) -> Dict:
+    """Provider token usage from an ``LLMResult``, when the integration reports it."""
+    usage = (response.llm_output or {}).get("token_usage") or (response.llm_output or {}).get("usage_metadata")
+    if not usage:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    break
+    if not usage:
+        return {}
+    usage = dict(usage)
+    prompt = usage.get("prompt_tokens", usage.get("input_tokens", usage.get("prompt_token_count")))
+    completion = usage.get("completion_tokens", usage.get("output_tokens", usage.get("candidates_token_count")))
+    if prompt is None or completion is None:
+        return {}
+    return {"prompt_tokens": int(prompt), "completion_tokens": int(completion)}
+
+
+class InstrumentationHandler(BaseCallbackHandler):
+    """Records an ``llm`` span per model call and a ``tool`` span per tool call of a LangChain run."""
+
+    def __init__(self, llm_name: str = "agent_step"):
+        self.llm_name = llm_name
+        self.trace = _current.get()
+        self.open: Dict[Any, tuple] = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.open[run_id] = (time.perf_counter(), sum(count_tokens(prompt) for prompt in prompts))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started, prompt_tokens = self.open.pop(run_id, (time.perf_counter(), 0))
+        attrs = _usage(response)
+        if not attrs:
+            text = "".join(g.text for generations in response.generations for g in generations)
+            attrs = {"prompt_tokens": prompt_tokens, "completion_tokens": count_tokens(text), "tokens_estimated": True}
+        record("llm", self.llm_name, (time.perf_counter() - started) * 1000, trace=self.trace, **attrs)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        started, _ = self.open.pop(run_id, (time.perf_counter(), 0))
+        record("llm", self.llm_name, (time.perf_counter() - started) * 1000, trace=self.trace, error=str(error))
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self.open[run_id] = (time.perf_counter(), (serialized or {}).get("name"), payload_size(input_str))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        started, name, args_bytes = self.open.pop(run_id, (time.perf_counter(), None, 0))
+        record("tool", name or "unknown", (time.perf_counter() - started) * 1000, trace=self.trace,
+               args_bytes=args_bytes, result_bytes=payload_size(output))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        started, name, args_bytes = self.open.pop(run_id, (time.perf_counter(), None, 0))
+        record("tool", name or "unknown", (time.perf_counter() - started) * 1000, trace=self.trace,
+               args_bytes=args_bytes, error=str(error))
@@ -0,0 +1,314 @@
+"""
+intent_router.py — deterministic fast path for common assistant questions
+========================================================================
+
+Questions like "due for client C0012", "stock of Paracetamol" or "sales this
+month" are single lookups. Each used to cost a ReAct loop plus a Gemini
+presentation pass. ``route_question`` recognises these shapes with regular
+expressions, calls the service function directly, and renders the answer from
+a template. That means no LLM calls and a few milliseconds of Firestore reads.
+
+Anything it does not recognise confidently returns ``None`` and goes to the
+agent as before. This includes compound questions (comparisons, several ids,
+"why"/"trend") and lookups that find nothing.
+
+Intents:
+    party_due      due / outstanding / balance of a client (C…) or supplier (S…)
+    entity_by_id   "client C0012", "supplier S0004", "employee E0002", "item I0007", "order INV-1"
+    item_stock     stock / quantity of an item by exact name
+    monthly_totals company-wide sales / purchases / challans / expenses for a month
+                   (a party, item or other qualifier goes to the agent)
+    financials     overall income, expense and net profit (qualified questions go
+                   to the agent)
+
+``INTENT_ROUTER_ENABLED=false`` sends every question to the agent.
+
+Public surface:
+    route_question(question) -> RoutedAnswer | None
+    RoutedAnswer(intent, text)
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from firebase_config.clients import get_client_by_id
+from firebase_config.doc_counters import get_counter_by_section, get_monthly_summary
+from firebase_config.employess import get_employee_by_id
+from firebase_config.inventory import get_inventory_item_by_id, get_inventory_item_by_name
+from firebase_config.orders import get_order_by_id
+from firebase_config.suppliers import get_supplier_by_id
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() != "false"
+
+# Longer questions are rarely simple lookups.
+MAX_ROUTED_WORDS = 16
+
+_COMPOUND = re.compile(r"\b(compare|comparison|vs|versus|why|trend|each|every|all|between|and)\b", re.I)
+_PARTY_ID = re.compile(r"\b([CSEI])(\d{3,})\b", re.I)
+_ORDER_ID = re.compile(r"\b(?:order|invoice|challan)\s*(?:no\.?|number|#|id)?\s*[:#]?\s*([A-Z0-9][A-Z0-9\-/]{2,})\b", re.I)
+_DUE = re.compile(r"\b(due|dues|owe|owes|owed|outstanding|balance|pending amount)\b", re.I)
+_STOCK = re.compile(
+    r"^(?:what(?:'s| is)\s+the\s+|how\s+(?:much|many)\s+)?(?:stock|quantity|qty|units?)\s+(?:of|for|left of|do we have of)\s+(?P<name>.+?)\s*\??$"
+    r"|^how\s+(?:much|many)\s+(?P<name2>.+?)\s+(?:is|are|do we have)\s+(?:left\s+)?(?:in\s+stock|left)\s*\??$",
+    re.I,
+)
+_MONTHLY = re.compile(r"\b(?P<what>sales|sold|purchases?|bought|challans?|expenses?|spent|spend)\b", re.I)
+_FINANCIALS = re.compile(r"\b(net profit|profit|total income|total expense|p&l|financial summary)\b", re.I)
+
+_MONTHS = {name: i for i, name in enumerate(
+    ["january", "february", "march", "april", "may", "june",
+     "july", "august", "september", "october", "november", "december"], start=1)}
+_MONTH_WORD = re.compile(r"\b(" + "|".join(list(_MONTHS) + [m[:3] for m in _MONTHS]) + r")\b(?:\s+(\d{4}))?", re.I)
+_MONTH_KEY = re.compile(r"\b(\d{4})-(\d{2})\b")
+# Words a company-wide monthly total may be asked with, besides the measure and
+# the month. Anything else ("to client C0012", "of Paracetamol", "on travel")
+# narrows the question, and the monthly summary cannot answer it.
+_MONTHLY_FILLER = {
+    "what", "s", "is", "are", "was", "were", "the", "our", "my", "total", "totals", "overall",
+    "how", "much", "many", "did", "do", "we", "i", "have", "had", "make", "made", "show", "me",
+    "tell", "give", "get", "please", "a", "an", "amount", "value", "worth", "number", "count",
+    "sum", "in", "for", "of", "during", "this", "last", "previous", "month", "so", "far", "till",
+    "until", "now", "date", "to", "order", "orders",
+}
+_WORD = re.compile(r"[a-z0-9&]+")
+
+
+@dataclass
+class RoutedAnswer:
+    intent: str
+    text: str
+
+
+# ---------------------------------------------------------------------------
+# Formatting helpers
+# ---------------------------------------------------------------------------
+def _money(value) -> str:
+    amount = float(value or 0)
+    return f"₹{amount:,.0f}" if amount.is_integer() else f"₹{amount:,.2f}"
+
+
+def _date(value) -> str:
+    if isinstance(value, datetime):
+        return value.strftime("%d %b %Y")
+    return str(value) if value else "—"
+
+
+def _month_label(key: str) -> str:
+    return datetime.strptime(key, "%Y-%m").strftime("%B %Y")
+
+
+def _month_of(question: str, now: datetime) -> Optional[str]:
+    text = question.lower()
+    if "this month" in text:
+        return now.strftime("%Y-%m")
+    if "last month" in text or "previous month" in text:
+        year, month = (now.year, now.month - 1) if now.month > 1 else (now.year - 1, 12)
+        return f"{year:04d}-{month:02d}"
+    match = _MONTH_KEY.search(text)
+    if match:
+        return f"{match.group(1)}-{match.group(2)}"
+    for match in _MONTH_WORD.finditer(text):
+        word = match.group(1).lower()
+        if word == "may" and not match.group(2):
+            continue  # too often the verb
+        month = next(i for name, i in _MONTHS.items() if name.startswith(word))
+        year = int(match.group(2)) if match.group(2) else now.year - (1 if month > now.month else 0)
+        return f"{year:04d}-{month:02d}"
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Intents
+# ---------------------------------------------------------------------------
+def _party_due(question: str) -> Optional[RoutedAnswer]:
+    if not _DUE.search(question):
+        return None
+    ids = _PARTY_ID.findall(question)
+    if len(ids) != 1 or ids[0][0].upper() not in "CS":
+        return None
+    prefix, number = ids[0][0].upper(), ids[0][1]
+    party_id = f"{prefix}{number}"
+    if prefix == "C":
+        party = get_client_by_id(party_id)
+        due, kind = (party or {}).get("due_amount", 0), "client"
+    else:
+        party = get_supplier_by_id(party_id)
+        due, kind = (party or {}).get("due", 0), "supplier"
+    if not party:
+        return None
+    if not due:
+        return RoutedAnswer("party_due", f"**{party.get('name')}** ({party_id}) has no outstanding due.")
+    if kind == "client":
+        return RoutedAnswer("party_due", f"**{party.get('name')}** ({party_id}) owes us **{_money(due)}**.")
+    return RoutedAnswer("party_due", f"We owe **{party.get('name')}** ({party_id}) **{_money(due)}**.")
+
+
+def _client_text(client: Dict) -> str:
+    lines = [f"**{client.get('name')}** ({client['id']})",
+             f"* Outstanding due: **{_money(client.get('due_amount'))}**"]
+    for label, key in (("GST", "GST"), ("PAN", "PAN"), ("Contact", "POC_name"), ("Phone", "POC_contact"), ("Address", "address")):
+        if client.get(key):
+            lines.append(f"* {label}: {client[key]}")
+    return "\n".join(lines)
+
+
+def _supplier_text(supplier: Dict) -> str:
+    lines = [f"**{supplier.get('name')}** ({supplier['id']})",
+             f"* Outstanding due: **{_money(supplier.get('due'))}**"]
+    for label, key in (("Contact", "contact"), ("Address", "address")):
+        if supplier.get(key):
+            lines.append(f"* {label}: {supplier[key]}")
+    return "\n".join(lines)
+
+
+def _employee_text(employee: Dict) -> str:
+    return "\n".join([
+        f"**{employee.get('name')}** ({employee['id']})",
+        f"* Collected: {_money(employee.get('collected'))}",
+        f"* Paid: {_money(employee.get('paid'))}",
+    ])
+
+
+def _item_text(item: Dict) -> str:
+    batches = item.get("batches") or []
+    lines = [f"**{item.get('name')}** ({item['id']}) — **{item.get('stock_quantity', 0)}** in stock"]
+    if item.get("category"):
+        lines.append(f"* Category: {item['category']}")
+    if item.get("low_stock_threshold") is not None:
+        low = float(item.get("stock_quantity") or 0) <= float(item["low_stock_threshold"])
+        lines.append(f"* Low-stock threshold: {item['low_stock_threshold']}" + (" — **below threshold**" if low else ""))
+    for batch in batches[:5]:
+        lines.append(f"* Batch {batch.get('batch_number')}: {batch.get('quantity')} units, expires {_date(batch.get('Expiry'))}")
+    if len(batches) > 5:
+        lines.append(f"* …and {len(batches) - 5} more batches")
+    return "\n".join(lines)
+
+
+def _order_text(order: Dict) -> str:
+    party = order.get("client_name") or order.get("supplier_name") or "—"
+    return "\n".join([
+        f"**{str(order.get('order_type', 'order')).title()} order {order['id']}** — {party}",
+        f"* Date: {_date(order.get('order_date') or order.get('created_at'))}",
+        f"* Total: **{_money(order.get('total_amount'))}**, paid {_money(order.get('amount_paid'))} "
+        f"({order.get('payment_status', '—')})",
+        f"* Status: {order.get('status', '—')}",
+        f"* Items: {len(order.get('items') or [])}",
+    ])
+
+
+_ENTITY_LOOKUPS: Dict[str, tuple] = {
+    "C": (get_client_by_id, _client_text),
+    "S": (get_supplier_by_id, _supplier_text),
+    "E": (get_employee_by_id, _employee_text),
+    "I": (get_inventory_item_by_id, _item_text),
+}
+
+
+def _entity_by_id(question: str) -> Optional[RoutedAnswer]:
+    ids = _PARTY_ID.findall(question)
+    if len(ids) == 1:
+        prefix = ids[0][0].upper()
+        lookup, render = _ENTITY_LOOKUPS[prefix]
+        entity = lookup(f"{prefix}{ids[0][1]}")
+        return RoutedAnswer("entity_by_id", render(entity)) if entity else None
+    if not ids:
+        match = _ORDER_ID.search(question)
+        if match and any(ch.isdigit() for ch in match.group(1)):
+            order = get_order_by_id(match.group(1))
+            return RoutedAnswer("entity_by_id", _order_text(order)) if order else None
+    return None
+
+
+def _item_stock(question: str) -> Optional[RoutedAnswer]:
+    match = _STOCK.match(question.strip())
+    if not match:
+        return None
+    name = (match.group("name") or match.group("name2") or "").strip(" '\"")
+    if not name:
+        return None
+    # Names are stored as typed; try the question's casing, then Title Case.
+    for candidate in dict.fromkeys([name, name.title(), name.upper()]):
+        items = get_inventory_item_by_name(candidate)
+        if len(items) == 1:
+            return RoutedAnswer("item_stock", _item_text(items[0]))
+    return None
+
+
+def _unqualified(question: str, measure: re.Pattern = _MONTHLY) -> bool:
+    """True when nothing but the measure, the month and filler words is left."""
+    text = measure.sub(" ", _MONTH_WORD.sub(" ", _MONTH_KEY.sub(" ", question.lower())))
+    return all(word in _MONTHLY_FILLER for word in _WORD.findall(text))
+
+
+def _monthly_totals(question: str) -> Optional[RoutedAnswer]:
+    what = _MONTHLY.search(question)
+    month = _month_of(question, datetime.now(timezone.utc))
+    if not what or not month:
+        return None
+    # A party, item or any other qualifier needs the agent, not the company-wide summary.
+    if _PARTY_ID.search(question) or not _unqualified(question):
+        return None
+    summary = get_monthly_summary(month)
+    word = what.group("what").lower()
+    label = _month_label(month)
+    expenses = summary.get("expenses") or {}
+    if word.startswith(("sale", "sold")):
+        text = (f"Sales in **{label}**: **{summary.get('sales_orders_count', 0)}** orders worth "
+                f"**{_money(summary.get('sales_orders_amount'))}**.")
+        if summary.get("delivery_challan_count"):
+            text += (f"\n\nDelivery challans: {summary['delivery_challan_count']} worth "
+                     f"{_money(summary.get('delivery_challan_amount'))}.")
+    elif word.startswith(("purchase", "bought")):
+        text = (f"Purchases in **{label}**: **{summary.get('purchase_orders_count', 0)}** orders worth "
+                f"**{_money(summary.get('purchase_orders_amount'))}**.")
+    elif word.startswith("challan"):
+        text = (f"Delivery challans in **{label}**: **{summary.get('delivery_challan_count', 0)}** worth "
+                f"**{_money(summary.get('delivery_challan_amount'))}**.")
+    else:
+        text = (f"Expenses in **{label}**: **{expenses.get('total', 0)}** entries totalling "
+                f"**{_money(expenses.get('total_amount'))}**.")
+    return RoutedAnswer("monthly_totals", text)
+
+
+def _financials(question: str) -> Optional[RoutedAnswer]:
+    if not _FINANCIALS.search(question) or _month_of(question, datetime.now(timezone.utc)):
+        return None
+    # "profit from client C0012" or "profit on Paracetamol" is not the company-wide figure.
+    if _PARTY_ID.search(question) or not _unqualified(question, _FINANCIALS):
+        return None
+    summary = get_counter_by_section("financial_summary")
+    if not summary:
+        return None
+    return RoutedAnswer("financials", "\n".join([
+        "**Overall financial summary**",
+        f"* Total income: {_money(summary.get('total_income'))}",
+        f"* Total expense: {_money(summary.get('total_expense'))}",
+        f"* Net profit: **{_money(summary.get('net_profit'))}**",
+    ]))
+
+
+# Most specific first.
+_INTENTS: List[Callable[[str], Optional[RoutedAnswer]]] = [
+    _party_due,
+    _item_stock,
+    _monthly_totals,
+    _financials,
+    _entity_by_id,
+]
+
+
+def route_question(question: str) -> Optional[RoutedAnswer]:
+    """Answer ``question`` directly if it is a known simple lookup, else ``None`` (blocking)."""
+    if not INTENT_ROUTER_ENABLED or not question:
+        return None
+    question = question.strip()
+    if len(question.split()) > MAX_ROUTED_WORDS or _COMPOUND.search(question):
+        return None
+    for intent in _INTENTS:
+        answer = intent(question)
+        if answer is not None:
+            return answer
+    return None
@@ -0,0 +1,440 @@
+"""
+invoice_jobs.py — bulk invoice ingestion as background jobs
+==========================================================
+
+Month-end supplier backlogs arrive as dozens of PDFs, and scanning them one
+request at a time means waiting on Gemini for each in turn, then re-typing
+every result into the order forms. ``POST /api/v1/invoice/scan-batch`` takes
+many PDFs and / or zips of PDFs and answers at once with a job id. The job
+works in the background; ``GET /api/v1/jobs/{id}`` returns its state and
+``GET /api/v1/jobs/{id}/events`` streams it over SSE.
+
+Each file goes through:
+
+1. **scan** — ``invoice_scan.scan_invoice``: process-pool extraction, the
+   rate-limited Gemini call, the SHA-256 cache. At most
+   ``INVOICE_BATCH_CONCURRENCY`` files are in flight at once, across all jobs.
+2. **validate** — the structured JSON is mapped onto ``SaleOrderCreate`` or
+   ``PurchaseOrderCreate``. The job's ``order_type`` overrides the model's
+   guess (a supplier's invoice reads like a sale), and for purchases the
+   invoice's party becomes the supplier. Items and the party, when they have
+   no id, are looked up by exact name in ``Inventory Items`` / ``Clients`` /
+   ``Suppliers``. Validation errors are reported per field; an invoice number
+   that cannot be a document id (``GST/23-24/101``) is one of them.
+3. **create** (with ``create_drafts``) — valid invoices become *draft*
+   orders, so stock, dues and counters stay untouched until someone reviews
+   and finalises them. Orders are written in Firestore batches of
+   ``INVOICE_BATCH_WRITE_SIZE``. Invoice numbers that already exist, or that
+   repeat within the job, are skipped. Each party's ``draft_count`` is bumped
+   once per batch. A batch that fails marks only its own files ``failed``.
+
+File statuses: ``queued`` → ``scanning`` → ``valid`` | ``invalid`` |
+``failed``; with ``create_drafts``, valid files then become ``created`` |
+``exists`` | ``duplicate``. Jobs live in the process that accepted them and
+are kept for ``INVOICE_JOB_TTL_SECONDS`` after they finish. Behind several
+workers, read a job from the worker that created it.
+
+Public surface:
+    await submit(uploads, created_by, create_drafts=False, order_type=None) -> Job
+    get(job_id)                             -> Job | None
+    Job.snapshot()                          -> Dict
+    Job.events()                            -> async iterator of (event, data), None = keep-alive
+    to_order(structured, order_type=None)   -> (model class, payload)
+    stats()                                 -> Dict
+    INVOICE_BATCH_MAX_FILES, INVOICE_BATCH_CONCURRENCY, INVOICE_BATCH_WRITE_SIZE
+"""
+
+import asyncio
+import io
+import logging
+import os
+import time
+import uuid
+import zipfile
+from collections import Counter
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore_v1 import FieldFilter
+from pydantic import ValidationError
+
+from firebase_config import answer_cache, invoice_scan
+from firebase_config.config import db
+from firebase_config.entity_stats import party_for_order, record_order_stats
+from firebase_config.invoice_scan import InvoiceScanError
+from models import PurchaseOrderCreate, SaleOrderCreate
+
+logger = logging.getLogger(__name__)
+
+INVOICE_BATCH_MAX_FILES = int(os.getenv("INVOICE_BATCH_MAX_FILES", "100"))
+INVOICE_BATCH_MAX_MB = float(os.getenv("INVOICE_BATCH_MAX_MB", "200"))
+INVOICE_BATCH_CONCURRENCY = max(1, int(os.getenv("INVOICE_BATCH_CONCURRENCY", "4")))
+# A Firestore batch takes at most 500 writes.
+INVOICE_BATCH_WRITE_SIZE = min(500, max(1, int(os.getenv("INVOICE_BATCH_WRITE_SIZE", "200"))))
+INVOICE_JOB_TTL_SECONDS = int(os.getenv("INVOICE_JOB_TTL_SECONDS", "3600"))
+KEEPALIVE_SECONDS = 15
+
+IMPORTABLE = {"sale": SaleOrderCreate, "purchase": PurchaseOrderCreate}
+PARTY_COLLECTIONS = {"client": "Clients", "supplier": "Suppliers"}
+# Firestore "in" filters take at most 30 values.
+_IN_LIMIT = 30
+_SCANNED = {"valid", "invalid", "failed", "created", "exists", "duplicate"}
+
+_jobs: Dict[str, "Job"] = {}
+_scan_slots = asyncio.Semaphore(INVOICE_BATCH_CONCURRENCY)
+
+
+# ---------------------------------------------------------------------------
+# Jobs
+# ---------------------------------------------------------------------------
+class Job:
+    """One batch: its files' states, and the SSE subscribers following it."""
+
+    def __init__(self, files: List[Tuple[str, bytes]], created_by: str, create_drafts: bool, order_type: Optional[str]):
+        self.id = uuid.uuid4().hex
+        self.created_by = created_by
+        self.create_drafts = create_drafts
+        self.order_type = order_type
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.files: List[Dict] = [{"index": i, "filename": name, "status": "queued"} for i, (name, _) in enumerate(files)]
+        self.task: Optional[asyncio.Task] = None
+        self._data: List[Optional[bytes]] = [data for _, data in files]
+        self._orders: Dict[int, object] = {}
+        self._subscribers: List[asyncio.Queue] = []
+        self._started = time.perf_counter()
+
+    def counts(self) -> Dict[str, int]:
+        return dict(Counter(entry["status"] for entry in self.files))
+
+    def _progress(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": len(self.files),
+            "processed": sum(entry["status"] in _SCANNED for entry in self.files),
+            "counts": self.counts(),
+        }
+
+    def snapshot(self) -> Dict:
+        return {
+            **self._progress(),
+            "created_by": self.created_by,
+            "create_drafts": self.create_drafts,
+            "order_type": self.order_type,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "files": self.files,
+        }
+
+    def _update(self, index: int, **fields):
+        self.files[index].update(fields)
+        self._publish("file", {**self._progress(), "file": self.files[index]})
+
+    def _publish(self, event: str, data: Dict):
+        for queue in self._subscribers:
+            queue.put_nowait((event, data))
+
+    async def events(self) -> AsyncIterator[Optional[Tuple[str, Dict]]]:
+        """``snapshot``, then a ``file`` event per change, then ``done``; None every ``KEEPALIVE_SECONDS`` of quiet."""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        try:
+            yield "snapshot", self.snapshot()
+            if self.finished_at is not None:
+                yield "done", self.snapshot()
+                return
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield event, data
+                if event == "done":
+                    return
+        finally:
+            self._subscribers.remove(queue)
+
+
+def get(job_id: str) -> Optional[Job]:
+    _purge()
+    return _jobs.get(job_id)
+
+
+def _purge():
+    cutoff = time.time() - INVOICE_JOB_TTL_SECONDS
+    for job_id, job in list(_jobs.items()):
+        if job.finished_at is not None and job.finished_at.timestamp() < cutoff:
+            del _jobs[job_id]
+
+
+def _too_big(count: int, size: int):
+    if count > INVOICE_BATCH_MAX_FILES:
+        raise InvoiceScanError(f"At most {INVOICE_BATCH_MAX_FILES} files can be scanned in one batch")
+    if size > INVOICE_BATCH_MAX_MB * 1024 * 1024:
+        raise InvoiceScanError(f"A batch can be at most {INVOICE_BATCH_MAX_MB:g} MB")
+
+
+def _expand(uploads: List[Tuple[str, bytes]]) -> List[Tuple[str, bytes]]:
+    """The uploads with every zip replaced by the PDFs inside it."""
+    files: List[Tuple[str, bytes]] = []
+    size = 0
+    for name, data in uploads:
+        if not zipfile.is_zipfile(io.BytesIO(data)):
+            size += len(data)
+            _too_big(len(files) + 1, size)
+            files.append((name, data))
+            continue
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for info in archive.infolist():
+                base = os.path.basename(info.filename)
+                if info.is_dir() or base.startswith(".") or info.filename.startswith("__MACOSX/") or not base.lower().endswith(".pdf"):
+                    continue
+                size += info.file_size
+                _too_big(len(files) + 1, size)
+                files.append((f"{name}/{info.filename}", archive.read(info)))
+    if not files:
+        raise InvoiceScanError("No PDF files in the upload")
+    return files
+
+
+async def submit(
+    uploads: List[Tuple[str, bytes]],
+    created_by: str,
+    create_drafts: bool = False,
+    order_type: Optional[str] = None,
+) -> Job:
+    """Start a job over ``(filename, bytes)`` uploads (PDFs or zips of PDFs)."""
+    if order_type:
+        order_type = order_type.lower()
+        if order_type not in IMPORTABLE:
+            raise InvoiceScanError(f"order_type must be one of {sorted(IMPORTABLE)}")
+    files = await asyncio.to_thread(_expand, uploads)
+    _purge()
+    job = Job(files, created_by, create_drafts, order_type or None)
+    _jobs[job.id] = job
+    job.task = asyncio.create_task(_run(job))
+    logger.info(f"Invoice job {job.id}: {len(files)} files from {created_by} (drafts: {create_drafts})")
+    return job
+
+
+async def _run(job: Job):
+    job.status = "running"
+    try:
+        await asyncio.gather(*(_process(job, index) for index in range(len(job.files))))
+        if job.create_drafts:
+            await _create_drafts(job)
+        job.status = "completed"
+    except Exception as e:
+        logger.exception(f"Invoice job {job.id} failed")
+        job.status = "failed"
+        job.error = str(e)
+    finally:
+        job.finished_at = datetime.utcnow()
+        job._orders.clear()
+        logger.info(
+            f"Invoice job {job.id} {job.status} in {time.perf_counter() - job._started:.1f}s: {job.counts()}"
+        )
+        job._publish("done", job.snapshot())
+
+
+# ---------------------------------------------------------------------------
+# Scan and validate
+# ---------------------------------------------------------------------------
+def to_order(structured: Dict, order_type: Optional[str] = None) -> Tuple[type, Dict]:
+    """The create model for a scanned invoice and the payload to validate with it (always a draft)."""
+    data = {key: value for key, value in structured.items() if value is not None}
+    order_type = str(order_type or data.get("order_type") or "").lower()
+    model = IMPORTABLE.get(order_type)
+    if model is None:
+        raise ValueError(f"Only sale and purchase invoices can be imported, not {order_type or 'unknown'!r}")
+
+    data.update(order_type=order_type, draft=True)
+    for key in ("discount_type", "payment_status", "status"):
+        if isinstance(data.get(key), str):
+            data[key] = data[key].lower()
+    if data.get("discount_type") == "flat":
+        data["discount_type"] = "fixed"
+    if not data.get("invoice_number") and data.get("challan_number"):
+        data["invoice_number"] = data["challan_number"]
+    if order_type == "purchase":
+        # The prompt calls the invoice's party the client; on a purchase it is the supplier.
+        for field in ("id", "name"):
+            value = data.pop(f"client_{field}", None)
+            if value is not None:
+                data.setdefault(f"supplier_{field}", value)
+    data["items"] = [
+        {key: value for key, value in item.items() if value is not None}
+        for item in data.get("items") or [] if isinstance(item, dict)
+    ]
+    return model, data
+
+
+def _ids_by_name(collection: str, names) -> Dict[str, str]:
+    names = sorted({name for name in names if isinstance(name, str) and name})
+    found: Dict[str, str] = {}
+    for start in range(0, len(names), _IN_LIMIT):
+        query = db.collection(collection).where(filter=FieldFilter("name", "in", names[start:start + _IN_LIMIT]))
+        for doc in query.select(["name"]).stream():
+            found.setdefault(doc.get("name"), doc.id)
+    return found
+
+
+def _resolve_ids(payload: Dict):
+    """Fill in missing item and party ids from exact name matches."""
+    missing = [item for item in payload["items"] if not item.get("item_id")]
+    if missing:
+        ids = _ids_by_name("Inventory Items", (item.get("item_name") for item in missing))
+        for item in missing:
+            if item.get("item_name") in ids:
+                item["item_id"] = ids[item["item_name"]]
+
+    party = "supplier" if payload["order_type"] == "purchase" else "client"
+    name = payload.get(f"{party}_name")
+    if name and not payload.get(f"{party}_id"):
+        party_id = _ids_by_name(PARTY_COLLECTIONS[party], [name]).get(name)
+        if party_id:
+            payload[f"{party}_id"] = party_id
+
+
+def _document_id_error(invoice_number: str) -> Optional[str]:
+    """Why the invoice number cannot be an ``Orders`` document id, or None."""
+    if "/" in invoice_number:
+        return "Invoice number cannot contain '/' (it is used as the order's document id)"
+    if invoice_number in (".", "..") or (invoice_number.startswith("__") and invoice_number.endswith("__")):
+        return f"{invoice_number!r} is not a valid order document id"
+    if len(invoice_number.encode()) > 1500:
+        return "Invoice number is too long to be an order document id"
+    return None
+
+
+def _errors(error: ValidationError) -> List[Dict]:
+    return [{"field": ".".join(str(part) for part in e["loc"]), "message": e["msg"]} for e in error.errors()]
+
+
+async def _process(job: Job, index: int):
+    async with _scan_slots:
+        job._update(index, status="scanning")
+        data, job._data[index] = job._data[index], None
+        try:
+            result = await invoice_scan.scan_invoice(data)
+        except Exception as e:
+            job._update(index, status="failed", error=str(e))
+            return
+
+    scanned = {"sha256": result.sha256, "cached": result.cached, "structured": result.structured}
+    try:
+        model, payload = to_order(result.structured, job.order_type)
+    except ValueError as e:
+        job._update(index, status="invalid", errors=[{"field": "order_type", "message": str(e)}], **scanned)
+        return
+    scanned.update(order_type=payload["order_type"], invoice_number=payload.get("invoice_number"))
+    try:
+        await asyncio.to_thread(_resolve_ids, payload)
+        order = model(**payload)
+    except ValidationError as e:
+        job._update(index, status="invalid", errors=_errors(e), **scanned)
+        return
+    except Exception as e:
+        job._update(index, status="failed", error=f"Could not look up items / parties: {e}", **scanned)
+        return
+    id_error = _document_id_error(order.invoice_number)
+    if id_error:
+        job._update(index, status="invalid", errors=[{"field": "invoice_number", "message": id_error}], **scanned)
+        return
+    job._orders[index] = order
+    job._update(index, status="valid", errors=[], **scanned)
+
+
+# ---------------------------------------------------------------------------
+# Draft orders
+# ---------------------------------------------------------------------------
+def _write_drafts(drafts: List[Tuple[int, Dict]]) -> Dict[int, str]:
+    """Create one batch of draft orders; status per file index."""
+    refs = [db.collection("Orders").document(order_data["invoice_number"]) for _, order_data in drafts]
+    existing = {snapshot.id for snapshot in db.get_all(refs, field_paths=["order_type"]) if snapshot.exists}
+    results: Dict[int, str] = {}
+    batch = db.batch()
+    pending = []
+    for (index, order_data), ref in zip(drafts, refs):
+        if ref.id in existing:
+            results[index] = "exists"
+            continue
+        batch.create(ref, order_data)
+        pending.append((index, order_data, ref))
+
+    created = []
+    if pending:
+        try:
+            batch.commit()
+            created = pending
+        except AlreadyExists:
+            # Another writer took one of the numbers since the read: go one by one.
+            for index, order_data, ref in pending:
+                try:
+                    ref.create(order_data)
+                    created.append((index, order_data, ref))
+                except AlreadyExists:
+                    results[index] = "exists"
+
+    drafts_by_party: Dict[tuple, List] = {}
+    for index, order_data, _ in created:
+        results[index] = "created"
+        party = party_for_order(order_data)
+        if party:
+            drafts_by_party.setdefault(party, [order_data, 0])[1] += 1
+    for order_data, count in drafts_by_party.values():
+        record_order_stats(order_data, drafts=count)
+    return results
+
+
+async def _create_drafts(job: Job):
+    drafts: List[Tuple[int, Dict]] = []
+    seen = set()
+    now = datetime.utcnow()
+    for index in sorted(job._orders):
+        order = job._orders[index]
+        if order.invoice_number in seen:
+            job._update(index, status="duplicate")
+            continue
+        seen.add(order.invoice_number)
+        order_data = order.dict()
+        order_data.update({
+            "created_at": now,
+            "updated_at": now,
+            "created_by": job.created_by,
+            "updated_by": job.created_by,
+            "scanned_from": job.files[index]["sha256"],
+        })
+        drafts.append((index, order_data))
+
+    created = 0
+    for start in range(0, len(drafts), INVOICE_BATCH_WRITE_SIZE):
+        chunk = drafts[start:start + INVOICE_BATCH_WRITE_SIZE]
+        try:
+            results = await asyncio.to_thread(_write_drafts, chunk)
+        except Exception as e:
+            # Only this batch's files fail; the remaining batches still run.
+            logger.exception(f"Invoice job {job.id}: draft batch at {start} failed")
+            for index, _ in chunk:
+                job._update(index, status="failed", error=f"Could not create the draft order: {e}")
+            continue
+        for index, status in results.items():
+            job._update(index, status=status)
+            created += status == "created"
+    if created:
+        answer_cache.invalidate("Orders")
+
+
+def stats() -> Dict:
+    _purge()
+    return {
+        "jobs": dict(Counter(job.status for job in _jobs.values())),
+        "concurrency": INVOICE_BATCH_CONCURRENCY,
+        "scan": invoice_scan.stats(),
+    }
@@ -0,0 +1,409 @@
+"""
+invoice_scan.py — PDF invoice → structured order JSON, off the event loop
+========================================================================
+
+``POST /api/v1/invoice/scan`` used to save the upload to a temp file that was
+never deleted, run pdfplumber inside the ``async`` handler and call Gemini
+synchronously, so one multi-page PDF stalled every other request. Now:
+
+1. **Extraction** runs in a process pool (pdfplumber is pure Python and holds
+   the GIL). The PDF is parsed from memory — no temp file — and its pages are
+   split into tasks of ``INVOICE_PAGES_PER_TASK`` pages, extracted in parallel
+   and reassembled in page order. Workers are started with ``spawn`` (forking
+   a process that already runs gRPC / Firestore threads is unsafe), so this
+   module keeps its top-level imports light; the LLM side is imported lazily.
+2. **Structuring** is one async model call (``chat_model().ainvoke``; the
+   scripted fake with ``OFFLINE_MODE``), recorded as an ``llm`` span named
+   ``invoice_scan``.
+3. **Caching**: the structured result is keyed by the SHA-256 of the PDF, so
+   re-scanning the same invoice returns at once. Results stay in an in-process
+   LRU and, with ``INVOICE_SCAN_CACHE_DIR`` set, on disk as ``<sha256>.json``
+   (shared by workers, kept across restarts). Concurrent scans of the same
+   file share one run. Failures are not cached.
+4. **Rate limit**: at most ``INVOICE_LLM_CONCURRENCY`` model calls run at
+   once, started at least ``60 / INVOICE_LLM_RPM`` seconds apart (per
+   process; ``INVOICE_LLM_RPM=0`` lifts the spacing). Cache hits skip it.
+
+Bad input (not a PDF, no pages, more than ``INVOICE_SCAN_MAX_PAGES``) raises
+``InvoiceScanError``; a reply that is not valid JSON raises ``ValueError``.
+
+Public surface:
+    await scan_invoice(data)      -> ScanResult
+    await extract_pdf(data)       -> (text, tables)
+    await structure_invoice(text, table_text) -> Dict
+    format_tables_as_text(tables) -> str
+    pdf_sha256(data)              -> str
+    stats()                       -> Dict
+    shutdown()                    -> None   (app shutdown: stop the pool)
+    InvoiceScanError, ScanResult
+    INVOICE_SCAN_WORKERS, INVOICE_PAGES_PER_TASK, INVOICE_SCAN_MAX_PAGES, INVOICE_LLM_RPM
+"""
+
+import asyncio
+import copy
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import pdfplumber
+
+logger = logging.getLogger(__name__)
+
+INVOICE_SCAN_WORKERS = int(os.getenv("INVOICE_SCAN_WORKERS", str(min(4, os.cpu_count() or 1))))
+INVOICE_PAGES_PER_TASK = max(1, int(os.getenv("INVOICE_PAGES_PER_TASK", "1")))
+INVOICE_SCAN_MAX_PAGES = int(os.getenv("INVOICE_SCAN_MAX_PAGES", "50"))
+INVOICE_SCAN_CACHE_SIZE = int(os.getenv("INVOICE_SCAN_CACHE_SIZE", "256"))
+INVOICE_SCAN_CACHE_DIR = os.getenv("INVOICE_SCAN_CACHE_DIR")
+INVOICE_SCAN_MODEL = os.getenv("INVOICE_SCAN_MODEL", "gemini-2.0-flash")
+INVOICE_LLM_CONCURRENCY = max(1, int(os.getenv("INVOICE_LLM_CONCURRENCY", "4")))
+INVOICE_LLM_RPM = float(os.getenv("INVOICE_LLM_RPM", "60"))
+
+PROMPT = """
+You are an invoice parser.
+
+Extract a structured JSON object matching the following fields:
+
+- order_type: one of ["sale", "purchase", "delivery_challan"] (string)
+- client_name (string)
+- client_id (string, optional)
+- invoice_number OR challan_number (string)
+- order_date (format: YYYY-MM-DD or ISO)
+- amount_paid (number)
+- amount_collected_by (string, optional)
+- payment_method (string)
+- payment_status: one of ["paid", "pending", "partial"] (string)
+- remarks (string)
+- status (string)
+- total_amount (number)
+- total_quantity (number)
+- total_tax (number)
+- discount (number)
+- discount_type: one of ["flat", "percentage"] (string)
+- draft (boolean)
+- items (array of objects), each with:
+    - item_id (string, optional)
+    - item_name (string)
+    - batch_number (string, optional)
+    - Expiry (string, e.g., "06/2026")
+    - quantity (number)
+    - price (number)
+    - discount (number)
+    - tax (number)
+    - link (string, optional)
+
+Here is the raw invoice content:
+{text}
+
+Here are the extracted tables from the invoice:
+{table_text}
+
+Output a clean and valid JSON. Use null for missing fields. Do not include explanations.
+"""
+
+
+class InvoiceScanError(ValueError):
+    """The upload cannot be scanned (not a PDF, no pages, too many pages)."""
+
+
+@dataclass
+class ScanResult:
+    structured: Dict
+    sha256: str
+    cached: bool
+    pages: int = 0
+    extract_ms: float = 0.0
+    llm_ms: float = 0.0
+
+
+# ---------------------------------------------------------------------------
+# Extraction (runs in the worker processes)
+# ---------------------------------------------------------------------------
+def _page_count(data: bytes) -> int:
+    try:
+        with pdfplumber.open(io.BytesIO(data)) as pdf:
+            return len(pdf.pages)
+    except Exception as e:
+        raise InvoiceScanError(f"Not a readable PDF: {e}") from None
+
+
+def _extract_pages(data: bytes, start: int, stop: int) -> List[Tuple[str, Optional[List]]]:
+    """Text and first table of pages ``start``..``stop - 1``."""
+    pages = []
+    with pdfplumber.open(io.BytesIO(data), pages=list(range(start + 1, stop + 1))) as pdf:
+        for page in pdf.pages:
+            pages.append((page.extract_text() or "", page.extract_table() or None))
+    return pages
+
+
+# ---------------------------------------------------------------------------
+# Process pool
+# ---------------------------------------------------------------------------
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=INVOICE_SCAN_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _drop_pool(broken: ProcessPoolExecutor):
+    """Forget a pool whose worker died, so the next scan starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _in_pool(fn, *args):
+    pool = _get_pool()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        _drop_pool(pool)
+        raise
+
+
+async def _extract(data: bytes) -> Tuple[str, List, int]:
+    count = await _in_pool(_page_count, data)
+    if count == 0:
+        raise InvoiceScanError("The PDF has no pages")
+    if count > INVOICE_SCAN_MAX_PAGES:
+        raise InvoiceScanError(f"The PDF has {count} pages; at most {INVOICE_SCAN_MAX_PAGES} can be scanned")
+    chunks = await asyncio.gather(*(
+        _in_pool(_extract_pages, data, start, min(start + INVOICE_PAGES_PER_TASK, count))
+        for start in range(0, count, INVOICE_PAGES_PER_TASK)
+    ))
+    pages = [page for chunk in chunks for page in chunk]
+    text = "".join(page_text + "\n" for page_text, _ in pages if page_text)
+    return text.strip(), [table for _, table in pages if table], count
+
+
+async def extract_pdf(data: bytes) -> Tuple[str, List]:
+    """Text of all pages (newline-joined) and their tables, extracted in parallel."""
+    text, tables, _ = await _extract(data)
+    return text, tables
+
+
+def format_tables_as_text(tables) -> str:
+    if not tables:
+        return ""
+
+    formatted = []
+    for table in tables:
+        rows = ["\t".join(cell if cell is not None else "" for cell in row) for row in table if row]
+        formatted.append("\n".join(rows))
+    return "\n\n".join(formatted)
+
+
+# ---------------------------------------------------------------------------
+# Structuring
+# ---------------------------------------------------------------------------
+class _RateLimit:
+    """At most ``concurrency`` calls in flight, started at least ``60 / rpm`` seconds apart."""
+
+    def __init__(self, concurrency: int, rpm: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = 60 / rpm if rpm > 0 else 0
+        self.next_at = 0.0
+        self.waited_ms = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.interval:
+            # Reserve the next start time and sleep before taking a slot, so a
+            # call waiting out the rate limit does not block one that may start.
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+            if wait > 0:
+                self.waited_ms += wait * 1000
+                await asyncio.sleep(wait)
+        async with self.semaphore:
+            yield
+
+
+_llm_limit = _RateLimit(INVOICE_LLM_CONCURRENCY, INVOICE_LLM_RPM)
+_model = None
+
+
+def _get_model():
+    global _model
+    if _model is None:
+        from firebase_config.offline import chat_model
+
+        _model = chat_model(INVOICE_SCAN_MODEL)
+    return _model
+
+
+def _parse_json(reply: str) -> Dict:
+    """The model's reply as a dict, without a ```json fence if it added one."""
+    reply = reply.strip()
+    if reply.startswith("```"):
+        reply = reply.strip("`")
+        if reply.lower().startswith("json"):
+            reply = reply[4:]
+        reply = reply.strip()
+    try:
+        parsed = json.loads(reply)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"The model did not return valid JSON: {e}") from None
+    if not isinstance(parsed, dict):
+        raise ValueError("The model did not return a JSON object")
+    return parsed
+
+
+async def structure_invoice(text: str, table_text: str) -> Dict:
+    from langchain_core.messages import HumanMessage
+    from firebase_config.instrumentation import InstrumentationHandler
+
+    logger.debug(f"Structuring invoice: {len(text)} chars of text, {len(table_text)} of tables")
+    async with _llm_limit.slot():
+        response = await _get_model().ainvoke(
+            [HumanMessage(content=PROMPT.format(text=text, table_text=table_text))],
+            config={"callbacks": [InstrumentationHandler("invoice_scan")]},
+        )
+    return _parse_json(str(response.content))
+
+
+# ---------------------------------------------------------------------------
+# Result cache
+# ---------------------------------------------------------------------------
+_cache: "OrderedDict[str, Dict]" = OrderedDict()
+_cache_lock = threading.Lock()
+_inflight: Dict[str, asyncio.Future] = {}
+_counters = {"hits": 0, "disk_hits": 0, "misses": 0, "shared": 0, "errors": 0}
+
+
+def pdf_sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _disk_path(sha: str) -> Optional[str]:
+    return os.path.join(INVOICE_SCAN_CACHE_DIR, f"{sha}.json") if INVOICE_SCAN_CACHE_DIR else None
+
+
+def _cached(sha: str) -> Optional[Dict]:
+    with _cache_lock:
+        if sha in _cache:
+            _cache.move_to_end(sha)
+            _counters["hits"] += 1
+            return _cache[sha]
+    path = _disk_path(sha)
+    if path and os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                structured = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable invoice cache file {path}: {e}")
+            return None
+        _remember(sha, structured, persist=False)
+        with _cache_lock:
+            _counters["disk_hits"] += 1
+        return structured
+    return None
+
+
+def _remember(sha: str, structured: Dict, persist: bool = True):
+    with _cache_lock:
+        _cache[sha] = structured
+        _cache.move_to_end(sha)
+        while len(_cache) > INVOICE_SCAN_CACHE_SIZE:
+            _cache.popitem(last=False)
+    path = _disk_path(sha)
+    if persist and path:
+        try:
+            os.makedirs(INVOICE_SCAN_CACHE_DIR, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(structured, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not persist invoice scan {sha[:12]}: {e}")
+
+
+async def _scan(data: bytes, sha: str) -> ScanResult:
+    started = time.perf_counter()
+    text, tables, pages = await _extract(data)
+    extracted = time.perf_counter()
+    structured = await structure_invoice(text, format_tables_as_text(tables))
+    _remember(sha, structured)
+    return ScanResult(
+        structured=structured,
+        sha256=sha,
+        cached=False,
+        pages=pages,
+        extract_ms=round((extracted - started) * 1000, 1),
+        llm_ms=round((time.perf_counter() - extracted) * 1000, 1),
+    )
+
+
+async def scan_invoice(data: bytes) -> ScanResult:
+    """Structured invoice for a PDF's bytes; instant when this PDF was scanned before."""
+    if b"%PDF-" not in data[:1024]:
+        raise InvoiceScanError("The upload is not a PDF")
+    sha = pdf_sha256(data)
+    structured = _cached(sha)
+    if structured is not None:
+        return ScanResult(structured=copy.deepcopy(structured), sha256=sha, cached=True)
+
+    running = _inflight.get(sha)
+    if running is not None:
+        with _cache_lock:
+            _counters["shared"] += 1
+        result = await asyncio.shield(running)
+        return ScanResult(**{**result.__dict__, "structured": copy.deepcopy(result.structured)})
+
+    with _cache_lock:
+        _counters["misses"] += 1
+    task = asyncio.ensure_future(_scan(data, sha))
+    _inflight[sha] = task
+    try:
+        result = await asyncio.shield(task)
+    except Exception:
+        with _cache_lock:
+            _counters["errors"] += 1
+        raise
+    finally:
+        if task.done():
+            _inflight.pop(sha, None)
+        else:
+            task.add_done_callback(lambda _: _inflight.pop(sha, None))
+    return ScanResult(**{**result.__dict__, "structured": copy.deepcopy(result.structured)})
+
+
+def stats() -> Dict:
+    with _cache_lock:
+        return {
+            "entries": len(_cache),
+            "inflight": len(_inflight),
+            "workers": INVOICE_SCAN_WORKERS,
+            "pool_started": _pool is not None,
+            "llm_rate_limit_wait_ms": round(_llm_limit.waited_ms, 1),
+            **_counters,
+        }
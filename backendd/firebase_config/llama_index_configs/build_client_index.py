@@ -1,34 +1,12 @@
-import os
-from llama_index.core import Document, Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from firebase_config.llama_index_configs import global_settings 
-from firebase_config.clients import get_all_clients
-from .client_index import build_clients_index
+# build_client_index.py — incremental rebuild of the Qdrant `clients` collection.
+# Pages through Firestore, skips unchanged records and resumes from its
+# checkpoint; see vector_build.py. Pass --restart to ignore the checkpoint.
 
-# Set embedding model globally
-Settings.embed_model = HuggingFaceEmbedding(model_name="sentence-transformers/all-MiniLM-L6-v2")
+import sys
 
-def build_client_documents():
-    clients = get_all_clients()
-    docs = []
-    for client in clients:
-        text = f"""
-        Name: {client.get("name")}
-        Client ID: {client.get("id")}
-        PAN: {client.get("pan", "N/A")}
-        GST: {client.get("gst", "N/A")}
-        Point of Contact Name: {client.get("poc_name", "")}
-        Point of Contact Contact: {client.get("poc_contact", "")}
-        Due Amount: ₹{client.get("due_amount", 0)}
-        Address: {client.get("address", "")}
-        """
-        docs.append(Document(text=text.strip()))
-    return docs
+from firebase_config.llama_index_configs.vector_build import build_collection
 
 if __name__ == "__main__":
-    docs = build_client_documents()
-    if not docs:
-        print("❌ No clients found. Index not built.")
-    else:
-        build_clients_index(docs)
-        print("✅ Clients index built and saved.")
+    report = build_collection("clients", restart="--restart" in sys.argv)
+    print(f"✅ Clients index up to date: {report['written']} written, "
+          f"{report['unchanged']} unchanged, {report['pruned']} pruned")
@@ -1,27 +1,13 @@
-from llama_index.core import VectorStoreIndex, StorageContext
-from firebase_config.llama_index_configs.global_settings import global_settings
-from llama_index.vector_stores.qdrant import QdrantVectorStore
+from firebase_config.llama_index_configs.index_registry import get_index
+from firebase_config.llama_index_configs.vector_points import write_documents
 
-def build_doc_counter_index(documents):
-    settings = global_settings()
-    qdrant_client = settings["qdrant_client"]
 
-    vector_store = QdrantVectorStore(
-        client=qdrant_client,
-        collection_name="doc_counter",
-    )
+def build_doc_counter_index(documents):
+    # Upserts one deterministic point per document, so re-running never duplicates.
+    # Full rebuilds go through vector_build.build_collection("doc_counter").
+    write_documents("doc_counter", documents)
 
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
-    index = VectorStoreIndex.from_documents(documents, storage_context=storage_context)
 
 def load_doc_counter_index():
-    settings = global_settings()
-    qdrant_client = settings["qdrant_client"]
-
-    vector_store = QdrantVectorStore(
-        client=qdrant_client,
-        collection_name="doc_counter",
-    )
-
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
-    return VectorStoreIndex.from_vector_store(vector_store=vector_store, storage_context=storage_context)
+    # Shared handle from the registry; built once per process, not per query.
+    return get_index("doc_counter")
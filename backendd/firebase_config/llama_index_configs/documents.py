@@ -0,0 +1,213 @@
+"""
+documents.py — Firestore record -> LlamaIndex Document, one function per collection
+==================================================================================
+
+The text is what gets embedded; ``metadata`` becomes the Qdrant payload used
+for filtering and is kept out of the embedded text. ``doc_id`` is always the
+Firestore document id, so a record maps to exactly one vector.
+
+``SOURCES`` maps each Qdrant collection to its Firestore collection and
+formatter; the sync service and the index builders both read it.
+``PAYLOAD_INDEXES`` lists the metadata fields Qdrant indexes for filtering.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Tuple
+
+from llama_index.core import Document
+
+
+def _date(value: Any) -> str:
+    return value.strftime("%Y-%m-%d") if isinstance(value, datetime) else str(value or "")
+
+
+def _timestamp(value: Any) -> str:
+    """RFC 3339 UTC for datetime payload indexes; strings (e.g. ``YYYY-MM-DD``) pass through."""
+    if isinstance(value, datetime):
+        value = value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return str(value or "")
+
+
+def _document(doc_id: str, text: str, metadata: Dict) -> Document:
+    metadata = {key: value for key, value in metadata.items() if value not in (None, "")}
+    return Document(
+        text=text.strip(),
+        doc_id=doc_id,
+        metadata=metadata,
+        excluded_embed_metadata_keys=list(metadata),
+        excluded_llm_metadata_keys=list(metadata),
+    )
+
+
+def _format_items(items) -> str:
+    return "\n".join(
+        f"- {item.get('item', '')} | Qty: {item.get('quantity', '')} | Price: ₹{item.get('price', '')} | "
+        f"Batch: {item.get('batch_number', '')} | Expiry: {item.get('expiry', '')}"
+        for item in items or []
+    )
+
+
+def order_document(data: Dict, doc_id: str) -> Document:
+    text = f"""
+Order ID: {doc_id}
+Order Type: {data.get('order_type')}
+Invoice/Challan Number: {data.get('invoice_number') or data.get('challan_number')}
+Order Date: {_date(data.get('order_date') or data.get('created_at'))}
+Client: {data.get('client_name')}
+Supplier: {data.get('supplier_name')}
+Total Amount: ₹{data.get('total_amount')}
+Amount Paid: ₹{data.get('amount_paid')}
+Payment Status: {data.get('payment_status')}
+Payment Method: {data.get('payment_method')}
+Collected By: {data.get('amount_collected_by')}
+Discount: {data.get('discount')} ({data.get('discount_type')})
+Status: {data.get('status')}
+Draft: {"Yes" if data.get('draft') else "No"}
+Remarks: {data.get('remarks', '')}
+Items:
+{_format_items(data.get('items'))}
+"""
+    return _document(doc_id, text, {
+        "order_id": doc_id,
+        "order_type": data.get("order_type"),
+        "client_id": data.get("client_id"),
+        "client": data.get("client_name"),
+        "supplier_id": data.get("supplier_id"),
+        "supplier": data.get("supplier_name"),
+        "status": data.get("status"),
+        "payment_status": data.get("payment_status"),
+        "order_date": _timestamp(data.get("order_date") or data.get("created_at")),
+        "invoice_number": data.get("invoice_number"),
+        "challan_number": data.get("challan_number"),
+    })
+
+
+def client_document(data: Dict, doc_id: str) -> Document:
+    text = f"""
+Name: {data.get("name")}
+Client ID: {doc_id}
+PAN: {data.get("PAN") or "N/A"}
+GST: {data.get("GST") or "N/A"}
+Point of Contact Name: {data.get("POC_name", "")}
+Point of Contact Contact: {data.get("POC_contact", "")}
+Due Amount: ₹{data.get("due_amount", 0)}
+Address: {data.get("address", "")}
+"""
+    return _document(doc_id, text, {"client_id": doc_id, "name": data.get("name")})
+
+
+def supplier_document(data: Dict, doc_id: str) -> Document:
+    text = f"""
+Supplier ID: {doc_id}
+Name: {data.get("name")}
+Contact: {data.get("contact")}
+Address: {data.get("address")}
+Due Amount: ₹{data.get("due", 0)}
+"""
+    return _document(doc_id, text, {"supplier_id": doc_id, "name": data.get("name")})
+
+
+def item_document(data: Dict, doc_id: str) -> Document:
+    batches = "\n".join(
+        f"- Batch No: {batch.get('batch_number')}, Expiry: {batch.get('Expiry')}, Qty: {batch.get('quantity')}"
+        for batch in data.get("batches") or []
+    )
+    text = f"""
+Item Name: {data.get("name")}
+Item ID: {doc_id}
+Category: {data.get("category")}
+Total Quantity: {data.get("stock_quantity")}
+Low Stock Threshold: {data.get("low_stock_threshold")}
+Batches:
+{batches}
+"""
+    return _document(doc_id, text, {"item_id": doc_id, "name": data.get("name"), "category": data.get("category")})
+
+
+def employee_document(data: Dict, doc_id: str) -> Document:
+    text = f"""
+Name: {data.get("name")}
+Employee ID: {doc_id}
+Collected: ₹{data.get("collected", 0)}
+Paid: ₹{data.get("paid", 0)}
+Phone: {data.get("phone", "")}
+"""
+    return _document(doc_id, text, {"employee_id": doc_id, "name": data.get("name")})
+
+
+def expense_document(data: Dict, doc_id: str) -> Document:
+    text = f"""
+Expense ID: {doc_id}
+Amount: ₹{data.get("amount")}
+Category: {data.get("category")}
+Paid By: {data.get("paid_by")}
+Remarks: {data.get("remarks", "")}
+Date: {_date(data.get("created_at"))}
+"""
+    return _document(doc_id, text, {
+        "expense_id": doc_id,
+        "category": data.get("category"),
+        "paid_by": data.get("paid_by"),
+        "expense_date": _timestamp(data.get("created_at")),
+    })
+
+
+def _flatten(data: Dict, prefix: str = "") -> Dict:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        else:
+            flat[name] = value
+    return flat
+
+
+def doc_counter_document(data: Dict, doc_id: str) -> Document:
+    # Counter docs are keyed by month (YYYY-MM) or by entity; their fields
+    # vary and nest, so list every value rather than a fixed template.
+    fields = "\n".join(
+        f"{key}: {value}" for key, value in sorted(_flatten(data).items())
+        if not key.endswith(("updated_at", "created_at"))
+    )
+    text = f"""
+Month: {doc_id}
+{fields}
+"""
+    return _document(doc_id, text, {"month": doc_id})
+
+
+# Qdrant collection -> (Firestore collection, formatter)
+SOURCES: Dict[str, Tuple[str, Callable[[Dict, str], Document]]] = {
+    "orders": ("Orders", order_document),
+    "clients": ("Clients", client_document),
+    "suppliers": ("Suppliers", supplier_document),
+    "items": ("Inventory Items", item_document),
+    "employees": ("Employees", employee_document),
+    "expenses": ("Expenses", expense_document),
+    "doc_counter": ("doc_counters", doc_counter_document),
+}
+
+# Payload fields indexed in Qdrant per collection ("keyword" or "datetime").
+# They are the fields the semantic tools accept as structured filters.
+PAYLOAD_INDEXES: Dict[str, Dict[str, str]] = {
+    "orders": {
+        "order_type": "keyword",
+        "client_id": "keyword",
+        "client": "keyword",
+        "supplier_id": "keyword",
+        "supplier": "keyword",
+        "status": "keyword",
+        "payment_status": "keyword",
+        "invoice_number": "keyword",
+        "challan_number": "keyword",
+        "order_date": "datetime",
+    },
+    "clients": {"name": "keyword"},
+    "suppliers": {"name": "keyword"},
+    "items": {"name": "keyword", "category": "keyword"},
+    "employees": {"name": "keyword"},
+    "expenses": {"category": "keyword", "paid_by": "keyword", "expense_date": "datetime"},
+    "doc_counter": {"month": "keyword"},
+}
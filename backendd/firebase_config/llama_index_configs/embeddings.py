@@ -0,0 +1,343 @@
+"""
+embeddings.py — the single embedding backend for search and indexing
+====================================================================
+
+Every vector in Qdrant comes from ``sentence-transformers/all-MiniLM-L6-v2``.
+This module decides how it is computed, and ``global_settings`` installs the
+result as ``Settings.embed_model`` for queries and index builds alike.
+
+1. ``EMBEDDING_BACKEND=local`` (default) runs the model in-process on CPU.
+   ``EMBEDDING_ST_BACKEND=onnx`` uses the ONNX runtime on sentence-transformers
+   versions that support it. Concurrent callers are micro-batched: requests
+   that arrive within ``EMBEDDING_BATCH_WAIT_MS`` of each other share one
+   ``encode`` call, up to ``EMBEDDING_MAX_BATCH`` texts.
+   ``EMBEDDING_BACKEND=hf_api`` keeps the Hugging Face Inference API.
+2. Both backends sit behind a persistent cache keyed by
+   ``sha256(model, kind, text)`` (SQLite at ``EMBEDDING_CACHE_PATH``, with an
+   in-memory LRU in front), so unchanged documents and repeated queries are
+   never embedded twice. Calls that reach the model are recorded as
+   ``embedding`` spans (``instrumentation.py``).
+
+It is the same model either way, so switching backends keeps existing
+collections valid.
+
+``EMBEDDING_BACKEND=hash`` (the default with ``OFFLINE_MODE=true``) is for
+benchmarks and offline runs: a deterministic hashed bag of words of the same
+dimension, no model and no network, uncached. Its vectors are not comparable
+with the model's, so never point it at a real collection.
+
+Public surface:
+    build_embed_model() -> BaseEmbedding
+    HashEmbedding       (offline backend)
+    EMBED_MODEL_NAME, EMBED_DIM
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+from cachetools import LRUCache
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from firebase_config import instrumentation
+
+logger = logging.getLogger(__name__)
+
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_DIM = 384
+
+OFFLINE_MODE = os.getenv("OFFLINE_MODE", "false").lower() == "true"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hash" if OFFLINE_MODE else "local")
+EMBEDDING_ST_BACKEND = os.getenv("EMBEDDING_ST_BACKEND", "torch")
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "..", ".cache", "embeddings.sqlite3"),
+)
+EMBEDDING_MEMORY_CACHE_SIZE = int(os.getenv("EMBEDDING_MEMORY_CACHE_SIZE", "20000"))
+
+
+# ---------------------------------------------------------------------------
+# Persistent cache
+# ---------------------------------------------------------------------------
+class EmbeddingCache:
+    """SQLite-backed vector cache with an in-memory LRU in front; safe across threads."""
+
+    def __init__(self, path: Optional[str], memory_size: int):
+        self.memory = LRUCache(maxsize=memory_size)
+        self.lock = threading.Lock()
+        self.conn = None
+        if path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self.conn = sqlite3.connect(path, check_same_thread=False)
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+                self.conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding cache disabled on disk ({path}): {e}")
+                self.conn = None
+
+    @staticmethod
+    def key(model: str, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self.lock:
+            missing = []
+            for key in keys:
+                vector = self.memory.get(key)
+                if vector is None:
+                    missing.append(key)
+                else:
+                    found[key] = vector
+            if missing and self.conn is not None:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = self.conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = array("f", blob).tolist()
+                        self.memory[key] = vector
+                        found[key] = vector
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        with self.lock:
+            for key, vector in items.items():
+                self.memory[key] = vector
+            if self.conn is not None and items:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, array("f", vector).tobytes()) for key, vector in items.items()],
+                )
+                self.conn.commit()
+
+
+# ---------------------------------------------------------------------------
+# Local model with micro-batching
+# ---------------------------------------------------------------------------
+class MicroBatcher:
+    """
+    Funnels ``encode`` calls from many threads into few model calls. A single
+    worker thread drains the pending queue, waiting up to ``wait_ms`` for
+    more requests to join before encoding them together.
+    """
+
+    def __init__(self, model_name: str, max_batch: int, wait_ms: float, backend: str):
+        self.model_name = model_name
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000
+        self.backend = backend
+        self.model = None
+        self.pending: List[tuple] = []
+        self.cond = threading.Condition()
+        self.worker: Optional[threading.Thread] = None
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+
+        started = time.perf_counter()
+        if self.backend != "torch":
+            self.model = SentenceTransformer(self.model_name, device="cpu", backend=self.backend)
+        else:
+            self.model = SentenceTransformer(self.model_name, device="cpu")
+        logger.info(f"Loaded {self.model_name} ({self.backend}) in {time.perf_counter() - started:.2f}s")
+
+    def _ensure_worker(self):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self.worker.start()
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        future: Future = Future()
+        with self.cond:
+            self._ensure_worker()
+            self.pending.append((texts, future))
+            self.cond.notify()
+        return future.result()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                # Give concurrent callers a moment to join this batch.
+                deadline = time.monotonic() + self.wait
+                while sum(len(t) for t, _ in self.pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                batch, size = [], 0
+                while self.pending and (not batch or size + len(self.pending[0][0]) <= self.max_batch):
+                    texts, future = self.pending.pop(0)
+                    batch.append((texts, future))
+                    size += len(texts)
+
+            try:
+                if self.model is None:
+                    self._load()
+                flat = [text for texts, _ in batch for text in texts]
+                vectors = self.model.encode(
+                    flat, batch_size=self.max_batch, normalize_embeddings=True, convert_to_numpy=True
+                ).tolist()
+                offset = 0
+                for texts, future in batch:
+                    future.set_result(vectors[offset:offset + len(texts)])
+                    offset += len(texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+class LocalBatchedEmbedding(BaseEmbedding):
+    """In-process sentence-transformers embedding with cross-request micro-batching."""
+
+    _batcher: MicroBatcher = PrivateAttr()
+
+    def __init__(self, model_name: str = EMBED_MODEL_NAME, **kwargs):
+        super().__init__(model_name=model_name, embed_batch_size=EMBEDDING_MAX_BATCH, **kwargs)
+        self._batcher = MicroBatcher(model_name, EMBEDDING_MAX_BATCH, EMBEDDING_BATCH_WAIT_MS, EMBEDDING_ST_BACKEND)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalBatchedEmbedding"
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._batcher.encode([query])[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._batcher.encode([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._batcher.encode(texts)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return await asyncio.to_thread(self._get_text_embedding, text)
+
+
+# ---------------------------------------------------------------------------
+# Offline hash embedding
+# ---------------------------------------------------------------------------
+class HashEmbedding(BaseEmbedding):
+    """
+    Deterministic bag-of-words embedding: each word (and word bigram) is hashed
+    to a signed bucket of an ``EMBED_DIM`` vector, which is then L2-normalised.
+    Texts sharing words score high, so retrieval behaves plausibly on
+    synthetic data.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(model_name="hash", embed_batch_size=EMBEDDING_MAX_BATCH, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    @staticmethod
+    def _embed(text: str) -> List[float]:
+        vector = [0.0] * EMBED_DIM
+        words = "".join(c if c.isalnum() else " " for c in text.lower()).split()
+        for token in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % EMBED_DIM
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = sum(v * v for v in vector) ** 0.5
+        if not norm:
+            vector[0], norm = 1.0, 1.0
+        return [v / norm for v in vector]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+# ---------------------------------------------------------------------------
+# Cache wrapper (any backend)
+# ---------------------------------------------------------------------------
+class CachedEmbedding(BaseEmbedding):
+    """Serves embeddings from ``EmbeddingCache`` and only sends misses to the inner model."""
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, cache: EmbeddingCache, **kwargs):
+        super().__init__(model_name=inner.model_name, embed_batch_size=inner.embed_batch_size, **kwargs)
+        self._inner = inner
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _cached(self, kind: str, texts: List[str]) -> List[List[float]]:
+        keys = [EmbeddingCache.key(self.model_name, kind, text) for text in texts]
+        found = self._cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        if missing:
+            with instrumentation.span("embedding", kind, texts=len(missing), cached=len(found)):
+                if kind == "query":
+                    vectors = [self._inner.get_query_embedding(texts[i]) for i in missing]
+                else:
+                    vectors = self._inner.get_text_embedding_batch([texts[i] for i in missing])
+            fresh = {keys[i]: vector for i, vector in zip(missing, vectors)}
+            self._cache.put_many(fresh)
+            found.update(fresh)
+        return [found[key] for key in keys]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._cached("query", [query])[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._cached("text", [text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._cached("text", texts)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return await asyncio.to_thread(self._get_text_embedding, text)
+
+
+def build_embed_model() -> BaseEmbedding:
+    """The configured backend wrapped in the persistent cache (the hash backend needs none)."""
+    if EMBEDDING_BACKEND == "hash":
+        return HashEmbedding()
+    if EMBEDDING_BACKEND == "hf_api":
+        from llama_index.embeddings.huggingface import HuggingFaceInferenceAPIEmbedding
+
+        inner = HuggingFaceInferenceAPIEmbedding(model_name=EMBED_MODEL_NAME, api_key=os.getenv("HUGGINGFACE_API_KEY"))
+    else:
+        inner = LocalBatchedEmbedding(EMBED_MODEL_NAME)
+    return CachedEmbedding(inner, EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_MEMORY_CACHE_SIZE))
@@ -47,42 +47,49 @@ import os
 import logging
 from dotenv import load_dotenv
 from llama_index.core import Settings
-from llama_index.embeddings.huggingface import HuggingFaceInferenceAPIEmbedding
 from qdrant_client import QdrantClient
 
+from firebase_config.llama_index_configs.embeddings import build_embed_model, EMBEDDING_BACKEND, OFFLINE_MODE
+
 # 🗝 Load env
 load_dotenv()
 
-# 🔐 Qdrant setup
+# 🔐 Qdrant setup: "cloud" (QDRANT_URL + QDRANT_API_KEY), "memory" (in-process,
+# empty at start; the default with OFFLINE_MODE=true) or "local" (on disk at QDRANT_PATH)
+QDRANT_MODE = os.getenv("QDRANT_MODE", "memory" if OFFLINE_MODE else "cloud").lower()
 QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+QDRANT_PATH = os.getenv("QDRANT_PATH", os.path.join(os.path.dirname(__file__), "..", "..", ".cache", "qdrant"))
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-if not QDRANT_URL or not QDRANT_API_KEY:
+# ✅ Initialize Qdrant client. Missing cloud credentials no longer fail the
+# import; global_settings() raises when the client is actually needed.
+qdrant_client = None
+if QDRANT_MODE == "memory":
+    qdrant_client = QdrantClient(location=":memory:")
+    logger.info("✅ Qdrant client initialized (in-memory)")
+elif QDRANT_MODE == "local":
+    qdrant_client = QdrantClient(path=QDRANT_PATH)
+    logger.info(f"✅ Qdrant client initialized (local, {QDRANT_PATH})")
+elif QDRANT_URL and QDRANT_API_KEY:
+    qdrant_client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+    logger.info("✅ Qdrant client initialized")
+else:
     logger.error("❌ QDRANT credentials missing")
-    raise ValueError("Set QDRANT_URL and QDRANT_API_KEY in .env")
-
-# ✅ Initialize Qdrant client
-qdrant_client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
-logger.info("✅ Qdrant client initialized")
-
-# ✅ Use Hugging Face Inference API for embeddings
-HF_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
-HF_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
-embed_model = HuggingFaceInferenceAPIEmbedding(
-    model_name=HF_MODEL,
-    api_key=HF_API_KEY
-)
+# ✅ One embedding model for queries and index builds (local by default, cached)
+embed_model = build_embed_model()
 
 Settings.embed_model = embed_model
 Settings.llm = None
 
-logger.info("☁️ Using Hugging Face Inference API for embeddings")
+logger.info(f"🧠 Embeddings: {EMBEDDING_BACKEND} backend")
 
 def global_settings():
+    if qdrant_client is None:
+        raise ValueError("Set QDRANT_URL and QDRANT_API_KEY in .env (or QDRANT_MODE=memory)")
     return {
         "embed_model": embed_model,
         "qdrant_client": qdrant_client
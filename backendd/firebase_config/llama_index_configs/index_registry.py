@@ -0,0 +1,129 @@
+"""
+index_registry.py — shared, lazily built LlamaIndex handles per Qdrant collection
+==============================================================================
+
+Building a ``QdrantVectorStore`` + ``StorageContext`` + ``VectorStoreIndex`` and
+then ``as_query_engine()`` costs hundreds of milliseconds. The semantic tools
+used to pay that on every call; now each collection's handles are built once,
+on first use, and shared by every request and sync job.
+
+- Thread-safe: one lock per collection, so concurrent agent threads build a
+  handle exactly once and never block each other across collections.
+- Self-invalidating: each entry remembers the configuration it was built from
+  (embedding model, Qdrant client, query-engine options). If that changes the
+  entry is rebuilt on the next access. Jobs that drop or recreate a collection
+  call ``invalidate(name)``.
+- ``warmup()`` builds every handle and runs one tiny retrieval at startup, so
+  the first user query doesn't pay for connection setup or model loading.
+
+Public surface:
+    get_index(name)          -> VectorStoreIndex
+    get_query_engine(name)   -> BaseQueryEngine
+    get_retriever(name, similarity_top_k=None) -> BaseRetriever
+    invalidate(name=None)    -> None
+    warmup(names=None)       -> dict  (name -> seconds or error)
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from llama_index.core import Settings, StorageContext, VectorStoreIndex
+from llama_index.vector_stores.qdrant import QdrantVectorStore
+
+from firebase_config.llama_index_configs.global_settings import global_settings
+
+logger = logging.getLogger(__name__)
+
+# Qdrant collection per semantic tool.
+COLLECTIONS = ("orders", "clients", "suppliers", "items", "employees", "expenses", "doc_counter")
+
+QUERY_ENGINE_OPTIONS = {"similarity_top_k": 2}
+
+_entries: Dict[str, Dict] = {}
+_locks: Dict[str, threading.Lock] = {name: threading.Lock() for name in COLLECTIONS}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(name: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(name, threading.Lock())
+
+
+def _fingerprint(name: str) -> tuple:
+    settings = global_settings()
+    return (
+        name,
+        id(settings["qdrant_client"]),
+        id(Settings.embed_model),
+        tuple(sorted(QUERY_ENGINE_OPTIONS.items())),
+    )
+
+
+def _entry(name: str) -> Dict:
+    fingerprint = _fingerprint(name)
+    entry = _entries.get(name)
+    if entry is not None and entry["fingerprint"] == fingerprint:
+        return entry
+
+    with _lock_for(name):
+        entry = _entries.get(name)
+        if entry is not None and entry["fingerprint"] == fingerprint:
+            return entry
+
+        started = time.perf_counter()
+        vector_store = QdrantVectorStore(client=global_settings()["qdrant_client"], collection_name=name)
+        storage_context = StorageContext.from_defaults(vector_store=vector_store)
+        index = VectorStoreIndex.from_vector_store(vector_store=vector_store, storage_context=storage_context)
+        entry = {
+            "fingerprint": fingerprint,
+            "index": index,
+            "retriever": index.as_retriever(**QUERY_ENGINE_OPTIONS),
+        }
+        _entries[name] = entry
+        logger.info(f"Built index handles for '{name}' in {time.perf_counter() - started:.3f}s")
+        return entry
+
+
+def get_index(name: str) -> VectorStoreIndex:
+    return _entry(name)["index"]
+
+
+def get_query_engine(name: str):
+    """Synthesizing query engine, built on first use. The agent's tools use retrievers instead."""
+    entry = _entry(name)
+    if "query_engine" not in entry:
+        with _lock_for(name):
+            entry.setdefault("query_engine", entry["index"].as_query_engine(**QUERY_ENGINE_OPTIONS))
+    return entry["query_engine"]
+
+
+def get_retriever(name: str, similarity_top_k: Optional[int] = None):
+    """Shared retriever; a custom ``similarity_top_k`` gets a cheap one-off retriever on the shared index."""
+    entry = _entry(name)
+    if similarity_top_k is None or similarity_top_k == QUERY_ENGINE_OPTIONS["similarity_top_k"]:
+        return entry["retriever"]
+    return entry["index"].as_retriever(similarity_top_k=similarity_top_k)
+
+
+def invalidate(name: Optional[str] = None):
+    """Drop cached handles for one collection (or all) so the next call rebuilds them."""
+    if name is None:
+        _entries.clear()
+    else:
+        _entries.pop(name, None)
+
+
+def warmup(names: Optional[Iterable[str]] = None) -> Dict[str, object]:
+    """Build handles and run one retrieval per collection; failures are reported, not raised."""
+    timings: Dict[str, object] = {}
+    for name in names or COLLECTIONS:
+        started = time.perf_counter()
+        try:
+            get_retriever(name).retrieve("warmup")
+            timings[name] = round(time.perf_counter() - started, 3)
+        except Exception as e:
+            logger.warning(f"Warmup failed for '{name}': {e}")
+            timings[name] = f"error: {e}"
+    return timings
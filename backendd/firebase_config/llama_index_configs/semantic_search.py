@@ -0,0 +1,237 @@
+"""
+semantic_search.py — retrieval-only search for the agent's semantic tools
+========================================================================
+
+The semantic tools used to call ``as_query_engine().query()``. With
+``Settings.llm = None`` that still ran response synthesis (against the mock
+LLM) and handed the agent a synthesized string, which the presentation pass
+then sent through Gemini again. These tools now retrieve and stop:
+top-k node texts with their metadata and similarity score, filtered by a
+minimum score, in a compact and deterministic format.
+
+Search is hybrid and filterable. Qdrant fuses a dense (embedding) search with a
+keyword search on the sparse vector (``sparse.py``), so exact codes such as
+invoice or batch numbers are found. Structured ``filters`` on indexed payload
+fields (``documents.PAYLOAD_INDEXES``) narrow both searches to a small
+candidate set before ranking.
+
+Each search is recorded as a ``retrieval`` span (``instrumentation.py``):
+embedding and Qdrant time, ``top_k``, hits and their scores.
+
+Tool input is either a plain query string or a dict / JSON object::
+
+    {"query": "purchase orders", "top_k": 5, "min_score": 0.3,
+     "filters": {"order_type": "purchase", "supplier_id": "S0004", "month": "2024-03"}}
+
+Public surface:
+    search(collection, query, top_k=None, min_score=None, filters=None) -> List[Dict]
+    build_filter(collection, filters)                                   -> Filter | None
+    format_hits(hits)                                                   -> str
+    semantic_tool_func(collection)                                      -> Callable[[str | dict], str]
+    SEMANTIC_TOP_K, SEMANTIC_MIN_SCORE
+"""
+
+import calendar
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from llama_index.core import Settings
+from llama_index.core.schema import MetadataMode
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+from qdrant_client.http.models import (
+    DatetimeRange,
+    FieldCondition,
+    Filter,
+    Fusion,
+    FusionQuery,
+    MatchAny,
+    MatchValue,
+    Prefetch,
+)
+
+from firebase_config import instrumentation
+from firebase_config.llama_index_configs.documents import PAYLOAD_INDEXES
+from firebase_config.llama_index_configs.global_settings import global_settings
+from firebase_config.llama_index_configs.sparse import SPARSE_VECTOR_NAME, query_vector
+from firebase_config.llama_index_configs.vector_points import has_sparse
+
+SEMANTIC_TOP_K = int(os.getenv("SEMANTIC_TOP_K", "5"))
+SEMANTIC_MIN_SCORE = float(os.getenv("SEMANTIC_MIN_SCORE", "0.3"))
+SEMANTIC_MAX_TOP_K = 20
+# Each side of a hybrid query fetches this many candidates per requested hit before fusion.
+HYBRID_PREFETCH_FACTOR = 4
+
+# Payload bookkeeping that means nothing to the agent.
+_HIDDEN_METADATA = {"content_hash", "_node_content", "_node_type", "document_id", "doc_id", "ref_doc_id"}
+
+
+class FilterError(ValueError):
+    """Unknown filter field or malformed value; the message is shown to the agent."""
+
+
+def _month_range(month: str) -> DatetimeRange:
+    try:
+        year, number = map(int, month.split("-"))
+        last_day = calendar.monthrange(year, number)[1]
+    except ValueError:
+        raise FilterError(f"month must look like YYYY-MM, got {month!r}")
+    return DatetimeRange(gte=f"{year:04d}-{number:02d}-01T00:00:00Z", lte=f"{year:04d}-{number:02d}-{last_day:02d}T23:59:59Z")
+
+
+def build_filter(collection: str, filters: Optional[Dict]) -> Optional[Filter]:
+    """
+    Turn ``{"order_type": "purchase", "supplier_id": "S0004", "month": "2024-03"}``
+    into a Qdrant filter over the collection's indexed payload fields. Lists
+    match any value; ``month`` / ``date_from`` / ``date_to`` apply to the
+    collection's date field.
+    """
+    if not filters:
+        return None
+    fields = PAYLOAD_INDEXES.get(collection, {})
+    date_field = next((field for field, kind in fields.items() if kind == "datetime"), None)
+    conditions = []
+    for key, value in filters.items():
+        if value in (None, "", []):
+            continue
+        if key in ("month", "date_from", "date_to"):
+            if date_field is None:
+                raise FilterError(f"{collection} has no date field to filter by {key}")
+            if key == "month":
+                date_range = _month_range(str(value))
+            elif key == "date_from":
+                date_range = DatetimeRange(gte=str(value))
+            else:
+                date_range = DatetimeRange(lte=str(value))
+            conditions.append(FieldCondition(key=date_field, range=date_range))
+        elif fields.get(key) == "keyword":
+            match = MatchAny(any=[str(v) for v in value]) if isinstance(value, list) else MatchValue(value=str(value))
+            conditions.append(FieldCondition(key=key, match=match))
+        else:
+            allowed = [f for f, kind in fields.items() if kind == "keyword"] + (["month", "date_from", "date_to"] if date_field else [])
+            raise FilterError(f"Cannot filter {collection} by '{key}'. Allowed: {', '.join(allowed)}")
+    return Filter(must=conditions) if conditions else None
+
+
+def search(
+    collection: str,
+    query: str,
+    top_k: Optional[int] = None,
+    min_score: Optional[float] = None,
+    filters: Optional[Dict] = None,
+) -> List[Dict]:
+    """
+    Filtered hybrid search. Dense candidates below ``min_score`` (cosine) are
+    dropped; keyword candidates are kept regardless, and the two lists are
+    fused with reciprocal rank fusion. Collections without the keyword vector
+    fall back to filtered dense search, where ``score`` is the cosine score.
+    """
+    top_k = max(1, min(int(top_k or SEMANTIC_TOP_K), SEMANTIC_MAX_TOP_K))
+    min_score = SEMANTIC_MIN_SCORE if min_score is None else float(min_score)
+    query_filter = build_filter(collection, filters)
+    client = global_settings()["qdrant_client"]
+    with instrumentation.span("retrieval", collection, top_k=top_k, filtered=query_filter is not None) as attrs:
+        started = time.perf_counter()
+        dense = Settings.embed_model.get_query_embedding(query)
+        embedded = time.perf_counter()
+        response = _query(client, collection, query, dense, top_k, min_score, query_filter)
+        attrs["embed_ms"] = round((embedded - started) * 1000, 2)
+        attrs["qdrant_ms"] = round((time.perf_counter() - embedded) * 1000, 2)
+        attrs["hits"] = len(response.points)
+        attrs["scores"] = [round(point.score, 3) for point in response.points]
+
+    hits = []
+    for point in response.points:
+        node = metadata_dict_to_node(point.payload)
+        hits.append({
+            "id": point.payload.get("doc_id"),
+            "score": round(point.score, 3),
+            "metadata": {k: v for k, v in point.payload.items() if k not in _HIDDEN_METADATA},
+            "text": node.get_content(metadata_mode=MetadataMode.NONE),
+        })
+    return hits
+
+
+def _query(client, collection: str, query: str, dense: List[float], top_k: int, min_score: float, query_filter):
+    """The hybrid (RRF) query, or plain dense search for collections without the keyword vector."""
+    if has_sparse(collection):
+        candidates = top_k * HYBRID_PREFETCH_FACTOR
+        return client.query_points(
+            collection_name=collection,
+            prefetch=[
+                Prefetch(query=dense, filter=query_filter, limit=candidates, score_threshold=min_score),
+                Prefetch(query=query_vector(query), using=SPARSE_VECTOR_NAME, filter=query_filter, limit=candidates),
+            ],
+            query=FusionQuery(fusion=Fusion.RRF),
+            limit=top_k,
+            with_payload=True,
+        )
+    return client.query_points(
+        collection_name=collection,
+        query=dense,
+        query_filter=query_filter,
+        limit=top_k,
+        score_threshold=min_score,
+        with_payload=True,
+    )
+
+
+def format_hits(hits: List[Dict]) -> str:
+    if not hits:
+        return "No matching records found."
+    blocks = []
+    for rank, hit in enumerate(hits, start=1):
+        blocks.append(f"[{rank}] id={hit['id']} score={hit['score']}\n{hit['text']}")
+    return "\n\n".join(blocks)
+
+
+def _parse_input(raw: Any) -> Dict:
+    if isinstance(raw, dict):
+        return raw
+    text = str(raw or "").strip()
+    if text.startswith("{"):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pass
+    return {"query": text}
+
+
+def semantic_tool_func(collection: str) -> Callable[[Any], str]:
+    """A LangChain ``Tool`` function searching ``collection``."""
+
+    def run(raw: Any) -> str:
+        params = _parse_input(raw)
+        query = params.get("query")
+        if not query:
+            return "Please provide a search query."
+        try:
+            return format_hits(
+                search(collection, query, params.get("top_k"), params.get("min_score"), params.get("filters"))
+            )
+        except FilterError as e:
+            return str(e)
+        except Exception as e:
+            return f"Error searching {collection}: {e}"
+
+    # Typed arguments for function-calling agents (function_agent.py).
+    fields = PAYLOAD_INDEXES.get(collection, {})
+    filter_fields = [field for field, kind in fields.items() if kind == "keyword"]
+    if "datetime" in fields.values():
+        filter_fields += ["month", "date_from", "date_to"]
+    run.parameters_schema = {
+        "type": "OBJECT",
+        "properties": {
+            "query": {"type": "STRING"},
+            "top_k": {"type": "INTEGER"},
+            "min_score": {"type": "NUMBER"},
+            "filters": {
+                "type": "OBJECT",
+                "description": "Exact-match filters; month is YYYY-MM, date_from / date_to are ISO dates.",
+                "properties": {field: {"type": "STRING"} for field in filter_fields},
+            },
+        },
+        "required": ["query"],
+    }
+    return run
@@ -0,0 +1,70 @@
+"""
+sparse.py — keyword (BM25-style) sparse vectors for hybrid search
+================================================================
+
+Invoice numbers, batch numbers and item codes embed poorly: ``INV-2024/031``
+and ``INV-2024/013`` land next to each other in dense space. Alongside the
+dense vector every point therefore carries a sparse keyword vector named
+``SPARSE_VECTOR_NAME``:
+
+- tokens are lower-cased alphanumeric runs. A compound code such as
+  ``inv-2024/031`` is kept whole *and* split into its parts, so both the exact
+  code and its pieces match;
+- each token maps to a stable index (CRC32), with no vocabulary to maintain;
+- document weights are saturated term frequencies (BM25's ``k1`` term). The
+  collection is created with Qdrant's IDF modifier, so Qdrant applies the
+  inverse document frequency at query time. Together that is BM25 without
+  length normalisation, which matters little for short records.
+
+Public surface:
+    SPARSE_VECTOR_NAME
+    tokenize(text)         -> List[str]
+    document_vector(text)  -> SparseVector
+    query_vector(text)     -> SparseVector
+"""
+
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List
+
+from qdrant_client.http.models import SparseVector
+
+SPARSE_VECTOR_NAME = "text-sparse"
+
+BM25_K1 = 1.2
+
+_COMPOUND = re.compile(r"[a-z0-9]+(?:[-/.][a-z0-9]+)*")
+_PART = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for compound in _COMPOUND.findall((text or "").lower()):
+        tokens.append(compound)
+        parts = _PART.findall(compound)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def _index(token: str) -> int:
+    return zlib.crc32(token.encode("utf-8")) & 0x7FFFFFFF
+
+
+def _vector(weights: Dict[int, float]) -> SparseVector:
+    indices = sorted(weights)
+    return SparseVector(indices=indices, values=[weights[i] for i in indices])
+
+
+def document_vector(text: str) -> SparseVector:
+    weights: Dict[int, float] = {}
+    for token, tf in Counter(tokenize(text)).items():
+        index = _index(token)
+        # Distinct tokens can share a CRC32 bucket; sum them rather than overwrite.
+        weights[index] = weights.get(index, 0.0) + tf * (BM25_K1 + 1) / (tf + BM25_K1)
+    return _vector(weights)
+
+
+def query_vector(text: str) -> SparseVector:
+    return _vector({_index(token): 1.0 for token in set(tokenize(text))})
@@ -0,0 +1,168 @@
+"""
+vector_build.py — incremental, resumable (re)builds of the Qdrant collections
+============================================================================
+
+The ``build_*_index.py`` scripts used to load a whole collection with
+``get_all_*()`` and re-embed every record through
+``VectorStoreIndex.from_documents``. A build now:
+
+1. Streams the Firestore collection in document-id order, ``VECTOR_BUILD_PAGE_SIZE``
+   records per page, so memory stays bounded by one page.
+2. Formats each record (``documents.py``) and compares its ``content_hash``
+   with the hash stored on its Qdrant point. Unchanged records are skipped —
+   no embedding, no write.
+3. Splits the changed records into ``VECTOR_WRITE_BATCH_SIZE`` batches and
+   writes them on ``VECTOR_BUILD_WORKERS`` threads (embed + upsert under
+   deterministic ids, see ``vector_points.py``). Each batch is retried with
+   exponential backoff.
+4. After each page, checkpoints the last document id to
+   ``vector_build_state/{collection}``. An interrupted build resumes after that
+   id. A completed build clears the cursor. A full (non-resumed) pass also
+   deletes points whose document no longer exists.
+
+Usage::
+
+    python -m firebase_config.llama_index_configs.vector_build [collection ...] [--restart] [--recreate] [--workers N]
+
+``--recreate`` drops the collection first. Use it once after a schema change,
+such as the keyword vector used by hybrid search.
+
+Public surface:
+    build_collection(name, restart=False, recreate=False, workers=..., page_size=...) -> Dict (report)
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from firebase_config.config import db
+from firebase_config.llama_index_configs.documents import SOURCES
+from firebase_config.llama_index_configs.global_settings import global_settings
+from firebase_config.llama_index_configs.index_registry import invalidate
+from firebase_config.llama_index_configs.vector_points import (
+    VECTOR_WRITE_BATCH_SIZE,
+    content_hash,
+    ensure_collection,
+    point_id,
+    prune,
+    stored_hashes,
+    write_documents,
+)
+
+logger = logging.getLogger(__name__)
+
+VECTOR_BUILD_PAGE_SIZE = int(os.getenv("VECTOR_BUILD_PAGE_SIZE", "500"))
+VECTOR_BUILD_WORKERS = int(os.getenv("VECTOR_BUILD_WORKERS", "4"))
+VECTOR_BUILD_RETRIES = int(os.getenv("VECTOR_BUILD_RETRIES", "4"))
+
+STATE_COLLECTION = "vector_build_state"
+
+
+def _with_retry(fn, *args, attempts: int = VECTOR_BUILD_RETRIES, **kwargs):
+    delay = 1.0
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            logger.warning(f"Attempt {attempt}/{attempts} failed, retrying in {delay:.0f}s: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+
+def _pages(source: str, page_size: int, cursor: Optional[str]):
+    query = db.collection(source).order_by(FieldPath.document_id())
+    last = db.collection(source).document(cursor) if cursor else None
+    while True:
+        page = query.limit(page_size)
+        if last is not None:
+            page = page.start_after(last)
+        docs = list(page.stream())
+        if docs:
+            yield docs
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+
+
+def build_collection(
+    name: str,
+    restart: bool = False,
+    recreate: bool = False,
+    workers: int = VECTOR_BUILD_WORKERS,
+    page_size: int = VECTOR_BUILD_PAGE_SIZE,
+) -> Dict:
+    """Bring one Qdrant collection up to date with its Firestore source."""
+    source, formatter = SOURCES[name]
+    if recreate:
+        # Schema changes (e.g. adding the keyword vector) need a fresh collection.
+        # Unchanged text is re-embedded from the local embedding cache.
+        global_settings()["qdrant_client"].delete_collection(name)
+        invalidate(name)
+        restart = True
+    ensure_collection(name)
+    state_ref = db.collection(STATE_COLLECTION).document(name)
+    state = state_ref.get()
+    state = state.to_dict() if state.exists and not restart else {}
+    cursor = state.get("cursor")
+    resumed = bool(cursor)
+
+    report = {"collection": name, "resumed_from": cursor, "scanned": 0, "unchanged": 0, "written": 0, "pruned": 0}
+    live_point_ids = set()
+    started = time.perf_counter()
+    state_ref.set({"status": "running", "started_at": datetime.now(timezone.utc)}, merge=True)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"build-{name}") as pool:
+        for docs in _pages(source, page_size, cursor):
+            documents = [formatter(doc.to_dict() or {}, doc.id) for doc in docs]
+            live_point_ids.update(point_id(name, document.doc_id) for document in documents)
+            stored = _with_retry(stored_hashes, name, [document.doc_id for document in documents])
+            changed = [d for d in documents if stored.get(d.doc_id) != content_hash(d)]
+
+            batches = [changed[i:i + VECTOR_WRITE_BATCH_SIZE] for i in range(0, len(changed), VECTOR_WRITE_BATCH_SIZE)]
+            for future in [pool.submit(_with_retry, write_documents, name, batch) for batch in batches]:
+                future.result()
+
+            report["scanned"] += len(documents)
+            report["unchanged"] += len(documents) - len(changed)
+            report["written"] += len(changed)
+            # Checkpoint only once every batch of the page is in Qdrant.
+            state_ref.set({"cursor": docs[-1].id, "progress": report, "updated_at": datetime.now(timezone.utc)}, merge=True)
+            logger.info(f"📄 {name}: {report['scanned']} scanned, {report['written']} written")
+
+    if not resumed:
+        report["pruned"] = prune(name, live_point_ids)
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    state_ref.set(
+        {"status": "complete", "cursor": None, "progress": report, "completed_at": datetime.now(timezone.utc)},
+        merge=True,
+    )
+    logger.info(f"✅ {name} index up to date: {report}")
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Incrementally (re)build Qdrant collections from Firestore.")
+    parser.add_argument("collections", nargs="*", help=f"any of {', '.join(SOURCES)} (default: all)")
+    parser.add_argument("--restart", action="store_true", help="ignore a saved checkpoint and scan from the start")
+    parser.add_argument("--recreate", action="store_true", help="drop and recreate the collection with the current schema")
+    parser.add_argument("--workers", type=int, default=VECTOR_BUILD_WORKERS)
+    parser.add_argument("--page-size", type=int, default=VECTOR_BUILD_PAGE_SIZE)
+    args = parser.parse_args()
+    unknown = [name for name in args.collections if name not in SOURCES]
+    if unknown:
+        parser.error(f"unknown collections: {', '.join(unknown)}")
+    reports = [
+        build_collection(name, restart=args.restart, recreate=args.recreate, workers=args.workers, page_size=args.page_size)
+        for name in (args.collections or SOURCES)
+    ]
+    print(json.dumps(reports, indent=2, default=str))
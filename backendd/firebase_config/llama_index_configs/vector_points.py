@@ -0,0 +1,267 @@
+"""
+vector_points.py — one Qdrant point per Firestore document
+==========================================================
+
+Every Firestore document maps to exactly one Qdrant point whose id is
+``uuid5("qdrant://{collection}/{doc_id}")``. The point carries the dense
+vector, plus the keyword vector from ``sparse.py`` when the collection has one. Re-syncing a modified document is
+therefore an in-place upsert, deletes address real point ids, and a
+collection's size equals its live document count.
+
+Points written before deterministic ids (random UUIDs from
+``index.insert`` / ``from_documents``) are cleaned up two ways:
+
+- ``write_documents`` drops any other point carrying the same ``doc_id``
+  whenever a document is written or removed;
+- ``dedupe`` re-writes every live document under its deterministic id and
+  deletes every other point — run it once per collection::
+
+      python -m firebase_config.llama_index_configs.vector_points            # dry run, all
+      python -m firebase_config.llama_index_configs.vector_points --apply orders
+
+Public surface:
+    ensure_collection(collection)                    -> None  (vectors + payload indexes)
+    has_sparse(collection)                           -> bool
+    point_id(collection, doc_id)                     -> str
+    content_hash(document)                           -> str
+    stored_hashes(collection, doc_ids)               -> Dict  (doc_id -> hash)
+    to_nodes(collection, documents)                  -> List[TextNode]
+    embed_nodes(nodes)                               -> List[TextNode]
+    write_documents(collection, documents, removed)  -> Dict  (counts)
+    prune(collection, keep_ids, apply=True)          -> int   (stale points)
+    dedupe(collection, apply=False)                  -> Dict  (report)
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import uuid
+from typing import Dict, Iterable, List, Sequence
+
+from llama_index.core import Settings
+from llama_index.core.schema import Document, MetadataMode, NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+from qdrant_client.http.models import (
+    Distance,
+    FieldCondition,
+    Filter,
+    FilterSelector,
+    HasIdCondition,
+    MatchAny,
+    Modifier,
+    PayloadSchemaType,
+    PointIdsList,
+    PointStruct,
+    SparseVectorParams,
+    VectorParams,
+)
+
+from firebase_config.llama_index_configs.documents import PAYLOAD_INDEXES, SOURCES
+from firebase_config.llama_index_configs.embeddings import EMBED_DIM
+from firebase_config.llama_index_configs.global_settings import global_settings
+from firebase_config.llama_index_configs.sparse import SPARSE_VECTOR_NAME, document_vector
+
+logger = logging.getLogger(__name__)
+
+VECTOR_WRITE_BATCH_SIZE = int(os.getenv("VECTOR_WRITE_BATCH_SIZE", "64"))
+
+
+def ensure_collection(name: str):
+    """Create the collection (dense + sparse vectors) if missing and make sure its payload indexes exist."""
+    client = global_settings()["qdrant_client"]
+    try:
+        info = client.get_collection(name)
+    except Exception:
+        client.create_collection(
+            name,
+            vectors_config=VectorParams(size=EMBED_DIM, distance=Distance.COSINE),
+            sparse_vectors_config={SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)},
+        )
+        logger.info(f"📦 Created Qdrant '{name}' collection")
+        info = client.get_collection(name)
+    if SPARSE_VECTOR_NAME not in (info.config.params.sparse_vectors or {}):
+        logger.warning(
+            f"Qdrant '{name}' has no keyword vector; search stays dense-only until it is recreated "
+            f"(python -m firebase_config.llama_index_configs.vector_build {name} --recreate)"
+        )
+
+    indexed = set((info.payload_schema or {}).keys())
+    for field, kind in PAYLOAD_INDEXES.get(name, {}).items():
+        if field not in indexed:
+            client.create_payload_index(
+                name,
+                field_name=field,
+                field_schema=PayloadSchemaType.DATETIME if kind == "datetime" else PayloadSchemaType.KEYWORD,
+            )
+            logger.info(f"🔎 Indexed payload field '{field}' ({kind}) on '{name}'")
+    _sparse_support.pop(name, None)
+
+
+_sparse_support: Dict[str, bool] = {}
+
+
+def has_sparse(collection: str) -> bool:
+    """Whether the collection carries the keyword vector (collections created before hybrid search don't)."""
+    if collection not in _sparse_support:
+        info = global_settings()["qdrant_client"].get_collection(collection)
+        _sparse_support[collection] = SPARSE_VECTOR_NAME in (info.config.params.sparse_vectors or {})
+    return _sparse_support[collection]
+
+
+def point_id(collection: str, doc_id: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"qdrant://{collection}/{doc_id}"))
+
+
+def content_hash(document: Document) -> str:
+    """Fingerprint of what gets stored; stored in the payload as ``content_hash``."""
+    metadata = json.dumps(document.metadata, sort_keys=True, default=str)
+    return hashlib.sha256(f"{document.text}\0{metadata}".encode("utf-8")).hexdigest()
+
+
+def to_nodes(collection: str, documents: Iterable[Document]) -> List[TextNode]:
+    nodes = []
+    for document in documents:
+        node = TextNode(
+            id_=point_id(collection, document.doc_id),
+            text=document.text,
+            metadata={**document.metadata, "content_hash": content_hash(document)},
+            excluded_embed_metadata_keys=[*document.excluded_embed_metadata_keys, "content_hash"],
+            excluded_llm_metadata_keys=[*document.excluded_llm_metadata_keys, "content_hash"],
+        )
+        node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=document.doc_id)
+        nodes.append(node)
+    return nodes
+
+
+def embed_nodes(nodes: List[TextNode]) -> List[TextNode]:
+    embeddings = Settings.embed_model.get_text_embedding_batch(
+        [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    )
+    for node, embedding in zip(nodes, embeddings):
+        node.embedding = embedding
+    return nodes
+
+
+def write_documents(collection: str, documents: Sequence[Document] = (), removed: Sequence[str] = ()) -> Dict:
+    """
+    Upsert ``documents`` and delete ``removed`` doc ids. Any other point
+    carrying one of these doc ids (legacy random-id duplicates) is removed too.
+    Blocking; embeds only the given documents.
+    """
+    client = global_settings()["qdrant_client"]
+    nodes = embed_nodes(to_nodes(collection, documents)) if documents else []
+    if nodes:
+        sparse = has_sparse(collection)
+        # Payload layout matches QdrantVectorStore so retrievers read these points as usual.
+        client.upsert(
+            collection_name=collection,
+            points=[
+                PointStruct(
+                    id=node.node_id,
+                    # "" is Qdrant's default (unnamed) dense vector.
+                    vector={"": node.embedding, SPARSE_VECTOR_NAME: document_vector(node.text)}
+                    if sparse else node.embedding,
+                    payload=node_to_metadata_dict(node, remove_text=False, flat_metadata=False),
+                )
+                for node in nodes
+            ],
+        )
+
+    doc_ids = [document.doc_id for document in documents] + list(removed)
+    if doc_ids:
+        client.delete(
+            collection_name=collection,
+            points_selector=FilterSelector(
+                filter=Filter(
+                    must=[FieldCondition(key="doc_id", match=MatchAny(any=doc_ids))],
+                    must_not=[HasIdCondition(has_id=[node.node_id for node in nodes])] if nodes else None,
+                )
+            ),
+        )
+    return {"upserted": len(nodes), "deleted": len(removed)}
+
+
+def stored_hashes(collection: str, doc_ids: Sequence[str]) -> Dict[str, str]:
+    """``content_hash`` of the points currently stored for ``doc_ids`` (missing ids are absent)."""
+    if not doc_ids:
+        return {}
+    by_point = {point_id(collection, doc_id): doc_id for doc_id in doc_ids}
+    points = global_settings()["qdrant_client"].retrieve(
+        collection_name=collection, ids=list(by_point), with_payload=["content_hash"], with_vectors=False
+    )
+    return {
+        by_point[str(point.id)]: point.payload.get("content_hash")
+        for point in points
+        if point.payload and point.payload.get("content_hash")
+    }
+
+
+def prune(collection: str, keep_ids: set, apply: bool = True) -> int:
+    """Delete (or with ``apply=False`` just count) every point whose id is not in ``keep_ids``."""
+    client = global_settings()["qdrant_client"]
+    stale: List = []
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection, limit=1000, offset=offset, with_payload=False, with_vectors=False
+        )
+        stale.extend(point.id for point in points if str(point.id) not in keep_ids)
+        if offset is None:
+            break
+    if apply:
+        for start in range(0, len(stale), 1000):
+            client.delete(collection_name=collection, points_selector=PointIdsList(points=stale[start:start + 1000]))
+    return len(stale)
+
+
+def dedupe(collection: str, apply: bool = False) -> Dict:
+    """
+    Bring ``collection`` to one point per live Firestore document. The dry run
+    only counts; ``apply=True`` re-writes live documents under deterministic
+    ids (embeddings come from the cache for unchanged text) and deletes the rest.
+    """
+    from firebase_config.config import db
+
+    source, formatter = SOURCES[collection]
+    client = global_settings()["qdrant_client"]
+    points_before = client.count(collection_name=collection, exact=True).count
+
+    live_ids = set()
+    batch: List[Document] = []
+    for snapshot in db.collection(source).stream():
+        live_ids.add(point_id(collection, snapshot.id))
+        if apply:
+            batch.append(formatter(snapshot.to_dict() or {}, snapshot.id))
+            if len(batch) >= VECTOR_WRITE_BATCH_SIZE:
+                write_documents(collection, batch)
+                batch = []
+    if apply and batch:
+        write_documents(collection, batch)
+
+    stale = prune(collection, live_ids, apply=apply)
+
+    report = {
+        "collection": collection,
+        "applied": apply,
+        "live_documents": len(live_ids),
+        "points_before": points_before,
+        "stale_points": stale,
+        "points_after": client.count(collection_name=collection, exact=True).count if apply else None,
+    }
+    logger.info(f"🧹 dedupe {collection}: {report}")
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Collapse Qdrant collections to one point per Firestore document.")
+    parser.add_argument("collections", nargs="*", help=f"any of {', '.join(SOURCES)} (default: all)")
+    parser.add_argument("--apply", action="store_true", help="write changes (default is a dry run)")
+    args = parser.parse_args()
+    unknown = [name for name in args.collections if name not in SOURCES]
+    if unknown:
+        parser.error(f"unknown collections: {', '.join(unknown)}")
+    reports = [dedupe(name, apply=args.apply) for name in (args.collections or SOURCES)]
+    print(json.dumps(reports, indent=2))
@@ -0,0 +1,366 @@
+"""
+vector_sync.py — one incremental Firestore -> Qdrant sync service
+================================================================
+
+Replaces the seven per-collection ``*_sync.py`` listeners, which re-embedded
+every document in every snapshot (``docs`` instead of ``changes``), inserted a
+fresh vector each time, and never managed to delete anything.
+
+How it works:
+
+1. One ``on_snapshot`` watch per collection, all in a single process. The
+   callback only records *changes* — ADDED/MODIFIED as a pending upsert,
+   REMOVED as a pending delete — keyed by document id, so a document that
+   changes ten times before the next flush is embedded once.
+2. A flusher thread per collection drains the pending set every
+   ``VECTOR_SYNC_FLUSH_SECONDS`` (or as soon as ``VECTOR_SYNC_BATCH_SIZE``
+   changes are waiting): one batched embedding call and one upsert under
+   deterministic point ids (see ``vector_points.py``), plus one delete for
+   removed documents. Failed batches are put back and retried with backoff.
+3. After every flush the collection's watermark (newest ``updated_at`` that is
+   safely in Qdrant) and its lag metrics are written to
+   ``vector_sync_state/{collection}``. On restart the initial snapshot does
+   not re-queue documents at or below the watermark. Some writes (counter
+   ``Increment``s, for one) change a document without touching ``updated_at``,
+   so those documents are rendered and compared with the ``content_hash``
+   stored in Qdrant, in batches, and only the ones that differ are embedded.
+4. Documents deleted while the service was down never produce a ``REMOVED``
+   event (the initial snapshot only holds survivors), so once that snapshot is
+   flushed, every Qdrant point whose document is not in it is pruned.
+
+Metrics (per collection): pending, oldest_pending_seconds, processed, deleted,
+errors, last_flush_at, last_lag_seconds, max_lag_seconds, watermark. They are
+served as JSON on ``VECTOR_SYNC_METRICS_PORT`` when set, and read by
+``GET /api/v1/vector-sync/status``.
+
+Run it with::
+
+    python -m firebase_config.llama_index_configs.vector_sync [collection ...]
+
+Public surface:
+    run(names=None)                  -> None (blocks)
+    CollectionSync                   (one collection's watch + flusher)
+    STATE_COLLECTION
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Optional
+
+from firebase_config.config import db
+from firebase_config.llama_index_configs.documents import SOURCES
+from firebase_config.llama_index_configs.vector_points import (
+    content_hash, ensure_collection, point_id, prune, stored_hashes, write_documents,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+VECTOR_SYNC_BATCH_SIZE = int(os.getenv("VECTOR_SYNC_BATCH_SIZE", "64"))
+VECTOR_SYNC_FLUSH_SECONDS = float(os.getenv("VECTOR_SYNC_FLUSH_SECONDS", "2"))
+VECTOR_SYNC_MAX_BACKOFF_SECONDS = float(os.getenv("VECTOR_SYNC_MAX_BACKOFF_SECONDS", "60"))
+VECTOR_SYNC_HEARTBEAT_SECONDS = float(os.getenv("VECTOR_SYNC_HEARTBEAT_SECONDS", "30"))
+VECTOR_SYNC_METRICS_PORT = os.getenv("VECTOR_SYNC_METRICS_PORT")
+
+STATE_COLLECTION = "vector_sync_state"
+
+
+def _utc(value) -> Optional[datetime]:
+    """Firestore timestamps are tz-aware; older writes used naive utcnow()."""
+    if not isinstance(value, datetime):
+        return None
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class CollectionSync:
+    """Watch one Firestore collection and mirror its changes into one Qdrant collection."""
+
+    def __init__(self, name: str, state_ref=None):
+        self.name = name
+        self.source, self.formatter = SOURCES[name]
+        # Where progress is checkpointed; benchmarks pass an in-memory stand-in.
+        self.state_ref = state_ref or db.collection(STATE_COLLECTION).document(name)
+        # doc id -> {"data": dict | None (delete), "changed_at": datetime, "queued_at": float, "resumed": bool}
+        self.pending: Dict[str, Dict] = {}
+        # Initial-snapshot docs at or below the watermark, still to compare by content hash.
+        self.resumed: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.initial_snapshot = True
+        # Doc ids of the initial snapshot plus any added since; None once pruned.
+        self.live_ids: Optional[set] = None
+        self.watch = None
+        self.thread: Optional[threading.Thread] = None
+
+        state = self.state_ref.get()
+        state = state.to_dict() if state.exists else {}
+        self.watermark: Optional[datetime] = _utc(state.get("watermark"))
+        self.metrics = {
+            "processed": state.get("processed", 0),
+            "deleted": state.get("deleted", 0),
+            "errors": state.get("errors", 0),
+            "skipped_on_resume": 0,
+            "last_flush_at": None,
+            "last_lag_seconds": None,
+            "max_lag_seconds": state.get("max_lag_seconds", 0),
+            "last_error": None,
+        }
+
+    # ------------------------------------------------------------------
+    # Firestore side (runs on the watch thread — keep it cheap)
+    # ------------------------------------------------------------------
+    def on_snapshot(self, docs, changes, read_time):
+        received = _utc(read_time) or datetime.now(timezone.utc)
+        with self.lock:
+            if self.initial_snapshot and docs is not None:
+                self.live_ids = {doc.id for doc in docs}
+            for change in changes:
+                doc = change.document
+                # A live change supersedes any resume check still waiting.
+                self.resumed.pop(doc.id, None)
+                if change.type.name == "REMOVED":
+                    if self.live_ids is not None:
+                        self.live_ids.discard(doc.id)
+                    self._queue(doc.id, None, received)
+                    continue
+                if self.live_ids is not None:
+                    self.live_ids.add(doc.id)
+                data = doc.to_dict() or {}
+                changed_at = _utc(data.get("updated_at")) or _utc(data.get("created_at"))
+                if self.initial_snapshot and self.watermark and changed_at and changed_at <= self.watermark:
+                    self.resumed[doc.id] = data
+                    continue
+                self._queue(doc.id, data, changed_at or received)
+            self.initial_snapshot = False
+            full = len(self.pending) >= VECTOR_SYNC_BATCH_SIZE
+        if full:
+            self.wake.set()
+
+    def _queue(self, doc_id: str, data: Optional[Dict], changed_at: datetime, resumed: bool = False):
+        previous = self.pending.get(doc_id)
+        self.pending[doc_id] = {
+            "data": data,
+            "changed_at": changed_at,
+            "queued_at": previous["queued_at"] if previous else time.time(),
+            "resumed": resumed,
+        }
+
+    # ------------------------------------------------------------------
+    # Qdrant side (runs on the flusher thread)
+    # ------------------------------------------------------------------
+    def _take_batch(self) -> Dict[str, Dict]:
+        with self.lock:
+            ids = list(self.pending)[:VECTOR_SYNC_BATCH_SIZE]
+            return {doc_id: self.pending.pop(doc_id) for doc_id in ids}
+
+    def _requeue(self, batch: Dict[str, Dict]):
+        with self.lock:
+            for doc_id, entry in batch.items():
+                # A newer change that arrived meanwhile wins.
+                self.pending.setdefault(doc_id, entry)
+
+    def _apply(self, batch: Dict[str, Dict]) -> int:
+        documents = [
+            self.formatter(entry["data"], doc_id) for doc_id, entry in batch.items() if entry["data"] is not None
+        ]
+        removed = [doc_id for doc_id, entry in batch.items() if entry["data"] is None]
+        return write_documents(self.name, documents, removed)["upserted"]
+
+    def recheck_resumed(self) -> int:
+        """Queue resumed documents whose content no longer matches Qdrant; returns how many."""
+        queued = 0
+        while True:
+            with self.lock:
+                ids = list(self.resumed)[:VECTOR_SYNC_BATCH_SIZE]
+                batch = {doc_id: self.resumed.pop(doc_id) for doc_id in ids}
+            if not batch:
+                if queued:
+                    logger.info(f"🔁 {self.name}: {queued} documents changed while offline")
+                return queued
+            try:
+                hashes = {doc_id: content_hash(self.formatter(data, doc_id)) for doc_id, data in batch.items()}
+                stored = stored_hashes(self.name, list(batch))
+            except Exception:
+                with self.lock:
+                    for doc_id, data in batch.items():
+                        self.resumed.setdefault(doc_id, data)
+                raise
+            now = datetime.now(timezone.utc)
+            with self.lock:
+                for doc_id, data in batch.items():
+                    if stored.get(doc_id) == hashes[doc_id]:
+                        self.metrics["skipped_on_resume"] += 1
+                    elif doc_id not in self.pending:
+                        # Changed while offline without a newer updated_at.
+                        self._queue(doc_id, data, now, resumed=True)
+                        queued += 1
+
+    def flush(self) -> int:
+        """Drain everything pending; returns the number of documents applied."""
+        applied = 0
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return applied
+            try:
+                upserted = self._apply(batch)
+            except Exception as e:
+                self._requeue(batch)
+                self.metrics["errors"] += 1
+                self.metrics["last_error"] = str(e)
+                self._save_state()
+                raise
+
+            now = datetime.now(timezone.utc)
+            # Resume re-checks carry no real change time: they neither move the
+            # watermark nor count as lag.
+            live = [entry for entry in batch.values() if not entry.get("resumed")]
+            if live:
+                lags = [(now - entry["changed_at"]).total_seconds() for entry in live]
+                newest = max(entry["changed_at"] for entry in live)
+                with self.lock:
+                    # Only advance while nothing older is still waiting.
+                    oldest_waiting = min(
+                        (e["changed_at"] for e in self.pending.values() if not e.get("resumed")), default=None
+                    )
+                if oldest_waiting is None or newest < oldest_waiting:
+                    self.watermark = max(self.watermark, newest) if self.watermark else newest
+                self.metrics["last_lag_seconds"] = round(max(lags), 3)
+                self.metrics["max_lag_seconds"] = round(max(self.metrics["max_lag_seconds"], max(lags)), 3)
+
+            self.metrics["processed"] += upserted
+            self.metrics["deleted"] += len(batch) - upserted
+            self.metrics["last_flush_at"] = now
+            self.metrics["last_error"] = None
+            applied += len(batch)
+            logger.info(f"✅ {self.name}: {upserted} upserted, {len(batch) - upserted} deleted")
+            self._save_state()
+
+    def prune_missing(self) -> int:
+        """Delete the points of documents removed while no watch was running (once, after the initial snapshot)."""
+        with self.lock:
+            live_ids, self.live_ids = self.live_ids, None
+        if live_ids is None:
+            return 0
+        try:
+            removed = prune(self.name, {point_id(self.name, doc_id) for doc_id in live_ids})
+        except Exception:
+            with self.lock:
+                # Retry on the next pass, keeping ids added meanwhile.
+                self.live_ids = live_ids | (self.live_ids or set())
+            raise
+        self.metrics["deleted"] += removed
+        if removed:
+            logger.info(f"🧹 {self.name}: pruned {removed} points of documents deleted while offline")
+        return removed
+
+    def snapshot_metrics(self) -> Dict:
+        with self.lock:
+            pending = len(self.pending)
+            oldest = min((e["queued_at"] for e in self.pending.values()), default=None)
+        return {
+            **self.metrics,
+            "pending": pending,
+            "oldest_pending_seconds": round(time.time() - oldest, 3) if oldest else 0,
+            "watermark": self.watermark,
+        }
+
+    def _save_state(self):
+        try:
+            self.state_ref.set(
+                {**self.snapshot_metrics(), "source": self.source, "heartbeat_at": datetime.now(timezone.utc)},
+                merge=True,
+            )
+        except Exception as e:
+            logger.warning(f"Could not save sync state for '{self.name}': {e}")
+
+    def _run(self):
+        backoff = VECTOR_SYNC_FLUSH_SECONDS
+        last_heartbeat = 0.0
+        while not self.stopping.is_set():
+            self.wake.wait(backoff)
+            self.wake.clear()
+            try:
+                self.recheck_resumed()
+                self.flush()
+                self.prune_missing()
+                backoff = VECTOR_SYNC_FLUSH_SECONDS
+            except Exception as e:
+                backoff = min(backoff * 2, VECTOR_SYNC_MAX_BACKOFF_SECONDS)
+                logger.error(f"❌ {self.name}: flush failed, retrying in {backoff:.0f}s: {e}")
+            if time.time() - last_heartbeat >= VECTOR_SYNC_HEARTBEAT_SECONDS:
+                self._save_state()
+                last_heartbeat = time.time()
+
+    def start(self):
+        ensure_collection(self.name)
+        self.thread = threading.Thread(target=self._run, name=f"vector-sync-{self.name}", daemon=True)
+        self.thread.start()
+        self.watch = db.collection(self.source).on_snapshot(self.on_snapshot)
+        logger.info(f"📡 Syncing '{self.source}' -> Qdrant '{self.name}' (watermark {self.watermark})")
+
+    def stop(self):
+        if self.watch is not None:
+            self.watch.unsubscribe()
+        self.stopping.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout=VECTOR_SYNC_FLUSH_SECONDS * 2)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"❌ {self.name}: final flush failed: {e}")
+        self._save_state()
+
+
+def _serve_metrics(syncs: Dict[str, CollectionSync], port: int):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(
+                {name: sync.snapshot_metrics() for name, sync in syncs.items()}, default=str
+            ).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="vector-sync-metrics", daemon=True).start()
+    logger.info(f"📈 Vector sync metrics on :{port}")
+
+
+def run(names: Optional[Iterable[str]] = None):
+    """Start syncing the given Qdrant collections (default: all) and block until interrupted."""
+    names = list(names or SOURCES)
+    unknown = [name for name in names if name not in SOURCES]
+    if unknown:
+        raise ValueError(f"Unknown collections: {unknown}. Choose from {list(SOURCES)}")
+
+    syncs = {name: CollectionSync(name) for name in names}
+    for sync in syncs.values():
+        sync.start()
+    if VECTOR_SYNC_METRICS_PORT:
+        _serve_metrics(syncs, int(VECTOR_SYNC_METRICS_PORT))
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("Stopping vector sync…")
+        for sync in syncs.values():
+            sync.stop()
+
+
+if __name__ == "__main__":
+    run(sys.argv[1:] or None)
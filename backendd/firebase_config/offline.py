@@ -0,0 +1,292 @@
+"""
+offline.py — scripted stand-ins for Gemini, for benchmarks and offline runs
+==========================================================================
+
+The agent stack talks to Gemini twice over: LangChain's
+``ChatGoogleGenerativeAI`` (ReAct agent, summaries) and the google-genai
+client (function-calling agent, presentation pass). ``chat_model()`` and
+``genai_client()`` return either the real thing or a scripted fake, chosen by
+``LLM_BACKEND`` (``gemini`` | ``fake``; ``fake`` is the default with
+``OFFLINE_MODE=true``). Together with ``EMBEDDING_BACKEND=hash`` and
+``QDRANT_MODE=memory`` (also the offline defaults) the agent, its tools and
+the vector stack run with no network and no credentials.
+
+The fakes are deterministic. A script is a list of rules, tried in order
+against the user's question (``FAKE_LLM_SCRIPT`` names a JSON file, or call
+``set_script``)::
+
+    [{"match": "dues|balance",
+      "calls": [{"name": "GetClientDues", "args": {"client_id": "C0001"}}],
+      "answer": "C0001 owes ₹12,000."}]
+
+- ``match`` — a case-insensitive regex; a rule without one matches anything.
+- ``calls`` — the function calls of the first agent step, all requested at
+  once (``steps``: a list of such lists, for several steps). Calls naming a
+  tool the agent was not given are dropped.
+- ``answer`` — the final text; by default a digest of the tool results.
+
+With no matching rule the agent calls its first tool with arguments filled in
+from the tool's schema (the question for text, 1 / 0 / false / {} otherwise),
+then answers. ``FAKE_LLM_LATENCY_MS`` adds a fixed delay to every model call
+so benchmarks can model the provider's round trip. ``llm_stats()`` counts
+calls by kind.
+
+Public surface:
+    chat_model(**kwargs)     -> BaseChatModel   (Gemini or ScriptedChatModel)
+    genai_client()           -> genai.Client | FakeGenAIClient
+    set_script(rules)        -> None
+    llm_stats(reset=False)   -> Dict[str, int]
+    OFFLINE_MODE, LLM_BACKEND
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from google.genai import types
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+OFFLINE_MODE = os.getenv("OFFLINE_MODE", "false").lower() == "true"
+LLM_BACKEND = os.getenv("LLM_BACKEND", "fake" if OFFLINE_MODE else "gemini").lower()
+FAKE_LLM_SCRIPT = os.getenv("FAKE_LLM_SCRIPT")
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+DIGEST_CHARS = 300
+
+_DEFAULT_ARGS = {"INTEGER": 1, "NUMBER": 0, "BOOLEAN": False, "OBJECT": {}}
+_REACT_TOOLS = re.compile(r"should be one of \[([^\]]*)\]")
+_REACT_QUESTION = re.compile(r"\nQuestion: (.*?)\nThought:", re.DOTALL)
+
+_script: List[Dict] = []
+_stats: Dict[str, int] = {}
+_stats_lock = threading.Lock()
+
+
+def set_script(rules: Optional[List[Dict]]):
+    """Replace the fake model's rules (``None`` or ``[]``: defaults only)."""
+    global _script
+    _script = list(rules or [])
+
+
+def _load_script():
+    if FAKE_LLM_SCRIPT:
+        with open(FAKE_LLM_SCRIPT, encoding="utf-8") as f:
+            set_script(json.load(f))
+
+
+def llm_stats(reset: bool = False) -> Dict[str, int]:
+    """Fake model calls so far, by kind; ``reset`` zeroes the counters."""
+    with _stats_lock:
+        stats = dict(_stats)
+        if reset:
+            _stats.clear()
+    return stats
+
+
+def _count(kind: str, wait: bool = True):
+    with _stats_lock:
+        _stats[kind] = _stats.get(kind, 0) + 1
+    if wait and FAKE_LLM_LATENCY_MS:
+        time.sleep(FAKE_LLM_LATENCY_MS / 1000)
+
+
+def _rule_for(question: str) -> Dict:
+    for rule in _script:
+        if re.search(rule.get("match", ""), question, re.IGNORECASE):
+            return rule
+    return {}
+
+
+def _steps(rule: Dict) -> Optional[List[List[Dict]]]:
+    """The rule's scripted call steps; None when it leaves the calls to the defaults."""
+    if "steps" in rule:
+        return rule["steps"]
+    if "calls" in rule:
+        return [rule["calls"]] if rule["calls"] else []
+    return None
+
+
+def _digest(results: List[str]) -> str:
+    text = "\n".join(results) or "No data."
+    return text if len(text) <= DIGEST_CHARS else text[:DIGEST_CHARS] + "…"
+
+
+# ---------------------------------------------------------------------------
+# LangChain chat model (ReAct agent, summaries)
+# ---------------------------------------------------------------------------
+class ScriptedChatModel(BaseChatModel):
+    """
+    Plays the ReAct format: the first turn picks a tool (``Action`` /
+    ``Action Input``), the turn after an ``Observation`` gives the
+    ``Final Answer``. One tool per step, so only the first scripted call of
+    each step is made. Any other prompt gets the rule's answer or a digest of
+    the prompt's last paragraph.
+    """
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        _count("chat")
+        prompt = str(messages[-1].content)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(prompt)))])
+
+    @staticmethod
+    def _reply(prompt: str) -> str:
+        tools = _REACT_TOOLS.search(prompt)
+        # The last match: the format instructions contain a sample "Question: ... Thought:" too.
+        question = ([None] + list(_REACT_QUESTION.finditer(prompt)))[-1]
+        if not tools or not question:
+            rule = _rule_for(prompt)
+            return rule.get("answer") or _digest([prompt.strip().split("\n\n")[-1]])
+
+        rule = _rule_for(question.group(1))
+        observations = re.findall(r"\nObservation: (.*?)(?=\nThought:|$)", prompt[question.end():], re.DOTALL)
+        steps = _steps(rule)
+        if len(observations) >= (1 if steps is None else len(steps)):
+            return f"I now know the final answer\nFinal Answer: {rule.get('answer') or _digest(observations)}"
+
+        names = [name.strip() for name in tools.group(1).split(",") if name.strip()]
+        call = steps[len(observations)][0] if steps else {}
+        name = call.get("name") if call.get("name") in names else names[0]
+        args = call.get("args")
+        if isinstance(args, dict) and len(args) == 1:
+            tool_input = str(next(iter(args.values())))  # single-argument tools take the bare value
+        elif isinstance(args, dict):
+            tool_input = json.dumps(args)
+        else:
+            tool_input = question.group(1).strip()
+        return f"I should look this up.\nAction: {name}\nAction Input: {tool_input}"
+
+
+# ---------------------------------------------------------------------------
+# google-genai client (function-calling agent, presentation)
+# ---------------------------------------------------------------------------
+def _text_of(contents: Any) -> str:
+    """The opening user text of a ``contents`` argument."""
+    if isinstance(contents, str):
+        return contents
+    for content in contents:
+        for part in content.parts or []:
+            if part.text:
+                return part.text
+    return ""
+
+
+def _function_responses(contents: Any) -> List[List[types.FunctionResponse]]:
+    if isinstance(contents, str):
+        return []
+    turns = []
+    for content in contents:
+        responses = [part.function_response for part in content.parts or [] if part.function_response]
+        if responses:
+            turns.append(responses)
+    return turns
+
+
+def _default_args(declaration: types.FunctionDeclaration, question: str) -> Dict:
+    schema = declaration.parameters
+    if schema is None or not schema.properties:
+        return {}
+    args = {}
+    for name in schema.required or list(schema.properties)[:1]:
+        kind = schema.properties[name].type
+        kind = kind.value if hasattr(kind, "value") else str(kind)
+        args[name] = _DEFAULT_ARGS.get(kind.upper(), question)
+    return args
+
+
+def _response(parts: List[types.Part]) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=parts), finish_reason="STOP")]
+    )
+
+
+class _FakeModels:
+    def generate_content(self, model: str, contents: Any, config: Optional[types.GenerateContentConfig] = None):
+        _count("generate_content")
+        question = _text_of(contents)
+        rule = _rule_for(question)
+        done = _function_responses(contents)
+        declarations = [d for tool in (config.tools or []) for d in (tool.function_declarations or [])] if config else []
+
+        if declarations:
+            by_name = {d.name: d for d in declarations}
+            steps = _steps(rule)
+            if steps is not None:
+                calls = [c for c in steps[len(done)] if c.get("name") in by_name] if len(done) < len(steps) else []
+            elif not done:
+                calls = [{"name": declarations[0].name, "args": _default_args(declarations[0], question)}]
+            else:
+                calls = []
+            if calls:
+                return _response([
+                    types.Part(function_call=types.FunctionCall(
+                        id=f"call-{len(done)}-{i}", name=call["name"], args=call.get("args") or {}
+                    ))
+                    for i, call in enumerate(calls)
+                ])
+
+        results = [f"{r.name}: {json.dumps(r.response, default=str, ensure_ascii=False)}" for turn in done for r in turn]
+        return _response([types.Part(text=rule.get("answer") or _digest(results or [question]))])
+
+
+class _FakeAsyncModels:
+    async def generate_content_stream(self, model: str, contents: Any, config: Any = None):
+        _count("generate_content_stream", wait=False)
+        if FAKE_LLM_LATENCY_MS:
+            await asyncio.sleep(FAKE_LLM_LATENCY_MS / 1000)
+        text = _digest([_text_of(contents)])
+
+        async def chunks():
+            for word in re.findall(r"\S+\s*", text):
+                yield types.GenerateContentResponse(
+                    candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=word)]))]
+                )
+
+        return chunks()
+
+
+class _FakeAio:
+    def __init__(self):
+        self.models = _FakeAsyncModels()
+
+
+class FakeGenAIClient:
+    """The parts of ``genai.Client`` the agent uses, answering from the script."""
+
+    def __init__(self):
+        self.models = _FakeModels()
+        self.aio = _FakeAio()
+
+
+# ---------------------------------------------------------------------------
+# Factories
+# ---------------------------------------------------------------------------
+def chat_model(model: str = "gemini-2.0-flash", **kwargs) -> BaseChatModel:
+    """The LangChain chat model for ``LLM_BACKEND``; ``kwargs`` go to Gemini."""
+    if LLM_BACKEND == "fake":
+        return ScriptedChatModel()
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(model=model, google_api_key=GOOGLE_API_KEY, **kwargs)
+
+
+def genai_client():
+    """The google-genai client for ``LLM_BACKEND``."""
+    if LLM_BACKEND == "fake":
+        return FakeGenAIClient()
+    from google import genai
+
+    return genai.Client(api_key=GOOGLE_API_KEY)
+
+
+_load_script()
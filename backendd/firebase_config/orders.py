@@ -215,8 +215,6 @@ def GetAllOrders():
 import firebase_admin
 from firebase_admin import firestore
 
-db = firestore.client()
-
 def get_all_orders():
     orders_ref = db.collection('orders')
     docs = orders_ref.stream()
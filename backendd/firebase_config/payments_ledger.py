@@ -0,0 +1,412 @@
+"""
+Payments ledger
+===============
+
+Append-only record of every money movement between the business and a
+client or supplier.
+
+1. Every payment (order payment, payment-status change, manual payment,
+   supplier payment, order reversal) becomes ONE document in ``Payments``.
+   Entries are never edited; corrections are recorded as new entries with a
+   negative ``amount``.
+2. The document id doubles as the ``entry_key`` field:
+   ``YYYYMMDDHHMMSSffffff-<8 hex>``. Because it sorts chronologically, a single
+   indexed field gives time ordering, cursor pagination (``start_after``) and
+   date-range filtering (key range) without offset scans.
+3. ``payment_balances/{party_type}_{party_id}`` keeps the running total for a
+   party. It is updated in the same transaction as the entry, and the entry
+   stores the ``running_total`` it produced, so a party's balance is always a
+   single document read.
+4. Date-range totals use Firestore ``sum``/``count`` aggregations, so only the
+   aggregate result is billed and transferred.
+
+Filtering by party or direction together with a date range needs composite
+indexes on (party_type, party_id, entry_key) and (direction, entry_key).
+
+Public surface
+--------------
+- record_payment(...)      -> str | None
+- record_order_payment(...) -> str | None
+- ledger_query(...)        -> firestore query (filtered, unordered)
+- list_payments(...)       -> {"entries": [...], "next_cursor": str | None}
+- count_payments(...)      -> int
+- payment_totals(...)      -> {"count": int, "amount": float}
+- get_party_balance(...)   -> dict
+- backfill_from_orders()   -> int
+"""
+
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from google.cloud import firestore
+from google.cloud.firestore_v1 import FieldFilter
+
+from firebase_config.config import db
+
+LEDGER_COLLECTION = "Payments"
+BALANCES_COLLECTION = "payment_balances"
+
+# Which party an order's payments belong to, and which way the money moves.
+ORDER_PARTY = {
+    "sale": ("client", "received"),
+    "delivery_challan": ("client", "received"),
+    "purchase": ("supplier", "paid"),
+}
+
+_KEY_FORMAT = "%Y%m%d%H%M%S%f"
+
+
+def _as_utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def make_entry_key(at: Optional[datetime] = None, suffix: Optional[str] = None) -> str:
+    """Chronologically sortable, collision-free ledger key."""
+    at = _as_utc_naive(at or datetime.utcnow())
+    return f"{at.strftime(_KEY_FORMAT)}-{suffix or uuid.uuid4().hex[:8]}"
+
+
+def _key_bound(value: datetime, upper: bool = False) -> str:
+    # "~" sorts after every suffix character, so an upper bound includes all
+    # entries written within the same microsecond.
+    prefix = _as_utc_naive(value).strftime(_KEY_FORMAT)
+    return prefix + "~" if upper else prefix
+
+
+def _balance_ref(party_type: str, party_id: str):
+    return db.collection(BALANCES_COLLECTION).document(f"{party_type}_{party_id}")
+
+
+def record_payment(
+    party_type: str,
+    party_id: Optional[str],
+    amount: float,
+    direction: str,
+    party_name: Optional[str] = None,
+    order_id: Optional[str] = None,
+    order_type: Optional[str] = None,
+    invoice_number: Optional[str] = None,
+    challan_number: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    payment_status: Optional[str] = None,
+    collected_by: Optional[str] = None,
+    recorded_by: str = "system",
+    kind: str = "payment",
+    remarks: str = "",
+    at: Optional[datetime] = None,
+    transaction=None,
+) -> Optional[str]:
+    """
+    Append one entry to the ledger and roll it into the party's running total.
+
+    ``amount`` is signed: reversals and downward corrections are negative.
+    Pass ``transaction`` to make the entry part of a caller's transaction; the
+    caller must have done its own reads first and commits it.
+    Returns the entry id, or None when there is nothing to record.
+    """
+    if not amount:
+        return None
+
+    now = _as_utc_naive(at or datetime.utcnow())
+    entry_key = make_entry_key(now)
+    entry_ref = db.collection(LEDGER_COLLECTION).document(entry_key)
+    entry = {
+        "entry_key": entry_key,
+        "kind": kind,
+        "party_type": party_type,
+        "party_id": party_id,
+        "party_name": party_name,
+        "direction": direction,
+        "amount": float(amount),
+        "order_id": order_id,
+        "order_type": order_type,
+        "invoice_number": invoice_number,
+        "challan_number": challan_number,
+        "payment_method": payment_method,
+        "payment_status": payment_status,
+        "collected_by": collected_by,
+        "recorded_by": recorded_by,
+        "remarks": remarks,
+        "created_at": now,
+    }
+
+    # Walk-in sales have no party to keep a balance for.
+    if not party_id:
+        entry["running_total"] = None
+        if transaction is not None:
+            transaction.set(entry_ref, entry)
+        else:
+            entry_ref.set(entry)
+        return entry_key
+
+    balance_ref = _balance_ref(party_type, party_id)
+
+    def _append(transaction):
+        snapshot = balance_ref.get(transaction=transaction)
+        current = snapshot.to_dict() if snapshot.exists else {}
+        running_total = current.get("total", 0) + float(amount)
+        entry["running_total"] = running_total
+        transaction.set(entry_ref, entry)
+        transaction.set(balance_ref, {
+            "party_type": party_type,
+            "party_id": party_id,
+            "party_name": party_name or current.get("party_name"),
+            "direction": direction,
+            "total": running_total,
+            "entries": current.get("entries", 0) + 1,
+            "last_entry_key": entry_key,
+            "last_payment_at": now,
+            "updated_at": now,
+        }, merge=True)
+
+    if transaction is not None:
+        _append(transaction)
+    else:
+        firestore.transactional(_append)(db.transaction())
+    return entry_key
+
+
+def record_order_payment(
+    order_id: str,
+    order_data: Dict,
+    amount: float,
+    recorded_by: str = "system",
+    kind: str = "payment",
+) -> Optional[str]:
+    """Ledger entry for money moving against an order (sale, purchase or challan)."""
+    order_type = order_data.get("order_type")
+    if order_type not in ORDER_PARTY:
+        return None
+    party_type, direction = ORDER_PARTY[order_type]
+    return record_payment(
+        party_type=party_type,
+        party_id=order_data.get(f"{party_type}_id"),
+        party_name=order_data.get(f"{party_type}_name"),
+        amount=amount,
+        direction=direction,
+        order_id=order_id,
+        order_type=order_type,
+        invoice_number=order_data.get("invoice_number"),
+        challan_number=order_data.get("challan_number"),
+        payment_method=order_data.get("payment_method"),
+        payment_status=order_data.get("payment_status"),
+        collected_by=order_data.get("amount_collected_by"),
+        recorded_by=recorded_by,
+        kind=kind,
+    )
+
+
+def ledger_query(
+    party_type: Optional[str] = None,
+    party_id: Optional[str] = None,
+    direction: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+):
+    query = db.collection(LEDGER_COLLECTION)
+    if party_type:
+        query = query.where(filter=FieldFilter("party_type", "==", party_type))
+    if party_id:
+        query = query.where(filter=FieldFilter("party_id", "==", party_id))
+    if direction:
+        query = query.where(filter=FieldFilter("direction", "==", direction))
+    if date_from:
+        query = query.where(filter=FieldFilter("entry_key", ">=", _key_bound(date_from)))
+    if date_to:
+        query = query.where(filter=FieldFilter("entry_key", "<=", _key_bound(date_to, upper=True)))
+    return query
+
+
+def list_payments(
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    offset: int = 0,
+    newest_first: bool = True,
+    **filters,
+) -> Dict:
+    """
+    One page of ledger entries ordered by ``entry_key``.
+
+    Pass the returned ``next_cursor`` back as ``cursor`` to continue; ``offset``
+    is only kept for page-number callers and is ignored when a cursor is given.
+    """
+    direction = firestore.Query.DESCENDING if newest_first else firestore.Query.ASCENDING
+    query = ledger_query(**filters).order_by("entry_key", direction=direction)
+    if cursor:
+        query = query.start_after({"entry_key": cursor})
+    elif offset:
+        query = query.offset(offset)
+
+    # Fetch one extra document to learn whether another page exists.
+    docs = list(query.limit(limit + 1).stream())
+    has_more = len(docs) > limit
+    entries = [doc.to_dict() | {"id": doc.id} for doc in docs[:limit]]
+    return {
+        "entries": entries,
+        "next_cursor": entries[-1]["entry_key"] if has_more and entries else None,
+    }
+
+
+def count_payments(**filters) -> int:
+    result = ledger_query(**filters).count(alias="count").get()
+    return int(result[0][0].value) if result else 0
+
+
+def payment_totals(**filters) -> Dict:
+    """Entry count and amount sum for the filtered range, via aggregation."""
+    aggregation = ledger_query(**filters).count(alias="count").sum("amount", alias="amount")
+    result = aggregation.get()
+    values = {item.alias: item.value for item in result[0]} if result else {}
+    return {
+        "count": int(values.get("count") or 0),
+        "amount": float(values.get("amount") or 0),
+    }
+
+
+def get_party_balance(party_type: str, party_id: str) -> Dict:
+    snapshot = _balance_ref(party_type, party_id).get()
+    if not snapshot.exists:
+        return {"party_type": party_type, "party_id": party_id, "total": 0, "entries": 0}
+    return snapshot.to_dict()
+
+
+def _recorded_by_order() -> Dict[str, float]:
+    """Sum of the ledger entries already recorded against each order."""
+    recorded: Dict[str, float] = {}
+    entries = (
+        db.collection(LEDGER_COLLECTION)
+        .where(filter=FieldFilter("order_id", ">", ""))  # any string id; skips null
+        .select(["order_id", "amount"])
+        .stream()
+    )
+    for doc in entries:
+        data = doc.to_dict()
+        recorded[data["order_id"]] = recorded.get(data["order_id"], 0.0) + float(data.get("amount") or 0)
+    return recorded
+
+
+def backfill_from_orders() -> int:
+    """
+    Seed the ledger from ``Orders.amount_paid`` for history recorded before the
+    ledger existed. Safe to run at any time, and to run again:
+
+    - an order only gets an entry for the part of ``amount_paid`` the ledger
+      does not hold yet (orders created since go-live, or already backfilled,
+      get nothing; an old order with a later correction gets the original
+      payment only);
+    - party balances are merged with ``Increment``, so live and manual
+      entries already counted in ``payment_balances`` are kept.
+
+    The ``running_total`` of a backfilled entry counts backfilled history only.
+    Backfilled entries are dated in the past, so each touched party's
+    statement checkpoints are dropped from its earliest backfilled month.
+    """
+    from firebase_config.statements import invalidate_checkpoints
+
+    recorded = _recorded_by_order()
+    orders = (
+        db.collection("Orders")
+        .where(filter=FieldFilter("amount_paid", ">", 0))
+        .stream()
+    )
+    rows: List[Dict] = []
+    for doc in orders:
+        data = doc.to_dict()
+        if data.get("draft") or data.get("order_type") not in ORDER_PARTY:
+            continue
+        missing = round(float(data.get("amount_paid", 0)) - recorded.get(doc.id, 0.0), 2)
+        if missing > 0:
+            rows.append(data | {"id": doc.id, "missing": missing})
+    rows.sort(key=lambda row: _as_utc_naive(row.get("created_at") or datetime.utcnow()))
+
+    totals: Dict[str, Dict] = {}
+    batch = db.batch()
+    pending = 0
+    for row in rows:
+        party_type, direction = ORDER_PARTY[row["order_type"]]
+        party_id = row.get(f"{party_type}_id")
+        created_at = _as_utc_naive(row.get("created_at") or datetime.utcnow())
+        entry_key = make_entry_key(created_at, suffix=f"order-{row['id']}")
+        amount = row["missing"]
+
+        running_total = None
+        if party_id:
+            balance = totals.setdefault(f"{party_type}_{party_id}", {
+                "party_type": party_type,
+                "party_id": party_id,
+                "party_name": row.get(f"{party_type}_name"),
+                "direction": direction,
+                "total": 0.0,
+                "entries": 0,
+                "first_at": created_at,
+            })
+            balance["total"] += amount
+            balance["entries"] += 1
+            balance["last_entry_key"] = entry_key
+            balance["last_payment_at"] = created_at
+            running_total = balance["total"]
+
+        batch.set(db.collection(LEDGER_COLLECTION).document(entry_key), {
+            "entry_key": entry_key,
+            "kind": "backfill",
+            "party_type": party_type,
+            "party_id": party_id,
+            "party_name": row.get(f"{party_type}_name"),
+            "direction": direction,
+            "amount": amount,
+            "order_id": row["id"],
+            "order_type": row["order_type"],
+            "invoice_number": row.get("invoice_number"),
+            "challan_number": row.get("challan_number"),
+            "payment_method": row.get("payment_method"),
+            "payment_status": row.get("payment_status"),
+            "collected_by": row.get("amount_collected_by"),
+            "recorded_by": "backfill",
+            "remarks": "",
+            "running_total": running_total,
+            "created_at": created_at,
+        })
+        pending += 1
+        if pending == 450:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    refs = [db.collection(BALANCES_COLLECTION).document(balance_id) for balance_id in totals]
+    existing = {snapshot.id for snapshot in db.get_all(refs, field_paths=["total"]) if snapshot.exists} if refs else set()
+    for ref in refs:
+        balance = totals[ref.id]
+        update = {
+            "party_type": balance["party_type"],
+            "party_id": balance["party_id"],
+            "direction": balance["direction"],
+            "total": firestore.Increment(balance["total"]),
+            "entries": firestore.Increment(balance["entries"]),
+            "updated_at": datetime.utcnow(),
+        }
+        if ref.id not in existing:
+            # Live entries are newer than any backfilled one; only a new balance takes these.
+            update.update({
+                "party_name": balance["party_name"],
+                "last_entry_key": balance["last_entry_key"],
+                "last_payment_at": balance["last_payment_at"],
+            })
+        batch.set(ref, update, merge=True)
+        pending += 1
+        if pending == 450:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+
+    for balance in totals.values():
+        invalidate_checkpoints(balance["party_type"], balance["party_id"], balance["first_at"])
+    return len(rows)
+
+
+if __name__ == "__main__":
+    print(f"Backfilled {backfill_from_orders()} ledger entries from Orders.")
@@ -0,0 +1,251 @@
+"""
+presentation.py — turn the agent's output into the user-facing answer
+====================================================================
+
+Every answer used to go through a second Gemini call with a long static
+prompt, even "Task completed successfully". Now:
+
+1. ``render(output)`` handles the result types whose rendering is obvious,
+   deterministically and instantly:
+
+   - empty results, confirmations ("Updated", "Deleted", …) and errors;
+   - scalars, a single record, and short homogeneous lists (a markdown table);
+   - list-tool pages and aggregates (``tool_outputs.py``);
+   - short prose, which is what the function-calling agent returns. It is
+     already written for the user and is passed through as is.
+
+2. ``stream(output)`` is used for everything else (large or mixed data).
+   It is the Gemini presentation pass: the static instructions are the system
+   instruction and the data follows them, so the prompt prefix never changes.
+   The instructions are a few hundred tokens, below Gemini's minimum size for
+   an explicit context cache, so they are sent inline on every call; the fixed
+   prefix is what lets the provider reuse it implicitly where it does so. The
+   client comes from ``offline.py`` (``LLM_BACKEND=fake``: a scripted
+   stand-in).
+
+Public surface:
+    render(output)        -> str | None   (None: needs the LLM)
+    stream(output)        -> async iterator of text chunks
+    PRESENTATION_INSTRUCTIONS, PRESENTATION_MAX_ROWS
+"""
+
+import ast
+import json
+import logging
+import os
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from google.genai import types
+
+from firebase_config.chat_memory import count_tokens
+from firebase_config.offline import genai_client
+from firebase_config.tool_outputs import bound_output
+
+logger = logging.getLogger(__name__)
+
+PRESENTATION_MODEL = os.getenv("PRESENTATION_MODEL", "gemini-2.0-flash")
+# Rows rendered as a table without the LLM, and the longest prose passed through.
+PRESENTATION_MAX_ROWS = int(os.getenv("PRESENTATION_MAX_ROWS", "10"))
+PRESENTATION_PASSTHROUGH_TOKENS = int(os.getenv("PRESENTATION_PASSTHROUGH_TOKENS", "400"))
+MAX_TABLE_COLUMNS = 6
+
+EMPTY_MESSAGE = "I couldn't find any records matching your request."
+CONFIRMATIONS = {
+    "updated": "The record has been updated successfully.",
+    "deleted": "The record has been deleted successfully.",
+    "done": "The task has been completed successfully.",
+    "success": "The task has been completed successfully.",
+    "task completed successfully": "The task has been completed successfully.",
+}
+
+PRESENTATION_INSTRUCTIONS = """
+## ROLE AND GOAL
+You are 'Balaji AI', an expert business analyst and assistant for Balaji Health Care, a medical equipment business. Your primary goal is to convert raw, structured data from internal software tools into clear, professional, and actionable insights for the user. You must be concise, accurate, and helpful.
+
+## CONTEXT
+The user, an employee, has asked a question. A software tool has returned raw data to answer it. The user should never see the raw data, only your final, well-formatted response.
+
+## TASK
+Analyze the raw data you are given. Synthesize the key information and present it as a helpful, natural language answer that directly addresses the user's original query (which you haven't seen).
+
+
+
+## FORMATTING RULES
+- Use markdown for structure (e.g., lists with `*`, bolding with `**`).
+- **For lists, ALWAYS put a space after the asterisk (e.g., `* List item`).**
+- **Use double newlines (`\n\n`) to create separate paragraphs for better spacing.**
+- Use bold (`**`) selectively for emphasis on **final summary totals**, **main entity names**, and final **status words**.
+- Do **not** bold every single number, ID, or label.
+
+
+## IMPORTANT RULES TO FOLLOW
+- **If the data is empty or shows no results (e.g., `[]`, `{}`, `None`):** Respond with a friendly, clear message like, "I couldn't find any records matching your request."
+- **If the data is a simple confirmation message (e.g., 'Task completed successfully'):** Relay it professionally, for example: "The task has been completed successfully."
+- **If the data is clearly an error message:** Translate it into a user-friendly message. For example, if the data is `'Error: Client not found'`, respond with "I'm sorry, I couldn't find a client with that information. Please double-check the details and try again."
+- **NEVER** just repeat the raw data. Your job is to interpret and summarize it.
+- **NEVER** invent information. If a detail isn't in the provided data, you don't know it.
+"""
+
+_ERROR = re.compile(r"^(error|exception|failed|traceback)\b[:\s]*", re.IGNORECASE)
+_NOT_FOUND = re.compile(r"(\w+) not found", re.IGNORECASE)
+# Bookkeeping fields that never belong in a rendered answer.
+_HIDDEN_FIELDS = {"created_at", "updated_at", "content_hash", "search_keywords"}
+
+_client = genai_client()
+
+
+# ---------------------------------------------------------------------------
+# Templates
+# ---------------------------------------------------------------------------
+def _parse(output: Any) -> Any:
+    """Tool output as data; ReAct hands some of it over as ``str(list)`` / ``str(dict)``."""
+    if not isinstance(output, str):
+        return bound_output(output)
+    text = output.strip()
+    if text[:1] in "[{":
+        for parse in (json.loads, ast.literal_eval):
+            try:
+                return bound_output(parse(text))
+            except (ValueError, SyntaxError):
+                continue
+    return text
+
+
+def _label(key: str) -> str:
+    return key.replace("_", " ").strip().capitalize()
+
+
+def _value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    if isinstance(value, int):
+        return f"{value:,}"
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    if value in (None, ""):
+        return "—"
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def _scalar(value: Any) -> bool:
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+def _visible(record: Dict) -> List[str]:
+    return [key for key in record if key not in _HIDDEN_FIELDS and not key.startswith("_")]
+
+
+def _render_error(text: str) -> str:
+    detail = _ERROR.sub("", text).strip()
+    missing = _NOT_FOUND.search(detail)
+    if missing:
+        return (
+            f"I'm sorry, I couldn't find a {missing.group(1).lower()} with that information. "
+            "Please double-check the details and try again."
+        )
+    return f"I'm sorry, I couldn't complete that request: {detail}"
+
+
+def _render_record(record: Dict) -> Optional[str]:
+    keys = _visible(record)
+    if not keys or any(not _scalar(record[key]) for key in keys):
+        return None
+    lines = [f"**{record['name']}**\n"] if record.get("name") else []
+    lines += [f"* {_label(key)}: {_value(record[key])}" for key in keys if key != "name"]
+    return "\n".join(lines)
+
+
+def _render_table(rows: List[Dict]) -> Optional[str]:
+    if not rows or len(rows) > PRESENTATION_MAX_ROWS or not all(isinstance(row, dict) for row in rows):
+        return None
+    columns = _visible(rows[0])
+    # Heterogeneous rows (different shapes) read better in prose.
+    if any(set(_visible(row)) != set(columns) for row in rows):
+        return None
+    columns = [key for key in columns if all(_scalar(row.get(key)) for row in rows)][:MAX_TABLE_COLUMNS]
+    if not columns:
+        return None
+    lines = [
+        "| " + " | ".join(_label(key) for key in columns) + " |",
+        "| " + " | ".join("---" for _ in columns) + " |",
+    ]
+    lines += ["| " + " | ".join(_value(row.get(key)) for key in columns) + " |" for row in rows]
+    return "\n".join(lines)
+
+
+def _render_dict(data: Dict) -> Optional[str]:
+    if data.get("truncated"):
+        return None
+    if "error" in data and _scalar(data["error"]):
+        return _render_error(str(data["error"]))
+    if "rows" in data and isinstance(data["rows"], list):
+        if not data["rows"]:
+            return EMPTY_MESSAGE
+        table = _render_table(data["rows"])
+        if table is None:
+            return None
+        if "total" in data:
+            start = data.get("offset", 0) + 1
+            table += f"\n\nShowing {start}–{start + len(data['rows']) - 1} of **{_value(data['total'])}**."
+        return table
+    if "aggregate" in data:
+        subject = _label(f"{data['aggregate']} of {data['field']}" if data.get("field") else data["aggregate"])
+        if "groups" in data:
+            lines = [f"**{subject} by {data['group_by'].replace('_', ' ')}**\n"]
+            lines += [f"* {group or '—'}: {_value(value)}" for group, value in data["groups"].items()]
+            shown = len(data["groups"])
+            if data.get("group_count", shown) > shown:
+                lines.append(f"\nTop {shown} of {data['group_count']} groups.")
+            return "\n".join(lines)
+        if "value" in data:
+            return f"{subject}: **{_value(data['value'])}**"
+        return None
+    return _render_record(data)
+
+
+def render(output: Any) -> Optional[str]:
+    """Markdown for outputs with an obvious rendering; None when the LLM pass is needed."""
+    data = _parse(output)
+    if data in (None, "", [], {}) or (isinstance(data, str) and data.lower() in ("none", "null", "[]", "{}")):
+        return EMPTY_MESSAGE
+    if isinstance(data, bool):
+        return CONFIRMATIONS["done"] if data else None
+    if isinstance(data, (int, float)):
+        return f"**{_value(data)}**"
+    if isinstance(data, str):
+        if _ERROR.match(data):
+            return _render_error(data)
+        confirmation = CONFIRMATIONS.get(data.lower().rstrip(".!"))
+        if confirmation:
+            return confirmation
+        if count_tokens(data) <= PRESENTATION_PASSTHROUGH_TOKENS:
+            return data
+        return None
+    if isinstance(data, dict):
+        return _render_dict(data)
+    if isinstance(data, list):
+        if all(_scalar(item) for item in data) and len(data) <= PRESENTATION_MAX_ROWS * 2:
+            return "\n".join(f"* {_value(item)}" for item in data)
+        if len(data) == 1 and isinstance(data[0], dict):
+            return _render_record(data[0])
+        return _render_table(data)
+    return None
+
+
+# ---------------------------------------------------------------------------
+# LLM pass
+# ---------------------------------------------------------------------------
+async def stream(output: Any) -> AsyncIterator[str]:
+    """The Gemini presentation pass for ``output``, streamed as text chunks."""
+    data = bound_output(output)
+    data = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False, default=str)
+    config = types.GenerateContentConfig(system_instruction=PRESENTATION_INSTRUCTIONS, temperature=0)
+    chunks = await _client.aio.models.generate_content_stream(
+        model=PRESENTATION_MODEL,
+        contents=f"## RAW DATA FROM TOOL:\n---\n{data}\n---",
+        config=config,
+    )
+    async for chunk in chunks:
+        if chunk.text:
+            yield chunk.text
@@ -0,0 +1,418 @@
+"""
+doc_counters reconciliation
+===========================
+
+Recomputes every counter in ``doc_counters`` from the source collections,
+reports drift per field and optionally repairs it.
+
+1. Each source collection is split with Firestore partition queries
+   (``collection_group(...).get_partitions``). The partitions are scanned in
+   parallel on a thread pool with ``select()`` projections, so only the
+   fields a counter needs are transferred. Partial sums are then merged.
+2. Expected values follow the same rules as the write paths in ``test.py``
+   (drafts never count):
+
+   - orders             total, {total_sales|total_purchase|delivery_challan}.{count,amount}
+                        (amount = sum of total_amount), total_revenue (amount_paid
+                        of sales and challans)
+   - clients            total, total_due (sum of due_amount), total_orders
+   - suppliers          total, total_due (sum of due), total_orders
+   - employees          total, total_paid, total_collected
+   - items              total, total_stock, low_stock_count, expiring_soon_count
+   - expenses           total, total_amount
+   - financial_summary  total_income (amount_paid of sales and challans),
+                        total_expense (expenses + amount_paid of purchases), net_profit
+   - YYYY-MM            {sales_orders|purchase_orders|delivery_challan}_{count,amount},
+                        expenses.{total,total_amount}, keyed by created_at month
+
+   ``last_id`` and other bookkeeping fields are never touched.
+3. The partition scan is not a snapshot, so counters are read before and
+   after it. A field that changed in between had writes land mid-scan; its
+   drift is reported with ``changed_during_scan`` and not repaired (run again
+   later). Repairs are ``Increment(expected - stored)`` writes, so increments
+   landing after the read are kept. Literal ``"expenses.total"`` fields left
+   behind by the old monthly seeding are removed.
+
+Run ``python -m firebase_config.reconcile_counters [--repair]`` from
+``backendd/``, or call ``reconcile_counters()`` from the API scheduler.
+
+Public surface
+--------------
+- reconcile_counters(repair, sections, workers, partitions) -> dict
+- nest_fields(updates) -> dict
+"""
+
+import argparse
+import json
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+from google.cloud import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from firebase_config.config import db
+
+COUNTERS_COLLECTION = "doc_counters"
+MONTH_DOC = re.compile(r"^\d{4}-\d{2}$")
+TOLERANCE = 0.005
+
+ORDER_COUNTER_FIELD = {
+    "sale": "total_sales",
+    "purchase": "total_purchase",
+    "delivery_challan": "delivery_challan",
+}
+ORDER_MONTHLY_PREFIX = {
+    "sale": "sales_orders",
+    "purchase": "purchase_orders",
+    "delivery_challan": "delivery_challan",
+}
+
+# Fields owned by each counter document. Anything not listed is left alone.
+COUNTER_FIELDS = {
+    "orders": [
+        "total", "total_revenue",
+        "total_sales.count", "total_sales.amount",
+        "total_purchase.count", "total_purchase.amount",
+        "delivery_challan.count", "delivery_challan.amount",
+    ],
+    "clients": ["total", "total_due", "total_orders"],
+    "suppliers": ["total", "total_due", "total_orders"],
+    "employees": ["total", "total_paid", "total_collected"],
+    "items": ["total", "total_stock", "low_stock_count", "expiring_soon_count"],
+    "expenses": ["total", "total_amount"],
+    "financial_summary": ["total_income", "total_expense", "net_profit"],
+}
+MONTHLY_FIELDS = [
+    "sales_orders_count", "sales_orders_amount",
+    "purchase_orders_count", "purchase_orders_amount",
+    "delivery_challan_count", "delivery_challan_amount",
+    "expenses.total", "expenses.total_amount",
+]
+
+# Source -> (collection, projected fields).
+SOURCES = {
+    "orders": ("Orders", ["order_type", "draft", "total_amount", "amount_paid",
+                          "client_id", "supplier_id", "created_at"]),
+    "expenses": ("Expenses", ["amount", "created_at"]),
+    "clients": ("Clients", ["due_amount"]),
+    "suppliers": ("Suppliers", ["due"]),
+    "employees": ("Employees", ["paid", "collected"]),
+    "items": ("Inventory Items", ["stock_quantity", "low_stock_threshold", "batches"]),
+}
+
+# Counter section -> sources it is derived from.
+SECTION_SOURCES = {
+    "orders": ["orders"],
+    "clients": ["clients", "orders"],
+    "suppliers": ["suppliers", "orders"],
+    "employees": ["employees"],
+    "items": ["items"],
+    "expenses": ["expenses"],
+    "financial_summary": ["orders", "expenses"],
+    "monthly": ["orders", "expenses"],
+}
+SECTIONS = tuple(SECTION_SOURCES)
+
+Totals = Dict[str, Dict[str, float]]
+
+
+def _num(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _month_of(value) -> Optional[str]:
+    return value.strftime("%Y-%m") if isinstance(value, datetime) else None
+
+
+def _expiry_month(value) -> Optional[datetime]:
+    """Batch expiry as a UTC month start; accepts the formats InventoryBatch accepts."""
+    if isinstance(value, datetime):
+        expiry = value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    elif isinstance(value, str):
+        expiry = None
+        for fmt in ("%Y-%m", "%m/%Y"):
+            try:
+                expiry = datetime.strptime(value, fmt).replace(tzinfo=timezone.utc)
+                break
+            except ValueError:
+                continue
+        if expiry is None:
+            try:
+                expiry = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            except ValueError:
+                return None
+            if expiry.tzinfo is None:
+                expiry = expiry.replace(tzinfo=timezone.utc)
+    else:
+        return None
+    return expiry.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+# ---------- Per-document folds ---------- #
+
+def _fold_order(data: Dict, totals: Totals, context: Dict):
+    order_type = data.get("order_type")
+    if data.get("draft") or order_type not in ORDER_COUNTER_FIELD:
+        return
+    amount = _num(data.get("total_amount"))
+    paid = _num(data.get("amount_paid"))
+    field = ORDER_COUNTER_FIELD[order_type]
+
+    orders = totals["orders"]
+    orders["total"] += 1
+    orders[f"{field}.count"] += 1
+    orders[f"{field}.amount"] += amount
+
+    if order_type == "purchase":
+        totals["financial_summary"]["total_expense"] += paid
+        if data.get("supplier_id"):
+            totals["suppliers"]["total_orders"] += 1
+    else:
+        orders["total_revenue"] += paid
+        totals["financial_summary"]["total_income"] += paid
+        if data.get("client_id"):
+            totals["clients"]["total_orders"] += 1
+
+    month = _month_of(data.get("created_at"))
+    if month:
+        prefix = ORDER_MONTHLY_PREFIX[order_type]
+        totals[month][f"{prefix}_count"] += 1
+        totals[month][f"{prefix}_amount"] += amount
+
+
+def _fold_expense(data: Dict, totals: Totals, context: Dict):
+    amount = _num(data.get("amount"))
+    totals["expenses"]["total"] += 1
+    totals["expenses"]["total_amount"] += amount
+    totals["financial_summary"]["total_expense"] += amount
+    month = _month_of(data.get("created_at"))
+    if month:
+        totals[month]["expenses.total"] += 1
+        totals[month]["expenses.total_amount"] += amount
+
+
+def _fold_client(data: Dict, totals: Totals, context: Dict):
+    totals["clients"]["total"] += 1
+    totals["clients"]["total_due"] += _num(data.get("due_amount"))
+
+
+def _fold_supplier(data: Dict, totals: Totals, context: Dict):
+    totals["suppliers"]["total"] += 1
+    totals["suppliers"]["total_due"] += _num(data.get("due"))
+
+
+def _fold_employee(data: Dict, totals: Totals, context: Dict):
+    totals["employees"]["total"] += 1
+    totals["employees"]["total_paid"] += _num(data.get("paid"))
+    totals["employees"]["total_collected"] += _num(data.get("collected"))
+
+
+def _fold_item(data: Dict, totals: Totals, context: Dict):
+    items = totals["items"]
+    stock = _num(data.get("stock_quantity"))
+    items["total"] += 1
+    items["total_stock"] += stock
+    if stock <= _num(data.get("low_stock_threshold")):
+        items["low_stock_count"] += 1
+    # Same rule as the inventory routes: a batch whose expiry month starts
+    # within the next 30 days.
+    today, cutoff = context["today"], context["cutoff"]
+    for batch in data.get("batches") or []:
+        expiry = _expiry_month((batch or {}).get("Expiry"))
+        if expiry and today <= expiry < cutoff:
+            items["expiring_soon_count"] += 1
+            break
+
+
+FOLDS: Dict[str, Callable] = {
+    "orders": _fold_order,
+    "expenses": _fold_expense,
+    "clients": _fold_client,
+    "suppliers": _fold_supplier,
+    "employees": _fold_employee,
+    "items": _fold_item,
+}
+
+
+# ---------- Parallel scan ---------- #
+
+def _new_totals() -> Totals:
+    return defaultdict(lambda: defaultdict(float))
+
+
+def _merge(into: Totals, other: Totals):
+    for doc_id, fields in other.items():
+        for field, value in fields.items():
+            into[doc_id][field] += value
+
+
+def _partition_queries(collection: str, fields: List[str], partitions: int) -> list:
+    group = db.collection_group(collection)
+    try:
+        queries = [partition.query() for partition in group.get_partitions(partitions)]
+    except Exception:
+        # Emulator / older backends without PartitionQuery support.
+        queries = []
+    return [query.select(fields) for query in queries or [group]]
+
+
+def _scan(query, fold: Callable, context: Dict) -> tuple:
+    totals = _new_totals()
+    scanned = 0
+    for doc in query.stream():
+        fold(doc.to_dict() or {}, totals, context)
+        scanned += 1
+    return totals, scanned
+
+
+def _compute(sources: Iterable[str], workers: int, partitions: int) -> tuple:
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    context = {"today": today, "cutoff": today + timedelta(days=30)}
+
+    jobs = []
+    for source in sources:
+        collection, fields = SOURCES[source]
+        for query in _partition_queries(collection, fields, partitions):
+            jobs.append((source, query))
+
+    totals = _new_totals()
+    scanned: Dict[str, int] = defaultdict(int)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [(source, pool.submit(_scan, query, FOLDS[source], context)) for source, query in jobs]
+        for source, future in futures:
+            partial, count = future.result()
+            _merge(totals, partial)
+            scanned[source] += count
+
+    summary = totals["financial_summary"]
+    summary["net_profit"] = summary["total_income"] - summary["total_expense"]
+    return totals, dict(scanned)
+
+
+# ---------- Drift and repair ---------- #
+
+def _get_path(data: Dict, path: str):
+    value = data
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def nest_fields(updates: Dict) -> Dict:
+    """{"a.b": 1} -> {"a": {"b": 1}} so dotted counters can be written with set(merge=True)."""
+    nested: Dict = {}
+    for key, value in updates.items():
+        target = nested
+        *parents, leaf = key.split(".")
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[leaf] = value
+    return nested
+
+
+def _expected_docs(totals: Totals, stored: Dict[str, Dict], sections: List[str]) -> Dict[str, List[str]]:
+    docs = {section: COUNTER_FIELDS[section] for section in sections if section in COUNTER_FIELDS}
+    if "monthly" in sections:
+        months = {doc_id for doc_id in totals if MONTH_DOC.match(doc_id)}
+        months |= {doc_id for doc_id in stored if MONTH_DOC.match(doc_id)}
+        docs.update({month: MONTHLY_FIELDS for month in sorted(months)})
+    return docs
+
+
+def _stored_counters() -> Dict[str, Dict]:
+    return {doc.id: doc.to_dict() or {} for doc in db.collection(COUNTERS_COLLECTION).stream()}
+
+
+def reconcile_counters(
+    repair: bool = False,
+    sections: Optional[Iterable[str]] = None,
+    workers: int = 8,
+    partitions: int = 16,
+) -> Dict:
+    """
+    Recompute the selected counter sections (all by default) and compare them
+    with ``doc_counters``. Returns the drift report; with ``repair=True`` each
+    drifted field that did not change during the scan is moved to its expected
+    value by an increment.
+    """
+    sections = list(sections or SECTIONS)
+    unknown = [section for section in sections if section not in SECTION_SOURCES]
+    if unknown:
+        raise ValueError(f"Unknown counter sections: {', '.join(unknown)}")
+
+    started = time.monotonic()
+    sources = sorted({source for section in sections for source in SECTION_SOURCES[section]})
+    before = _stored_counters()
+    totals, scanned = _compute(sources, workers, partitions)
+    stored = _stored_counters()
+
+    drift: List[Dict] = []
+    repairs: Dict[str, Dict] = {}
+    for doc_id, fields in _expected_docs(totals, stored, sections).items():
+        current = stored.get(doc_id, {})
+        for field in fields:
+            expected = totals[doc_id][field] if doc_id in totals else 0.0
+            expected = round(expected, 2)
+            actual = _get_path(current, field)
+            if actual is not None and abs(_num(actual) - expected) <= TOLERANCE:
+                continue
+            if actual is None and not expected:
+                continue
+            changed = _get_path(before.get(doc_id, {}), field) != actual
+            drift.append({
+                "doc": doc_id,
+                "field": field,
+                "stored": actual,
+                "expected": expected,
+                "drift": round(_num(actual) - expected, 2),
+                "changed_during_scan": changed,
+            })
+            if not changed:
+                repairs.setdefault(doc_id, {})[field] = firestore.Increment(round(expected - _num(actual), 2))
+
+    repaired = 0
+    if repair:
+        for doc_id, fields in repairs.items():
+            ref = db.collection(COUNTERS_COLLECTION).document(doc_id)
+            ref.set(nest_fields(fields) | {"updated_at": datetime.utcnow()}, merge=True)
+            literal = [key for key in stored.get(doc_id, {}) if "." in key]
+            if literal:
+                ref.update({FieldPath(key).to_api_repr(): firestore.DELETE_FIELD for key in literal})
+            repaired += 1
+
+    return {
+        "sections": sections,
+        "scanned": scanned,
+        "drift_count": len(drift),
+        "changed_during_scan": sum(entry["changed_during_scan"] for entry in drift),
+        "drift": drift,
+        "repaired_docs": repaired,
+        "elapsed_seconds": round(time.monotonic() - started, 2),
+        "checked_at": datetime.utcnow().isoformat(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute doc_counters and report drift.")
+    parser.add_argument("--repair", action="store_true", help="correct drifted counters")
+    parser.add_argument("--section", action="append", choices=SECTIONS, help="limit to a section (repeatable)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--partitions", type=int, default=16)
+    args = parser.parse_args()
+
+    report = reconcile_counters(
+        repair=args.repair,
+        sections=args.section,
+        workers=args.workers,
+        partitions=args.partitions,
+    )
+    print(json.dumps(report, indent=2, default=str))
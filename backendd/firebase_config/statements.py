@@ -0,0 +1,370 @@
+"""
+Statements of account
+=====================
+
+Chronological statement (orders, payments, running balance) for one client or
+supplier over a date range.
+
+1. Debits are non-draft orders for the party (sales and delivery challans for a
+   client, purchases for a supplier) at their ``total_amount``. Credits are the
+   party's entries in the payments ledger (see ``payments_ledger``). The balance
+   is what the client owes us, or what we owe the supplier.
+2. Orders and ledger entries are read in cursor pages (``start_after``) with a
+   field projection, so a statement never streams whole documents or whole
+   collections, and both sources arrive already sorted and are merged lazily.
+3. ``statement_checkpoints/{party_type}_{party_id}_{YYYY-MM}`` stores the
+   closing balance of every fully closed month a statement has replayed. The
+   opening balance for a range is the latest checkpoint before it plus a replay
+   of the few entries since, instead of the party's whole history.
+4. Order edits and deletes drop the checkpoints from the order's month onward
+   (``invalidate_checkpoints``). Live ledger entries are written "now", so they
+   never touch a closed month; ``payments_ledger.backfill_from_orders`` writes
+   past-dated entries and drops each touched party's checkpoints from its
+   earliest backfilled month.
+5. Rows are yielded one at a time so CSV can be streamed straight to the client;
+   the PDF is rendered with PyMuPDF and sent in chunks.
+
+Needs composite indexes on Orders (client_id, created_at) and
+(supplier_id, created_at), and on statement_checkpoints (party_key, month).
+
+Public surface
+--------------
+- iter_statement(...)          -> generator of row dicts
+- build_statement(...)         -> dict
+- opening_balance(...)         -> float
+- invalidate_checkpoints(...)  -> int
+- statement_csv_chunks(...)    -> generator of str
+- statement_pdf_bytes(...)     -> bytes
+"""
+
+import csv
+import heapq
+import io
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, Optional
+
+from google.cloud import firestore
+from google.cloud.firestore_v1 import FieldFilter
+
+from firebase_config.config import db
+from firebase_config.payments_ledger import LEDGER_COLLECTION, _key_bound
+
+CHECKPOINTS_COLLECTION = "statement_checkpoints"
+PAGE_SIZE = 300
+
+PARTY_ORDER_TYPES = {
+    "client": ("sale", "delivery_challan"),
+    "supplier": ("purchase",),
+}
+
+ORDER_FIELDS = [
+    "created_at", "order_date", "order_type", "invoice_number", "challan_number",
+    "total_amount", "amount_paid", "payment_status", "draft",
+]
+PAYMENT_FIELDS = [
+    "entry_key", "created_at", "kind", "amount", "order_id", "payment_method", "remarks",
+]
+
+CSV_COLUMNS = ["date", "type", "reference", "description", "debit", "credit", "balance"]
+
+
+def _naive_utc(value) -> Optional[datetime]:
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _month_key(value: datetime) -> str:
+    return value.strftime("%Y-%m")
+
+
+def _month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def _next_month_start(month_key: str) -> datetime:
+    year, month = map(int, month_key.split("-"))
+    return datetime(year + month // 12, month % 12 + 1, 1)
+
+
+def _party_key(party_type: str, party_id: str) -> str:
+    return f"{party_type}_{party_id}"
+
+
+# ------------------------ Paged sources ------------------------
+
+def _paged(query, page_size: int = PAGE_SIZE) -> Iterator:
+    """Stream a sorted query in cursor pages instead of one long-lived stream."""
+    last = None
+    while True:
+        page = query.limit(page_size)
+        if last is not None:
+            page = page.start_after(last)
+        docs = list(page.stream())
+        yield from docs
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+
+
+def _order_events(party_type: str, party_id: str, start, end) -> Iterator[Dict]:
+    query = db.collection("Orders").where(filter=FieldFilter(f"{party_type}_id", "==", party_id))
+    if start:
+        query = query.where(filter=FieldFilter("created_at", ">=", start))
+    if end:
+        query = query.where(filter=FieldFilter("created_at", "<", end))
+    query = query.select(ORDER_FIELDS).order_by("created_at")
+
+    for doc in _paged(query):
+        data = doc.to_dict()
+        if data.get("draft") or data.get("order_type") not in PARTY_ORDER_TYPES[party_type]:
+            continue
+        reference = data.get("invoice_number") or data.get("challan_number") or doc.id
+        yield {
+            "date": _naive_utc(data.get("created_at")),
+            "type": data.get("order_type"),
+            "reference": reference,
+            "description": f"{data.get('order_type', 'order').replace('_', ' ').title()} {reference}",
+            "debit": float(data.get("total_amount", 0) or 0),
+            "credit": 0.0,
+        }
+
+
+def _payment_events(party_type: str, party_id: str, start, end) -> Iterator[Dict]:
+    query = (
+        db.collection(LEDGER_COLLECTION)
+        .where(filter=FieldFilter("party_type", "==", party_type))
+        .where(filter=FieldFilter("party_id", "==", party_id))
+    )
+    if start:
+        query = query.where(filter=FieldFilter("entry_key", ">=", _key_bound(start)))
+    if end:
+        query = query.where(filter=FieldFilter("entry_key", "<", _key_bound(end)))
+    query = query.select(PAYMENT_FIELDS).order_by("entry_key")
+
+    for doc in _paged(query):
+        data = doc.to_dict()
+        kind = data.get("kind", "payment")
+        method = data.get("payment_method")
+        description = kind.title() + (f" ({method})" if method else "")
+        if data.get("order_id"):
+            description += f" against {data['order_id']}"
+        yield {
+            "date": _naive_utc(data.get("created_at")),
+            "type": "payment",
+            "reference": data.get("order_id") or doc.id,
+            "description": description,
+            "debit": 0.0,
+            "credit": float(data.get("amount", 0) or 0),
+        }
+
+
+def _events(party_type: str, party_id: str, start=None, end=None) -> Iterator[Dict]:
+    """Orders and payments merged into one chronological stream; ``end`` is exclusive."""
+    return heapq.merge(
+        _order_events(party_type, party_id, start, end),
+        _payment_events(party_type, party_id, start, end),
+        key=lambda event: event["date"] or datetime.min,
+    )
+
+
+# ------------------------ Checkpoints ------------------------
+
+def _latest_checkpoint(party_type: str, party_id: str, before_month: str) -> Optional[Dict]:
+    docs = (
+        db.collection(CHECKPOINTS_COLLECTION)
+        .where(filter=FieldFilter("party_key", "==", _party_key(party_type, party_id)))
+        .where(filter=FieldFilter("month", "<", before_month))
+        .order_by("month", direction=firestore.Query.DESCENDING)
+        .limit(1)
+        .stream()
+    )
+    for doc in docs:
+        return doc.to_dict()
+    return None
+
+
+def _save_checkpoint(party_type: str, party_id: str, month: str, closing_balance: float):
+    db.collection(CHECKPOINTS_COLLECTION).document(f"{_party_key(party_type, party_id)}_{month}").set({
+        "party_key": _party_key(party_type, party_id),
+        "party_type": party_type,
+        "party_id": party_id,
+        "month": month,
+        "closing_balance": closing_balance,
+        "computed_at": datetime.utcnow(),
+    })
+
+
+def invalidate_checkpoints(party_type: str, party_id: str, from_date: datetime) -> int:
+    """Drop checkpoints from ``from_date``'s month onward after a past entry changes."""
+    if not party_id or from_date is None:
+        return 0
+    docs = (
+        db.collection(CHECKPOINTS_COLLECTION)
+        .where(filter=FieldFilter("party_key", "==", _party_key(party_type, party_id)))
+        .where(filter=FieldFilter("month", ">=", _month_key(_naive_utc(from_date))))
+        .select([])
+        .stream()
+    )
+    batch = db.batch()
+    deleted = 0
+    for doc in docs:
+        batch.delete(doc.reference)
+        deleted += 1
+    if deleted:
+        batch.commit()
+    return deleted
+
+
+def opening_balance(party_type: str, party_id: str, at: datetime) -> float:
+    """
+    Balance just before ``at``. Starts from the latest checkpoint and replays
+    only what came after it, writing checkpoints for any closed month it passes.
+    """
+    at = _naive_utc(at)
+    month_start = _month_start(at)
+    checkpoint = _latest_checkpoint(party_type, party_id, before_month=_month_key(at))
+    balance = checkpoint["closing_balance"] if checkpoint else 0.0
+    replay_from = _next_month_start(checkpoint["month"]) if checkpoint else None
+
+    # Replay whole months up to the start of ``at``'s month, checkpointing each.
+    current_month = _month_key(replay_from) if replay_from else None
+    for event in _events(party_type, party_id, replay_from, month_start):
+        event_month = _month_key(event["date"])
+        if current_month and event_month != current_month:
+            _save_checkpoint(party_type, party_id, current_month, balance)
+        current_month = event_month
+        balance += event["debit"] - event["credit"]
+
+    # The month before ``at`` is closed whenever ``at`` is not in the future.
+    previous_month = _month_key(month_start - timedelta(days=1))
+    if month_start <= datetime.utcnow() and (current_month or previous_month) <= previous_month:
+        _save_checkpoint(party_type, party_id, previous_month, balance)
+
+    # Partial month: replayed every time, never checkpointed.
+    for event in _events(party_type, party_id, month_start, at):
+        balance += event["debit"] - event["credit"]
+    return balance
+
+
+# ------------------------ Statements ------------------------
+
+def iter_statement(
+    party_type: str,
+    party_id: str,
+    date_from: datetime,
+    date_to: datetime,
+    opening: Optional[float] = None,
+) -> Iterator[Dict]:
+    """Statement rows with running balance, oldest first; ``date_to`` is inclusive."""
+    if party_type not in PARTY_ORDER_TYPES:
+        raise ValueError("party_type must be 'client' or 'supplier'")
+    balance = opening_balance(party_type, party_id, date_from) if opening is None else opening
+    # Inclusive upper bound: the first microsecond after date_to.
+    end = _naive_utc(date_to) + timedelta(microseconds=1)
+    for event in _events(party_type, party_id, _naive_utc(date_from), end):
+        balance += event["debit"] - event["credit"]
+        yield event | {"balance": round(balance, 2)}
+
+
+def build_statement(party_type: str, party_id: str, date_from: datetime, date_to: datetime) -> Dict:
+    opening = opening_balance(party_type, party_id, date_from)
+    rows = list(iter_statement(party_type, party_id, date_from, date_to, opening=opening))
+    total_debit = sum(row["debit"] for row in rows)
+    total_credit = sum(row["credit"] for row in rows)
+    return {
+        "party_type": party_type,
+        "party_id": party_id,
+        "date_from": date_from,
+        "date_to": date_to,
+        "opening_balance": round(opening, 2),
+        "total_debit": round(total_debit, 2),
+        "total_credit": round(total_credit, 2),
+        "closing_balance": round(opening + total_debit - total_credit, 2),
+        "rows": rows,
+    }
+
+
+def statement_csv_chunks(party_type: str, party_id: str, date_from: datetime, date_to: datetime) -> Iterator[str]:
+    """CSV text, one chunk per row, suitable for a StreamingResponse."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> str:
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return chunk
+
+    opening = opening_balance(party_type, party_id, date_from)
+    writer.writerow(CSV_COLUMNS)
+    writer.writerow(["", "opening", "", "Opening balance", "", "", f"{opening:.2f}"])
+    yield flush()
+    for row in iter_statement(party_type, party_id, date_from, date_to, opening=opening):
+        writer.writerow([
+            row["date"].strftime("%Y-%m-%d %H:%M") if row["date"] else "",
+            row["type"],
+            row["reference"],
+            row["description"],
+            f"{row['debit']:.2f}" if row["debit"] else "",
+            f"{row['credit']:.2f}" if row["credit"] else "",
+            f"{row['balance']:.2f}",
+        ])
+        yield flush()
+
+
+def statement_pdf_bytes(party_type: str, party_id: str, party_name: str, date_from: datetime, date_to: datetime) -> bytes:
+    """Plain tabular PDF of the statement, rendered with PyMuPDF."""
+    import fitz  # PyMuPDF; only needed for PDF output
+
+    statement = build_statement(party_type, party_id, date_from, date_to)
+    pdf = fitz.open()
+    line_height, top, bottom = 14, 50, 800
+    columns = [(40, "Date"), (130, "Reference"), (230, "Description"), (400, "Debit"), (460, "Credit"), (520, "Balance")]
+
+    def new_page():
+        page = pdf.new_page()
+        for x, title in columns:
+            page.insert_text((x, top), title, fontsize=9, fontname="hebo")
+        return page, top + line_height
+
+    page = pdf.new_page()
+    page.insert_text((40, 30), f"Statement of account - {party_name or party_id}", fontsize=13, fontname="hebo")
+    page.insert_text(
+        (40, 44),
+        f"{date_from:%d %b %Y} to {date_to:%d %b %Y} | Opening balance: {statement['opening_balance']:.2f}",
+        fontsize=9,
+    )
+    for x, title in columns:
+        page.insert_text((x, top + 16), title, fontsize=9, fontname="hebo")
+    y = top + 16 + line_height
+
+    for row in statement["rows"]:
+        if y > bottom:
+            page, y = new_page()
+        values = [
+            row["date"].strftime("%d-%m-%Y") if row["date"] else "",
+            str(row["reference"])[:18],
+            row["description"][:32],
+            f"{row['debit']:.2f}" if row["debit"] else "",
+            f"{row['credit']:.2f}" if row["credit"] else "",
+            f"{row['balance']:.2f}",
+        ]
+        for (x, _), value in zip(columns, values):
+            page.insert_text((x, y), value, fontsize=8)
+        y += line_height
+
+    if y > bottom - 2 * line_height:
+        page, y = new_page()
+    page.insert_text(
+        (40, y + line_height),
+        f"Total debit: {statement['total_debit']:.2f}   Total credit: {statement['total_credit']:.2f}   "
+        f"Closing balance: {statement['closing_balance']:.2f}",
+        fontsize=9,
+        fontname="hebo",
+    )
+    data = pdf.tobytes()
+    pdf.close()
+    return data
@@ -2,6 +2,8 @@ from firebase_config.config import db
 from google.cloud import firestore
 from typing import List, Dict
 from google.cloud.firestore_v1 import FieldFilter
+from firebase_config.payments_ledger import list_payments
+from firebase_config.entity_stats import get_entity_stats
 
 # Add a new supplier
 from google.cloud import firestore
@@ -84,21 +86,27 @@ def update_supplier_due(supplier_id: str, change_amount: float):
 
 # Get payment records made to a supplier
 def get_supplier_payments(supplier_id: str) -> List[Dict]:
-    docs = db.collection("P ayments").where(filter=FieldFilter("supplier_id", "==", supplier_id)).stream()
-    return [doc.to_dict() | {"id": doc.id} for doc in docs]
+    return list_payments(limit=100, party_type="supplier", party_id=supplier_id)["entries"]
 
 
 # Get all purchase orders from a supplier
-def get_supplier_order_history(supplier_id: str) -> list:
+def get_supplier_order_history(supplier_id: str, limit: int = 50) -> list:
     orders = (
         db.collection("Orders")
         .where(filter=FieldFilter("supplier_id", "==", supplier_id))
-        .where(filter=FieldFilter("type", "==", "purchase"))
+        .where(filter=FieldFilter("order_type", "==", "purchase"))
+        .order_by("created_at", direction=firestore.Query.DESCENDING)
+        .limit(limit)
         .stream()
     )
     return [doc.to_dict() | {"id": doc.id} for doc in orders]
 
 
+# Order count, lifetime value, last order date and outstanding due in one read
+def get_supplier_order_stats(supplier_id: str) -> Dict:
+    return get_entity_stats("supplier", supplier_id)
+
+
 # OPTIONAL: Add supply history for a specific item from a supplier
 def add_supply_record(supplier_id: str, item_id: str, supply_record: Dict):
     doc_ref = db.collection("Suppliers").document(supplier_id)
@@ -0,0 +1,400 @@
+"""
+tool_outputs.py — paged, projected and pre-aggregated output for list tools
+==========================================================================
+
+``GetAllClients``, ``GetAllOrders`` and the other list tools used to return
+whole collections, and the agent stringified all of it into Gemini's context.
+List tools are now built here and share one input shape (a dict, or a JSON
+object string)::
+
+    {"offset": 0, "limit": 20, "fields": ["name", "total_due"], "sort_by": "total_due", "descending": true}
+    {"aggregate": "count", "group_by": "status"}
+    {"aggregate": "sum", "field": "total_amount", "group_by": "client"}
+    {"aggregate": "top", "field": "total_due", "top_k": 5, "fields": ["name"]}
+
+- ``collection_tool(collection)`` answers from Firestore directly. It uses
+  ``select`` for projection, ``order_by`` / ``offset`` / ``limit`` for pages,
+  and Firestore's ``count`` / ``sum`` / ``avg`` aggregation queries. A grouped
+  aggregate streams only the two fields it needs.
+- ``list_tool(fetch)`` wraps an existing service function that returns a list.
+  It applies the same options to the rows in Python, and its plain-text input
+  goes to the function's first required argument, as before. With
+  ``query=`` (the unlimited Firestore query behind ``fetch``), counts, sums,
+  averages and ``total`` come from aggregation queries over every match, not
+  from the rows ``fetch`` happened to return.
+
+Pages default to ``TOOL_PAGE_SIZE`` rows. Whatever a tool returns then passes
+through ``bound_output``. Anything over ``TOOL_OUTPUT_TOKEN_BUDGET`` tokens is
+summarised deterministically: the row count, the field names, numeric totals,
+and as many leading rows as fit. That way a payload's size does not grow with
+the data volume.
+
+Public surface:
+    collection_tool(collection)   -> Callable[[str | dict], Any]
+    list_tool(fetch, query=None)  -> Callable[[str | dict], Any]
+    shape_rows(rows, params)      -> Dict
+    bound_output(value, budget=None) -> Any
+    OptionError, INVALID_INPUT_NOTE
+    TOOL_OUTPUT_TOKEN_BUDGET, TOOL_PAGE_SIZE, TOOL_MAX_PAGE_SIZE
+"""
+
+import functools
+import inspect
+import json
+import logging
+import os
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Union, get_args, get_origin
+
+from google.cloud import firestore
+
+from firebase_config.chat_memory import count_tokens
+from firebase_config.config import db
+
+logger = logging.getLogger(__name__)
+
+TOOL_OUTPUT_TOKEN_BUDGET = int(os.getenv("TOOL_OUTPUT_TOKEN_BUDGET", "1500"))
+TOOL_PAGE_SIZE = int(os.getenv("TOOL_PAGE_SIZE", "20"))
+TOOL_MAX_PAGE_SIZE = 100
+# Grouped aggregates list at most this many groups (largest first).
+TOOL_MAX_GROUPS = 25
+
+AGGREGATES = ("count", "sum", "avg", "min", "max", "top")
+_OPTIONS = ("offset", "limit", "fields", "sort_by", "descending", "aggregate", "field", "group_by", "top_k")
+
+# Returned instead of the exception text when a tool's own call fails.
+INVALID_INPUT_NOTE = "The tool could not run with that input. Check the argument names and use ISO dates (YYYY-MM-DD)."
+
+TRUNCATION_NOTE = (
+    "Output exceeded the size budget and was summarised. "
+    "Narrow it with limit/offset, fields, or an aggregate (count, sum, avg, top)."
+)
+
+_OPTIONS_SCHEMA = {
+    "offset": {"type": "INTEGER", "description": "Rows to skip (paging)."},
+    "limit": {"type": "INTEGER", "description": f"Rows per page, default {TOOL_PAGE_SIZE}, max {TOOL_MAX_PAGE_SIZE}."},
+    "fields": {"type": "ARRAY", "items": {"type": "STRING"}, "description": "Only return these fields."},
+    "sort_by": {"type": "STRING"},
+    "descending": {"type": "BOOLEAN"},
+    "aggregate": {"type": "STRING", "enum": list(AGGREGATES), "description": "Return an aggregate instead of rows."},
+    "field": {"type": "STRING", "description": "Numeric field for sum/avg/min/max/top."},
+    "group_by": {"type": "STRING", "description": "Group count/sum/avg/min/max by this field."},
+    "top_k": {"type": "INTEGER", "description": "Rows for aggregate=top, default 5."},
+}
+
+LIST_TOOL_HINT = (
+    ' Input (optional): {"offset", "limit", "fields": [...], "sort_by", "descending",'
+    ' "aggregate": "count|sum|avg|min|max|top", "field", "group_by", "top_k"}.'
+)
+
+
+# ---------------------------------------------------------------------------
+# Input
+# ---------------------------------------------------------------------------
+def _parse(raw: Any, first_arg: Optional[str] = None) -> Dict:
+    if isinstance(raw, dict):
+        return dict(raw)
+    text = str(raw or "").strip()
+    if text.startswith("{"):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pass
+    return {first_arg: text} if first_arg and text else {}
+
+
+def _page(params: Dict):
+    offset = max(0, int(params.get("offset") or 0))
+    limit = max(1, min(int(params.get("limit") or TOOL_PAGE_SIZE), TOOL_MAX_PAGE_SIZE))
+    return offset, limit
+
+
+def _fields(params: Dict) -> Optional[List[str]]:
+    fields = params.get("fields")
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    return list(fields) if fields else None
+
+
+class OptionError(ValueError):
+    """A paging/aggregate option the model can fix; its message is safe to return."""
+
+
+def _check(params: Dict):
+    aggregate = params.get("aggregate")
+    if aggregate and aggregate not in AGGREGATES:
+        raise OptionError(f"aggregate must be one of {', '.join(AGGREGATES)}")
+    if aggregate in ("sum", "avg", "min", "max", "top") and not params.get("field"):
+        raise OptionError(f"aggregate={aggregate} needs a numeric 'field'")
+
+
+def _is_date(annotation) -> bool:
+    """``datetime`` / ``date``, bare or wrapped in ``Optional``."""
+    if get_origin(annotation) is Union:
+        return any(_is_date(arg) for arg in get_args(annotation) if arg is not type(None))
+    return annotation in (datetime, date)
+
+
+# ---------------------------------------------------------------------------
+# In-memory shaping
+# ---------------------------------------------------------------------------
+def _number(value) -> Optional[float]:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _project(row: Dict, fields: Optional[List[str]]) -> Dict:
+    if not fields:
+        return row
+    return {key: row.get(key) for key in ["id", *fields] if key in row}
+
+
+def _combine(aggregate: str, values: List[float]):
+    if aggregate == "count":
+        return len(values)
+    if not values:
+        return None
+    if aggregate == "sum":
+        return round(sum(values), 2)
+    if aggregate == "avg":
+        return round(sum(values) / len(values), 2)
+    return min(values) if aggregate == "min" else max(values)
+
+
+def _aggregate_rows(rows: List[Dict], params: Dict) -> Dict:
+    aggregate, field, group_by = params["aggregate"], params.get("field"), params.get("group_by")
+    if aggregate == "top":
+        top_k = max(1, min(int(params.get("top_k") or 5), TOOL_MAX_PAGE_SIZE))
+        ranked = sorted((r for r in rows if _number(r.get(field)) is not None), key=lambda r: r[field], reverse=True)
+        fields = _fields(params)
+        return {"aggregate": "top", "field": field, "rows": [_project(r, fields and [*fields, field]) for r in ranked[:top_k]]}
+
+    def values(group):
+        if aggregate == "count":
+            return [1 for _ in group]
+        return [v for v in (_number(r.get(field)) for r in group) if v is not None]
+
+    if not group_by:
+        return {"aggregate": aggregate, "field": field, "rows_considered": len(rows), "value": _combine(aggregate, values(rows))}
+    groups: Dict[str, List[Dict]] = {}
+    for row in rows:
+        groups.setdefault(str(row.get(group_by, "")), []).append(row)
+    results = sorted(
+        ((key, _combine(aggregate, values(group))) for key, group in groups.items()),
+        key=lambda item: item[1] if item[1] is not None else float("-inf"),
+        reverse=True,
+    )
+    return {
+        "aggregate": aggregate,
+        "field": field,
+        "group_by": group_by,
+        "group_count": len(results),
+        "groups": dict(results[:TOOL_MAX_GROUPS]),
+    }
+
+
+def shape_rows(rows: List[Dict], params: Dict) -> Dict:
+    """Apply the list-tool options to rows already in memory."""
+    _check(params)
+    if params.get("aggregate"):
+        return _aggregate_rows(rows, params)
+    sort_by = params.get("sort_by")
+    if sort_by:
+        present = [r for r in rows if r.get(sort_by) is not None]
+        missing = [r for r in rows if r.get(sort_by) is None]
+        rows = sorted(present, key=lambda r: r[sort_by], reverse=bool(params.get("descending"))) + missing
+    offset, limit = _page(params)
+    fields = _fields(params)
+    page = [_project(row, fields) for row in rows[offset:offset + limit]]
+    return {"total": len(rows), "offset": offset, "limit": limit, "has_more": offset + limit < len(rows), "rows": page}
+
+
+# ---------------------------------------------------------------------------
+# Firestore-backed
+# ---------------------------------------------------------------------------
+def _aggregate_value(query, aggregate: str, field: Optional[str]):
+    if aggregate == "count":
+        aggregation = query.count(alias="value")
+    else:
+        aggregation = getattr(query, aggregate)(field, alias="value")
+    return aggregation.get()[0][0].value
+
+
+def _shape_collection(collection: str, params: Dict) -> Dict:
+    _check(params)
+    query = db.collection(collection)
+    aggregate, field, group_by = params.get("aggregate"), params.get("field"), params.get("group_by")
+    fields = _fields(params)
+
+    if aggregate in ("count", "sum", "avg") and not group_by:
+        return {"aggregate": aggregate, "field": field, "value": _aggregate_value(query, aggregate, field)}
+    if aggregate == "top":
+        top_k = max(1, min(int(params.get("top_k") or 5), TOOL_MAX_PAGE_SIZE))
+        query = query.order_by(field, direction=firestore.Query.DESCENDING).limit(top_k)
+        if fields:
+            query = query.select([*fields, field])
+        return {"aggregate": "top", "field": field, "rows": [doc.to_dict() | {"id": doc.id} for doc in query.stream()]}
+    if aggregate:
+        # Grouped (or min/max) aggregates: stream just the fields involved.
+        needed = [f for f in (group_by, field) if f]
+        rows = [doc.to_dict() | {"id": doc.id} for doc in query.select(needed).stream()]
+        return _aggregate_rows(rows, params)
+
+    total = _aggregate_value(query, "count", None)
+    offset, limit = _page(params)
+    if params.get("sort_by"):
+        direction = firestore.Query.DESCENDING if params.get("descending") else firestore.Query.ASCENDING
+        query = query.order_by(params["sort_by"], direction=direction)
+    query = query.offset(offset).limit(limit)
+    if fields:
+        query = query.select(fields)
+    rows = [doc.to_dict() | {"id": doc.id} for doc in query.stream()]
+    return {"total": total, "offset": offset, "limit": limit, "has_more": offset + len(rows) < total, "rows": rows}
+
+
+def _shape_filtered(fetch: Callable[..., List[Dict]], query, params: Dict) -> Dict:
+    """Like ``_shape_collection`` over a filtered query; unsorted pages come from ``fetch``."""
+    _check(params)
+    aggregate, field, group_by = params.get("aggregate"), params.get("field"), params.get("group_by")
+    if aggregate in ("count", "sum", "avg") and not group_by:
+        return {"aggregate": aggregate, "field": field, "value": _aggregate_value(query, aggregate, field)}
+    sort_by, fields = params.get("sort_by"), _fields(params)
+    if aggregate or sort_by:
+        # Every match, streaming only the fields involved where that is known.
+        if aggregate and aggregate != "top":
+            needed = [f for f in (group_by, field) if f]
+        else:
+            needed = fields and [*fields, *(f for f in (field, sort_by) if f)]
+        rows = [doc.to_dict() | {"id": doc.id} for doc in (query.select(needed) if needed else query).stream()]
+        return shape_rows(rows, params)
+
+    total = _aggregate_value(query, "count", None)
+    offset, limit = _page(params)
+    page = shape_rows(fetch(limit=offset + limit) or [], params)
+    return page | {"total": total, "has_more": offset + len(page["rows"]) < total}
+
+
+def collection_tool(collection: str) -> Callable[[Any], Any]:
+    """A list tool over a whole Firestore collection, paged and aggregated by Firestore."""
+
+    def run(raw: Any = None):
+        try:
+            return bound_output(_shape_collection(collection, _parse(raw)))
+        except OptionError as e:
+            return str(e)
+        except (TypeError, ValueError):
+            logger.warning(f"List tool over {collection} failed", exc_info=True)
+            return INVALID_INPUT_NOTE
+
+    run.parameters_schema = {"type": "OBJECT", "properties": dict(_OPTIONS_SCHEMA)}
+    return run
+
+
+def list_tool(fetch: Callable[..., List[Dict]], query: Optional[Callable] = None) -> Callable[[Any], Any]:
+    """
+    Wrap a list-returning service function. Its own arguments are read from
+    the same input dict (ISO strings for ``datetime`` arguments); options the
+    function also takes, such as ``limit``, stay with the paging.
+
+    ``query`` takes the same filter arguments and returns the Firestore query
+    behind ``fetch`` without a limit, so aggregates and totals cover every
+    match instead of ``fetch``'s default page.
+    """
+    params_of = {
+        name: param for name, param in inspect.signature(fetch).parameters.items() if name not in _OPTIONS
+    }
+    first_required = next((name for name, p in params_of.items() if p.default is p.empty), None)
+
+    def run(raw: Any = None):
+        params = _parse(raw, first_required)
+        kwargs = {}
+        try:
+            for name, param in params_of.items():
+                if name not in params:
+                    continue
+                value = params[name]
+                if isinstance(value, str) and (_is_date(param.annotation) or name.endswith("_date")):
+                    value = datetime.fromisoformat(value)
+                kwargs[name] = value
+            if query is not None:
+                bound = functools.partial(fetch, **kwargs)
+                return bound_output(_shape_filtered(bound, query(**kwargs), params))
+            return bound_output(shape_rows(fetch(**kwargs) or [], params))
+        except OptionError as e:
+            return str(e)
+        except (TypeError, ValueError):
+            logger.warning(f"List tool {fetch.__name__} failed", exc_info=True)
+            return INVALID_INPUT_NOTE
+
+    json_types = {int: "INTEGER", float: "NUMBER", bool: "BOOLEAN"}
+    own = {
+        name: {"type": json_types.get(p.annotation, "STRING")} | (
+            {"description": "ISO date, YYYY-MM-DD"} if _is_date(p.annotation) or name.endswith("_date") else {}
+        )
+        for name, p in params_of.items()
+    }
+    run.parameters_schema = {
+        "type": "OBJECT",
+        "properties": own | _OPTIONS_SCHEMA,
+        "required": [name for name, p in params_of.items() if p.default is p.empty],
+    }
+    return run
+
+
+# ---------------------------------------------------------------------------
+# Token budget
+# ---------------------------------------------------------------------------
+def _json_safe(value: Any) -> Any:
+    return json.loads(json.dumps(value, default=str))
+
+
+def _tokens(value: Any) -> int:
+    return count_tokens(value if isinstance(value, str) else json.dumps(value, ensure_ascii=False))
+
+
+def _summarise_rows(rows: List, budget: int) -> Dict:
+    summary: Dict[str, Any] = {"count": len(rows), "truncated": True, "note": TRUNCATION_NOTE}
+    records = [row for row in rows if isinstance(row, dict)]
+    if records:
+        fields = sorted({key for row in records for key in row})
+        summary["fields"] = fields[:40]
+        totals = {}
+        for field in fields:
+            numbers = [_number(row.get(field)) for row in records if field in row]
+            if numbers and all(n is not None for n in numbers):
+                totals[field] = round(sum(numbers), 2)
+        if totals:
+            summary["numeric_totals"] = totals
+    sample = []
+    for row in rows:
+        if _tokens(summary | {"sample": sample + [row]}) > budget:
+            break
+        sample.append(row)
+    summary["sample"] = sample
+    return summary
+
+
+def _truncate_text(text: str, budget: int) -> Dict:
+    # ~3 characters per token keeps dense JSON under the budget.
+    return {"text": text[: budget * 3], "truncated": True, "note": TRUNCATION_NOTE}
+
+
+def bound_output(value: Any, budget: Optional[int] = None) -> Any:
+    """``value`` unchanged (JSON-safe) if within ``budget`` tokens, else a summary that is."""
+    budget = budget or TOOL_OUTPUT_TOKEN_BUDGET
+    value = value if isinstance(value, str) else _json_safe(value)
+    if _tokens(value) <= budget:
+        return value
+
+    if isinstance(value, list):
+        bounded = _summarise_rows(value, budget)
+    elif isinstance(value, dict) and any(isinstance(v, list) for v in value.values()):
+        # Keep the scalar keys (total, offset, …) and summarise the biggest list.
+        key = max((k for k, v in value.items() if isinstance(v, list)), key=lambda k: _tokens(value[k]))
+        rest = {k: v for k, v in value.items() if k != key}
+        bounded = rest | {key: _summarise_rows(value[key], max(budget - _tokens(rest), budget // 4))}
+    else:
+        bounded = value
+    if _tokens(bounded) > budget:
+        text = bounded if isinstance(bounded, str) else json.dumps(bounded, ensure_ascii=False)
+        bounded = _truncate_text(text, budget)
+    return bounded
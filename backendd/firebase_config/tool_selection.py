@@ -0,0 +1,89 @@
+"""
+tool_selection.py — pick the few tools a question needs before the agent runs
+============================================================================
+
+``all_tools`` has ~70 entries, and a ZERO_SHOT_REACT prompt lists every name
+and description on every step. Instead, each tool's ``name: description`` is
+embedded once (the shared embedding model and its persistent cache), and each
+question gets only:
+
+- the ``TOOL_SELECTION_TOP_K`` tools most similar to the question, plus
+- the always-on ``CORE_TOOLS``, which are generic fallbacks so coverage never
+  depends on retrieval alone.
+
+``TOOL_SELECTION_ENABLED=false`` turns selection off and hands the agent every tool.
+
+Public surface:
+    select_tools(question, top_k=None) -> List[Tool]
+    unique_tools                       -> List[Tool]  (all_tools, first definition per name)
+    warmup()                           -> int         (embeds descriptions ahead of time)
+    CORE_TOOLS, TOOL_SELECTION_TOP_K, TOOL_SELECTION_ENABLED
+"""
+
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+from langchain.tools import Tool
+from llama_index.core import Settings
+
+from firebase_config.tools import all_tools
+
+TOOL_SELECTION_ENABLED = os.getenv("TOOL_SELECTION_ENABLED", "true").lower() != "false"
+TOOL_SELECTION_TOP_K = int(os.getenv("TOOL_SELECTION_TOP_K", "8"))
+
+# Always offered: broad search fallbacks and the overall stats lookup.
+CORE_TOOLS = (
+    "SemanticSearchOrders",
+    "SemanticSearchClients",
+    "SemanticSearchInventory",
+    "GetOverallDocStats",
+)
+
+
+def _dedupe(tools: List[Tool]) -> List[Tool]:
+    # all_tools registers a few names twice; the agent needs unique names.
+    first = {}
+    for tool in tools:
+        first.setdefault(tool.name, tool)
+    return list(first.values())
+
+
+unique_tools: List[Tool] = _dedupe(all_tools)
+
+_matrix: Optional[np.ndarray] = None
+_matrix_lock = threading.Lock()
+
+
+def _tool_matrix() -> np.ndarray:
+    """Unit-normalised description embeddings, one row per tool in ``unique_tools``."""
+    global _matrix
+    if _matrix is None:
+        with _matrix_lock:
+            if _matrix is None:
+                vectors = np.array(
+                    Settings.embed_model.get_text_embedding_batch(
+                        [f"{tool.name}: {tool.description}" for tool in unique_tools]
+                    ),
+                    dtype=np.float32,
+                )
+                _matrix = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return _matrix
+
+
+def select_tools(question: str, top_k: Optional[int] = None) -> List[Tool]:
+    """Core tools plus the top-k by description similarity, in ``all_tools`` order."""
+    if not TOOL_SELECTION_ENABLED:
+        return unique_tools
+    top_k = top_k or TOOL_SELECTION_TOP_K
+    query = np.array(Settings.embed_model.get_query_embedding(question), dtype=np.float32)
+    scores = _tool_matrix() @ (query / np.linalg.norm(query))
+    chosen = {unique_tools[i].name for i in np.argsort(-scores)[:top_k]}
+    chosen.update(CORE_TOOLS)
+    return [tool for tool in unique_tools if tool.name in chosen]
+
+
+def warmup() -> int:
+    """Embed the tool descriptions ahead of the first question; returns the tool count."""
+    return len(_tool_matrix()) if TOOL_SELECTION_ENABLED else 0
@@ -5,169 +5,103 @@ from firebase_config.finance import *
 
 from firebase_config.orders import *
 from firebase_config.suppliers import *
-from firebase_config.llama_index_configs.order_index import load_orders_index
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-# from llama_index import ServiceContext
-# from llama_index_configs.order_index import load_orders_index
 from firebase_config.llama_index_configs import global_settings  # triggers embedding config
 from firebase_config.employess import *
 from firebase_config.doc_counters import *
-# Create service_context once, or pass it as a parameter
-# firebase_config/tools.py or wherever your tools are defined
+from firebase_config.llama_index_configs.semantic_search import semantic_tool_func
+from firebase_config.llama_index_configs.documents import PAYLOAD_INDEXES
+from firebase_config.tool_outputs import LIST_TOOL_HINT, collection_tool, list_tool
 
-from firebase_config.llama_index_configs.order_index import load_orders_index
-
-from firebase_config.llama_index_configs.item_index import load_items_index
-from firebase_config.llama_index_configs.supplier_index import load_suppliers_index
-from firebase_config.llama_index_configs.client_index import load_clients_index
-
-from firebase_config.llama_index_configs.expense_index import load_expenses_index
-from firebase_config.llama_index_configs.employees_sync import load_employees_index
-from firebase_config.llama_index_configs.doc_counter_index import load_doc_counter_index
-# from firebase_config.llama_index_configs.client_index2 import load_clients_index
-def query_orders_semantic(query: str) -> str:
-    try:
-        index = load_orders_index()
-        response = index.as_query_engine().query(query)
-        return str(response)
-    except FileNotFoundError:
-        return "Orders index not found. Please build it first."
-    except Exception as e:
-        return f"Error querying orders index: {e}"
-
-
-def query_employees_semantic(query: str) -> str:
-    try:
-        index = load_employees_index()
-        response = index.as_query_engine().query(query)
-        return str(response)
-    except FileNotFoundError:
-        return "Employees index not found. Please build it first."
-    except Exception as e:
-        return f"Error querying employees index: {e}"
-
-def query_doc_counters_semantic(query: str) -> str:
-    try:
-        from firebase_config.llama_index_configs.doc_counter_index import load_doc_counter_index
-        index = load_doc_counter_index()
-        response = index.as_query_engine().query(query)
-        return str(response)
-    except FileNotFoundError:
-        return "Doc counter index not found. Please build it first."
-    except Exception as e:
-        return f"Error querying doc counter index: {e}"
+# Semantic tools run filtered hybrid (keyword + vector) retrieval and return
+# the best-matching records (text, id, score); there is no synthesis step.
+_SEMANTIC_INPUT_HINT = (
+    ' Input: a query string, or {"query": ..., "top_k": 5, "min_score": 0.3, "filters": {...}}.'
+)
 
 
-def query_items_semantic(query: str) -> str:
-    try:
-        index = load_items_index()
-        response = index.as_query_engine().query(query)
-        return str(response)
-    except FileNotFoundError:
-        return "Orders index not found. Please build it first."
-    except Exception as e:
-        return f"Error querying orders index: {e}"
-    
-def query_clients_semantic(query: str) -> str:
-    try:
-        index = load_clients_index()
-        # print(f"✅ Loaded index, using vector store: {index._vector_store._collection_name}")
-        response = index.as_query_engine().query(query)
-        return str(response)
-    except FileNotFoundError:
-        return "Clients index not found. Please build it first."
-    except Exception as e:
-        return f"Error querying clients index: {e}"
+def _filter_hint(collection: str) -> str:
+    fields = [field for field, kind in PAYLOAD_INDEXES[collection].items() if kind == "keyword"]
+    if "datetime" in PAYLOAD_INDEXES[collection].values():
+        fields += ["month (YYYY-MM)", "date_from", "date_to"]
+    return f" Filter fields: {', '.join(fields)}."
 
-def query_suppliers_semantic(query: str) -> str:
-    try:
-        index = load_suppliers_index()
-        response = index.as_query_engine().query(query)
-        return str(response)
-    except FileNotFoundError:
-        return "Orders index not found. Please build it first."
-    except Exception as e:
-        return f"Error querying orders index: {e}"
-        
-def query_expenses_semantic(query: str) -> str:
-    try:
-        index = load_expenses_index()
-        response = index.as_query_engine().query(query)
-        return str(response)
-    except FileNotFoundError:
-        return "Orders index not found. Please build it first."
-    except Exception as e:
-        return f"Error querying orders index: {e}"
-    
-semantic_search_tools = [Tool(
+semantic_search_tools = [
+    Tool(
         name="SemanticSearchInventory",
-        func=query_items_semantic,
-        description="Semantic search over orders when exact tool is not found."
+        func=semantic_tool_func("items"),
+        description="Semantic search over inventory items when exact tool is not found." + _SEMANTIC_INPUT_HINT + _filter_hint("items")
     ),
     Tool(
         name="SemanticSearchClients",
-        func=query_clients_semantic,
-        description="Semantic search over orders when exact tool is not found."
+        func=semantic_tool_func("clients"),
+        description="Semantic search over clients when exact tool is not found." + _SEMANTIC_INPUT_HINT + _filter_hint("clients")
     ),
     Tool(
         name="SemanticSearchSuppliers",
-        func=query_suppliers_semantic,
-        description="Semantic search over orders when exact tool is not found."
+        func=semantic_tool_func("suppliers"),
+        description="Semantic search over suppliers when exact tool is not found." + _SEMANTIC_INPUT_HINT + _filter_hint("suppliers")
     ),
     Tool(
         name="SemanticSearchOrders",
-        func=query_orders_semantic,
-        description="Semantic search over orders when exact tool is not found."
+        func=semantic_tool_func("orders"),
+        description="Semantic + keyword search over orders (matches exact invoice/challan and batch numbers) when exact tool is not found." + _SEMANTIC_INPUT_HINT + _filter_hint("orders")
     ),
     Tool(
         name="SemanticSearchEmployees",
-        func=query_employees_semantic,
-        description="Semantic search over employees when exact tool is not found."
+        func=semantic_tool_func("employees"),
+        description="Semantic search over employees when exact tool is not found." + _SEMANTIC_INPUT_HINT + _filter_hint("employees")
     ),
     Tool(
         name="SemanticSearchExpenses",
-        func=query_expenses_semantic,
-        description="Semantic search over orders when exact tool is not found."
+        func=semantic_tool_func("expenses"),
+        description="Semantic search over expenses when exact tool is not found." + _SEMANTIC_INPUT_HINT + _filter_hint("expenses")
     ),
-    Tool(name = "SemanticSearchDocCounters",func =  query_doc_counters_semantic, description = "Semantic search over doc_counters collection.")
-    ]
+    Tool(
+        name="SemanticSearchDocCounters",
+        func=semantic_tool_func("doc_counter"),
+        description="Semantic search over doc_counters collection." + _SEMANTIC_INPUT_HINT + _filter_hint("doc_counter")
+    ),
+]
 # Inventory tools
 inventory_tools = [
     
-    Tool("GetInventoryItemByName", get_inventory_item_by_name, "Get inventory item details by item name."),
-    Tool("SearchInventoryByPartialName", search_inventory_by_partial_name, "Search inventory items by partial item name."),
+    Tool("GetInventoryItemByName", list_tool(get_inventory_item_by_name), "Get inventory item details by item name." + LIST_TOOL_HINT),
+    Tool("SearchInventoryByPartialName", list_tool(search_inventory_by_partial_name), "Search inventory items by partial item name." + LIST_TOOL_HINT),
     Tool("AddInventoryItem", lambda item_data: str(add_inventory_item(item_data)), "Add a new item to the inventory."),
     # Tool("UpdateInventoryItem", lambda data: update_inventory_item(data['item_id'], data['updated_fields']) or "Updated", "Update inventory item."),
     Tool("DeleteInventoryItem", lambda item_id: delete_inventory_item(item_id) or "Deleted", "Delete inventory item by ID."),
-    Tool("GetAllInventoryItems", lambda _: get_all_inventory_items(), "Get all inventory items."),
+    Tool("GetAllInventoryItems", collection_tool("Inventory Items"), "Get all inventory items, paged; aggregate for counts and totals." + LIST_TOOL_HINT),
     Tool("GetInventoryItemById", get_inventory_item_by_id, "Get inventory item by ID."),
-    Tool("GetLowStockItems", lambda _: get_low_stock_items(), "Get items with low stock."),
-    Tool("GetItemsByCategory", get_items_by_category, "Get inventory items by category."),
-    Tool("GetItemsExpiringSoon", lambda _: get_items_expiring_soon(), "Get inventory items expiring soon."),
+    Tool("GetLowStockItems", list_tool(get_low_stock_items), "Get items with low stock." + LIST_TOOL_HINT),
+    Tool("GetItemsByCategory", list_tool(get_items_by_category), "Get inventory items by category." + LIST_TOOL_HINT),
+    Tool("GetItemsExpiringSoon", list_tool(get_items_expiring_soon), "Get inventory items expiring soon." + LIST_TOOL_HINT),
 ]
 # Clients tools
 client_tools = [
     
-    Tool("GetClientByName", get_client_by_name, "Get client details by client name."),
-    Tool("SearchClientsByPartialName", search_clients_by_partial_name, "Search clients by partial name."),
-    Tool(name="GetAllClients", func=lambda _: get_all_clients(), description="Get all clients.", return_direct=True),
+    Tool("GetClientByName", list_tool(get_client_by_name), "Get client details by client name." + LIST_TOOL_HINT),
+    Tool("SearchClientsByPartialName", list_tool(search_clients_by_partial_name), "Search clients by partial name." + LIST_TOOL_HINT),
+    Tool(name="GetAllClients", func=collection_tool("Clients"), description="Get all clients, paged; aggregate for counts and totals." + LIST_TOOL_HINT, return_direct=True),
     Tool("AddClient", lambda data: str(add_client(data)), "Add a new client."),
     Tool("UpdateClient", lambda data: update_client(data['client_id'], data['updated_fields']) or "Updated", "Update client."),
     Tool("DeleteClient", lambda client_id: delete_client(client_id) or "Deleted", "Delete client."),
-    Tool("GetClientOrderHistory", get_client_order_history, "Get all orders made by a specific client."),
-    Tool("GetClientPayments", get_client_payments, "Get payment history of a client."),
+    Tool("GetClientOrderHistory", list_tool(get_client_order_history), "Get the latest orders made by a specific client." + LIST_TOOL_HINT),
+    Tool("GetClientOrderStats", get_client_order_stats, "Get a client's order count, lifetime value, last order date, outstanding due and average order size by client ID."),
+    Tool("GetClientPayments", list_tool(get_client_payments), "Get payment history of a client." + LIST_TOOL_HINT),
     # Tool("UpdateClientDue", lambda data: update_client_due(data['client_id'], data['amount']) or "Updated", "Update client's due amount."),
 ]
 # Suppliers tools
 supplier_tools = [
     
-    Tool("GetSupplierByName", get_supplier_by_name, "Get supplier details by supplier name."),
-    Tool("SearchSuppliersByPartialName", search_suppliers_by_partial_name, "Search suppliers by partial name."),
+    Tool("GetSupplierByName", list_tool(get_supplier_by_name), "Get supplier details by supplier name." + LIST_TOOL_HINT),
+    Tool("SearchSuppliersByPartialName", list_tool(search_suppliers_by_partial_name), "Search suppliers by partial name." + LIST_TOOL_HINT),
+    Tool("GetAllSuppliers", collection_tool("Suppliers"), "Get all suppliers, paged; aggregate for counts and totals." + LIST_TOOL_HINT),
     Tool("AddSupplier", lambda data: str(add_supplier(data)), "Add a new supplier."),
     Tool("UpdateSupplier", lambda data: update_supplier(data['supplier_id'], data['updated_fields']) or "Updated", "Update supplier."),
     Tool("DeleteSupplier", lambda supplier_id: delete_supplier(supplier_id) or "Deleted", "Delete supplier."),
-    Tool("GetSupplierOrderHistory", get_supplier_order_history, "Get order history of a supplier."),
-    Tool("GetSupplierPayments", get_supplier_payments, "Get payment history to a supplier."),
+    Tool("GetSupplierOrderHistory", list_tool(get_supplier_order_history), "Get the latest purchase orders of a supplier." + LIST_TOOL_HINT),
+    Tool("GetSupplierOrderStats", get_supplier_order_stats, "Get a supplier's order count, lifetime value, last order date, outstanding due and average order size by supplier ID."),
+    Tool("GetSupplierPayments", list_tool(get_supplier_payments, supplier_payments_query), "Get payment history to a supplier." + LIST_TOOL_HINT),
     Tool("UpdateSupplierDue", lambda data: update_supplier_due(data['supplier_id'], data['amount']) or "Updated", "Update supplier's due amount."),
     Tool("AddSupplyRecord", lambda data: str(add_supply_record(data)), "Add a new supply record for a supplier."),
 ]
@@ -179,16 +113,16 @@ order_tools = [
     Tool("UpdateOrder", lambda data: update_order(data['order_id'], data['updated_fields']) or "Updated", "Update order."),
     Tool("DeleteOrder", lambda order_id: delete_order(order_id) or "Deleted", "Delete order."),
     
-    Tool("GetOrdersByClient", get_orders_by_client, "Get orders made by a client."),
-    Tool("GetOrdersBySupplier", get_orders_by_supplier, "Get orders made from a supplier."),
-    Tool("GetOrdersByStatus", get_orders_by_status, "Get orders by status."),
-    Tool("GetOrdersByDateRange", lambda data: get_orders_by_date_range(data['start_date'], data['end_date']), "Get orders within a date range."),
+    Tool("GetOrdersByClient", list_tool(get_orders_by_client), "Get orders made by a client." + LIST_TOOL_HINT),
+    Tool("GetOrdersBySupplier", list_tool(get_orders_by_supplier), "Get orders made from a supplier." + LIST_TOOL_HINT),
+    Tool("GetOrdersByStatus", list_tool(get_orders_by_status), "Get orders by status." + LIST_TOOL_HINT),
+    Tool("GetOrdersByDateRange", list_tool(get_orders_by_date_range), "Get orders within a date range (start_date, end_date)." + LIST_TOOL_HINT),
     Tool("GetTotalSalesInPeriod", lambda data: get_total_sales_in_period(data['start_date'], data['end_date']), "Get total sales in a given period."),
 
-    Tool("GetAllOrders", lambda _: get_all_orders(), "Get all orders.", return_direct=True),
+    Tool("GetAllOrders", collection_tool("Orders"), "Get all orders, paged; aggregate for counts and totals." + LIST_TOOL_HINT, return_direct=True),
     
     # 🔍 Invoice-related tools (now inside Orders)
-    Tool("SearchOrdersByInvoiceNumber", search_orders_by_invoice_number, "Search orders by invoice number."),
+    Tool("SearchOrdersByInvoiceNumber", list_tool(search_orders_by_invoice_number), "Search orders by invoice number." + LIST_TOOL_HINT),
     Tool("GetInvoiceByOrderId", get_invoice_by_order_id, "Get invoice details using order ID."),
     
 ]
@@ -198,10 +132,10 @@ employee_tools = [
     Tool("AddEmployee", lambda data: str(add_employee(data)), "Add new employee."),
     Tool("UpdateEmployee", lambda data: update_employee(data['employee_id'], data['updated_fields']) or "Updated", "Update employee details."),
     Tool("DeleteEmployee", lambda emp_id: delete_employee(emp_id) or "Deleted", "Delete employee by ID."),
-    Tool("GetAllEmployees", lambda _: get_all_employees(), "Get all employees."),
+    Tool("GetAllEmployees", collection_tool("Employees"), "Get all employees, paged." + LIST_TOOL_HINT),
     Tool("GetEmployeeById", get_employee_by_id, "Get employee details by ID."),
-    Tool("GetEmployeeCollections", get_employee_collections, "Get amounts collected by employee."),
-    Tool("GetEmployeePayments", get_employee_payments, "Get amounts paid by employee."),
+    Tool("GetEmployeeCollections", list_tool(get_employee_collections), "Get amounts collected by employee." + LIST_TOOL_HINT),
+    Tool("GetEmployeePayments", list_tool(get_employee_payments), "Get amounts paid by employee." + LIST_TOOL_HINT),
 ]
 # Finance tools
 finance_tools = [
@@ -209,13 +143,15 @@ finance_tools = [
     Tool("AddExpense", lambda data: str(add_expense(data)), "Add a new expense."),
     Tool("AddPayment", lambda data: str(add_payment(data)), "Add a new payment."),
     Tool("AddSupplierPayment", lambda data: str(add_supplier_payment(data)), "Add a payment to a supplier."),
-    Tool("GetAllDues", lambda _: get_all_dues(), "Get all dues."),
-    Tool("GetExpenses", lambda _: get_expenses(), "Get all expenses."),
-    Tool("GetPayments", lambda _: get_payments(), "Get all payments."),
-    Tool("GetSupplierPayments", get_supplier_payments, "Get all payments made to a supplier."),
+    Tool("GetAllDues", list_tool(get_all_dues), "Get all dues." + LIST_TOOL_HINT),
+    Tool("GetExpenses", list_tool(get_expenses, expenses_query), "Get recent expenses (optional category, paid_by, start_date, end_date)." + LIST_TOOL_HINT),
+    Tool("GetPayments", list_tool(get_payments, payments_query), "Get recent payments (optional client_id, start_date, end_date)." + LIST_TOOL_HINT),
+    Tool("GetSupplierPayments", list_tool(get_supplier_payments, supplier_payments_query), "Get all payments made to a supplier." + LIST_TOOL_HINT),
     Tool("UpdateExpense", lambda data: update_expense(data['expense_id'], data['updated_fields']) or "Updated", "Update an expense."),
     Tool("DeleteExpense", lambda expense_id: delete_expense(expense_id) or "Deleted", "Delete an expense by ID."),
     Tool("GetTotalExpenses", lambda _: get_total_expenses(), "Get total expense amount."),
+    Tool("GetExpenseBreakdown", lambda data: get_expense_breakdown(**data) if isinstance(data, dict) else get_expense_breakdown(data or "category"),
+         "Get expense totals grouped by 'category', 'payer' or 'month'. Pass a dict like {'group_by': 'category', 'month': 'YYYY-MM'} to limit to one month."),
     Tool("GetTotalPayments", lambda _: get_total_payments(), "Get total payment amount."),
 ]
 
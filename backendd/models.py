@@ -541,6 +541,27 @@ class ClientHistoryResponse(BaseModel):
     pagination: Pagination
 
 
+class EntityStats(BaseModel):
+    """Per-client / per-supplier order statistics from `entity_stats`.
+
+    Maintained by the order write path with atomic increments, so the client
+    and supplier pages read one document instead of counting orders.
+    `average_order_size` is derived on read from `lifetime_value / total_orders`.
+    """
+
+    id: str
+    party_type: str
+    party_name: Optional[str] = None
+    order_count: Dict[str, int] = {}
+    draft_count: Dict[str, int] = {}
+    total_orders: int = 0
+    lifetime_value: float = 0
+    total_paid: float = 0
+    outstanding_due: float = 0
+    average_order_size: float = 0
+    last_order_date: Optional[datetime] = None
+
+
 # =============================================================================
 # FINANCE — EXPENSES & PAYMENTS
 # =============================================================================
@@ -594,10 +615,12 @@ class PaymentStatusUpdate(BaseModel):
 
 
 class PaymentRecord(BaseModel):
-    """A single payment row, derived from orders that have `amount_paid > 0`.
+    """A single payment row, read from the append-only payments ledger.
 
-    `payment_type` is "received" for sales/challans and "paid" for purchases, so
-    the finance tab can show money-in and money-out in one feed.
+    `payment_type` is "received" for client payments and "paid" for supplier
+    payments, so the finance tab can show money-in and money-out in one feed.
+    Reversals and corrections appear as entries with a negative `amount_paid`;
+    `running_total` is the party's total after the entry was applied.
     """
 
     id: str
@@ -612,13 +635,34 @@ class PaymentRecord(BaseModel):
     amount_collected_by: Optional[str] = None
     paid_by: Optional[str] = None
     created_at: datetime
+    entry_key: Optional[str] = None
+    kind: Optional[str] = None
+    party_id: Optional[str] = None
+    order_id: Optional[str] = None
+    payment_method: Optional[str] = None
+    running_total: Optional[float] = None
 
 
 class PaymentListResponse(BaseModel):
-    """Paginated list of payments."""
+    """Paginated list of payments.
+
+    `next_cursor` is the `entry_key` of the last row; pass it back as
+    `?cursor=` to fetch the next page without an offset scan.
+    """
 
     payments: List[PaymentRecord]
     pagination: PaginationResponse
+    next_cursor: Optional[str] = None
+
+
+class PaymentSummaryResponse(BaseModel):
+    """Aggregated payment totals for a date range and optional party."""
+
+    count: int
+    amount: float
+    received: float
+    paid: float
+    balance: Optional[Dict[str, Any]] = None
 
 
 # =============================================================================
@@ -669,11 +713,14 @@ class EmployeeListResponse(BaseModel):
 class ChatRequest(BaseModel):
     """Payload for ``POST /api/v1/chat``.
 
-    `chat_history` carries prior turns so the LangChain agent has conversational
-    context; each entry is a ``{"type": "user"|"assistant", "content": str}`` dict.
+    Conversation memory is kept server-side per `session_id`; omit it on the
+    first message and reuse the id the response announces. `chat_history`
+    (``{"type": "user"|"assistant", "content": str}`` dicts) is only used to
+    seed a new session.
     """
 
     prompt: str
+    session_id: Optional[str] = None
     chat_history: List[dict] = []
 
 
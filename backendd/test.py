@@ -23,22 +23,30 @@ from dateutil.relativedelta import relativedelta
 import firebase_admin
 from firebase_admin import credentials, firestore
 from google.cloud.firestore import Increment
-import tempfile
-import pdfplumber
+from google.cloud.firestore_v1.base_query import FieldFilter
 # Other imports
 from dotenv import load_dotenv
 import json
 import base64
 from passlib.context import CryptContext
-from langchain_core.messages import HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
 from fastapi import FastAPI, Request, Depends, HTTPException
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from firebase_admin import auth as firebase_auth
 from langchain.agents import AgentExecutor
 from log_config import loggerr
 import traceback
-from firebase_config.agent import run_agent_streaming
+from firebase_config.agent import run_agent_streaming, summarize_turns, agent_gate, AgentBusyError, AgentTimeoutError
+from firebase_config.llama_index_configs.index_registry import warmup as warmup_indexes
+from firebase_config.tool_selection import warmup as warmup_tool_selection
+from firebase_config.intent_router import route_question
+from firebase_config import answer_cache, instrumentation, invoice_scan, invoice_jobs
+from firebase_config.chat_memory import new_session_id, render_history, seed_session, append_turn
+from firebase_config.payments_ledger import record_order_payment, list_payments, count_payments, payment_totals, get_party_balance
+from firebase_config.statements import build_statement, statement_csv_chunks, statement_pdf_bytes, invalidate_checkpoints, _naive_utc
+from firebase_config.entity_stats import record_order_created, record_order_deleted, record_order_stats, get_entity_stats
+from firebase_config.expense_rollups import apply_expense, move_expense, get_rollups, search_terms, search_key, SEARCH_FIELDS as EXPENSE_SEARCH_FIELDS, DIMENSIONS as EXPENSE_ROLLUP_DIMENSIONS
+from firebase_config.reconcile_counters import reconcile_counters, nest_fields, SECTIONS as COUNTER_SECTIONS
   # your initialized LangChain agent
 import asyncio
 
@@ -103,6 +111,12 @@ class Settings:
     SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this")
     ALGORITHM = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+    # Hours between scheduled doc_counters reconciliation runs (0 disables it).
+    # COUNTER_RECONCILE_REPAIR=true lets the scheduled run fix the drift it finds.
+    COUNTER_RECONCILE_INTERVAL_HOURS = float(os.getenv("COUNTER_RECONCILE_INTERVAL_HOURS", "0"))
+    COUNTER_RECONCILE_REPAIR = os.getenv("COUNTER_RECONCILE_REPAIR", "false").lower() == "true"
+    # Build the semantic-search index handles in the background at startup.
+    SEMANTIC_WARMUP = os.getenv("SEMANTIC_WARMUP", "true").lower() == "true"
 
 settings = Settings()
 
@@ -146,10 +160,42 @@ firebase_db = FirebaseDB()
 
 
 
+async def scheduled_counter_reconciliation():
+    """Periodically recompute doc_counters and log (optionally repair) drift."""
+    interval = settings.COUNTER_RECONCILE_INTERVAL_HOURS * 3600
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            report = await asyncio.to_thread(reconcile_counters, repair=settings.COUNTER_RECONCILE_REPAIR)
+            app_logger.info(
+                f"[reconcile_counters] {report['drift_count']} drifted fields, "
+                f"{report['repaired_docs']} docs repaired in {report['elapsed_seconds']}s"
+            )
+            for row in report["drift"]:
+                app_logger.warning(f"[reconcile_counters] drift {row}")
+        except Exception as e:
+            app_logger.error(f"[reconcile_counters] Scheduled run failed: {e}")
+
+
+async def warmup_semantic_indexes():
+    """Build every semantic-search index handle off the event loop so the first chat query is fast."""
+    timings = await asyncio.to_thread(warmup_indexes)
+    app_logger.info(f"[warmup] Semantic index handles ready: {timings}")
+    tool_count = await asyncio.to_thread(warmup_tool_selection)
+    app_logger.info(f"[warmup] Tool selection ready ({tool_count} tool descriptions embedded)")
+
+
 async def lifespan(app: FastAPI):
     app_logger.info("Starting Business Management API with Complete Business Logic")
     await preload_dropdown_data()
 
+    if settings.SEMANTIC_WARMUP:
+        asyncio.create_task(warmup_semantic_indexes())
+
+    reconcile_task = None
+    if settings.COUNTER_RECONCILE_INTERVAL_HOURS > 0:
+        reconcile_task = asyncio.create_task(scheduled_counter_reconciliation())
+
     
     print("\n🔍 Registered Routes:")
     for route in app.routes:
@@ -158,6 +204,9 @@ async def lifespan(app: FastAPI):
 
     yield
 
+    if reconcile_task:
+        reconcile_task.cancel()
+    invoice_scan.shutdown()
     app_logger.info("Shutting down Business Management API")
 
 app = FastAPI(
@@ -213,6 +262,16 @@ async def log_requests(request: Request, call_next):
     
     return response
 
+
+# Writes change what the assistant would answer: bump the versions of the
+# collections a successful write touched so cached answers built on them expire.
+@app.middleware("http")
+async def invalidate_cached_answers(request: Request, call_next):
+    response = await call_next(request)
+    if request.method != "GET" and response.status_code < 400:
+        await asyncio.to_thread(answer_cache.invalidate_path, request.method, request.url.path)
+    return response
+
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -413,6 +472,39 @@ class OffsetPaginator:
             return 0
 
 
+class CursorPaginator:
+    @staticmethod
+    def paginate(
+        collection_ref,
+        query,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        offset: int = 0
+    ) -> dict:
+        """
+        Keyset pagination over an already filtered and ordered query.
+        `cursor` is the id of the last document of the previous page; `offset`
+        is only used by page-number callers when no cursor is given.
+        """
+        if cursor:
+            cursor_doc = collection_ref.document(cursor).get()
+            if not cursor_doc.exists:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query = query.start_after(cursor_doc)
+        elif offset:
+            query = query.offset(offset)
+
+        # Fetch one extra document to learn whether another page exists
+        docs = list(query.limit(limit + 1).stream())
+        has_next = len(docs) > limit
+        docs = docs[:limit]
+
+        return {
+            "items": [doc.to_dict() | {"id": doc.id} for doc in docs],
+            "next_cursor": docs[-1].id if has_next and docs else None
+        }
+
+
 class OrderItem(BaseModel):
     item_id: str = Field(..., min_length=1)
     item_name: str = Field(..., min_length=1, max_length=100)
@@ -713,6 +805,20 @@ class ClientHistoryResponse(BaseModel):
     orders: List[OrderSummary]
     pagination: Pagination
 
+class EntityStats(BaseModel):
+    # Per-client / per-supplier order statistics (entity_stats collection)
+    id: str
+    party_type: str
+    party_name: Optional[str] = None
+    order_count: Dict[str, int] = {}
+    draft_count: Dict[str, int] = {}
+    total_orders: int = 0
+    lifetime_value: float = 0
+    total_paid: float = 0
+    outstanding_due: float = 0
+    average_order_size: float = 0
+    last_order_date: Optional[datetime] = None
+
 # ========
 
 
@@ -757,11 +863,27 @@ class PaymentRecord(BaseModel):
     paid_by: Optional[str] = None
     created_at: datetime
     payment_type: Optional[str] = None
+    # Ledger fields
+    entry_key: Optional[str] = None
+    kind: Optional[str] = None
+    party_id: Optional[str] = None
+    order_id: Optional[str] = None
+    payment_method: Optional[str] = None
+    running_total: Optional[float] = None
 
 
 class PaymentListResponse(BaseModel):
     payments: List[PaymentRecord]
     pagination: PaginationResponse
+    next_cursor: Optional[str] = None  # Pass back as ?cursor= to fetch the next page
+
+
+class PaymentSummaryResponse(BaseModel):
+    count: int
+    amount: float
+    received: float
+    paid: float
+    balance: Optional[Dict[str, Any]] = None  # Running total for the requested party
 
 class EmployeeBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=100)
@@ -877,39 +999,6 @@ class EmployeeService:
         except Exception as e:
             
             return False
-    
-    @staticmethod
-    async def update_employee_collection(employee_name: str, amount: float, user: str = "system", order_id: str = ""):
-        """Update employee's collected amount when they collect payment for delivery challan"""
-        try:
-            # Find employee by name
-            employees_ref = firebase_db.get_collection("Employees")
-            employee_query = employees_ref.where("name", "==", employee_name).limit(1)
-            employee_docs = list(employee_query.stream())
-            
-            if employee_docs:
-                employee_doc = employee_docs[0]
-                employee_ref = firebase_db.get_document("Employees", employee_doc.id)
-                employee_data = employee_doc.to_dict()
-                
-                old_collected = employee_data.get("collected", 0)
-                new_collected = old_collected + amount
-                
-                employee_ref.update({
-                    "collected": new_collected,
-                    "updated_at": datetime.utcnow()
-                })
-                
-                
-                
-                return True
-            else:
-                app_logger.warning(f"Employee '{employee_name}' not found for collection update")
-                return False
-                
-        except Exception as e:
-            
-            return False
 
 
 
@@ -1023,39 +1112,32 @@ class CounterService:
             # Removed ActivityLogger.log_error as per request
             raise HTTPException(status_code=500, detail=f"Error generating ID: {str(e)}")
 
+    @staticmethod
+    def apply_financial_delta(income_delta: float = 0, expense_delta: float = 0):
+        """
+        Moves doc_counters/financial_summary by the given cash deltas.
+        Income is money received on sales and challans; expense is recorded
+        expenses plus money paid on purchases. net_profit moves with both.
+        """
+        if not income_delta and not expense_delta:
+            return
+        firebase_db.get_document("doc_counters", "financial_summary").set({
+            "total_income": firestore.Increment(income_delta),
+            "total_expense": firestore.Increment(expense_delta),
+            "net_profit": firestore.Increment(income_delta - expense_delta),
+            "updated_at": datetime.utcnow()
+        }, merge=True)
+
     @staticmethod
     async def update_financial_summary(user: str = "system"):
         """
-        Calculates and updates the financial summary counters (total income, total expenses, net profit).
-        Note: This method is not called within the provided client routes, but included as per your code.
+        Recalculates the financial summary counters (total income, total expenses, net profit)
+        from Orders and Expenses and overwrites any drift.
         """
         try:
-            # Get all expenses (assuming 'amount' field)
-            expenses_ref = firebase_db.get_collection("Expenses")
-            expenses = expenses_ref.stream()
-            total_expenses = sum(doc.to_dict().get("amount", 0) for doc in expenses)
-
-            # Get all sales orders (assuming 'sell' order_type and 'total_amount' field)
-            orders_ref = firebase_db.get_collection("Orders")
-            orders = orders_ref.where("order_type", "==", "sell").stream()
-            total_income = sum(doc.to_dict().get("total_amount", 0) for doc in orders)
-
-            # Update the 'financial_summary' document in 'doc_counters'
-            financial_ref = firebase_db.get_document("doc_counters", "financial_summary")
-            financial_data = {
-                "total_income": total_income,
-                "total_expense": total_expenses,
-                "net_profit": total_income - total_expenses,
-                "last_updated_at": datetime.utcnow()
-            }
-            financial_ref.set(financial_data) # Overwrites with latest calculated values
-
-            # Removed ActivityLogger.log_activity as per request
-
+            await asyncio.to_thread(reconcile_counters, repair=True, sections=["financial_summary"])
         except Exception as e:
-            # Removed ActivityLogger.log_error as per request
-            # For a critical financial summary update, you might want more robust error alerting here.
-            pass # Or handle more explicitly if this error needs to be propagated/logged elsewhere
+            app_logger.error(f"Error recomputing financial summary: {e}")
 
 async def get_current_user(
     request: Request,
@@ -1379,6 +1461,25 @@ async def get_client_dues_report(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate client dues report: {str(e)}")
+def history_total_from_stats(stats: dict, order_types: List[str]) -> int:
+    """Orders (drafts included) a history list will page through, read from an entity_stats document."""
+    order_count = stats.get("order_count", {}) or {}
+    draft_count = stats.get("draft_count", {}) or {}
+    return int(sum(order_count.get(t, 0) + draft_count.get(t, 0) for t in order_types))
+
+
+@app.get("/api/v1/clients/{client_id}/stats", response_model=EntityStats, summary="Get Client Order Stats")
+async def get_client_stats(
+    client_id: str,
+    current_user: str = Depends(get_current_user),
+):
+    """Order count by type, lifetime value, last order date, outstanding due and average order size."""
+    try:
+        return {"id": client_id, **get_entity_stats("client", client_id)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch client stats: {str(e)}")
+
+
 @app.get("/api/v1/clients/{client_id}/history", response_model=ClientHistoryResponse, summary="Get Client Order History")
 async def get_client_history(
     client_id: str,
@@ -1393,35 +1494,30 @@ async def get_client_history(
     Orders are sorted by creation date, most recent first.
     """
     try:
-        # Get collection reference using your `firebase_db.get_collection` helper
-        orders_collection_ref = firebase_db.get_collection("Orders")
-
-        # Build filters for the query that will be passed to the paginator
-        query_filters = {"client_id": client_id}
+        query = firebase_db.get_collection("Orders").where("client_id", "==", client_id)
         if order_type:
-            query_filters["order_type"] = order_type
-
-        # ✅ PAGINATION: Use OffsetPaginator for client order history.
-        # This simplifies the pagination logic significantly.
-        pagination_result = await OffsetPaginator.optimized_paginate_orders(
-            collection_ref=orders_collection_ref,
-            page=page,
-            limit=limit,
-            filters=query_filters, # Apply filters for client_id and optional order_type
-            order_by="created_at",
-            order_direction="desc" # Most recent orders first
-        )
+            query = query.where("order_type", "==", order_type)
 
-        # Calculate total amount on the current page for summary if needed
-        # This line was present in your previous code but not returned/used.
-        # total_amount = sum(order.get("total_amount", 0) for order in pagination_result["items"])
+        # Fetch just the documents for the current page
+        paginated_query = query.order_by("created_at", direction=firestore.Query.DESCENDING) \
+            .offset((page - 1) * limit).limit(limit)
+        orders = [doc.to_dict() for doc in paginated_query.stream()]
 
-        # Removed ActivityLogger.log_activity as per request
+        # Total comes from the client's stats document instead of recounting orders
+        stats = get_entity_stats("client", client_id)
+        total_items = history_total_from_stats(stats, [order_type] if order_type else ["sale", "delivery_challan"])
+        total_pages = (total_items + limit - 1) // limit if total_items > 0 else 0
 
-        # Return orders and pagination info as per ClientHistoryResponse model
         return {
-            "orders": pagination_result["items"],
-            "pagination": pagination_result["pagination"]
+            "orders": orders,
+            "pagination": {
+                "current_page": page,
+                "total_pages": total_pages,
+                "total_items": total_items,
+                "items_per_page": limit,
+                "has_next": page < total_pages,
+                "has_prev": page > 1,
+            }
         }
 
     except Exception as e:
@@ -1438,21 +1534,15 @@ async def get_total_orders_for_client(
     Gets the total count of 'sale' and 'delivery_challan' orders for a specific client.
     """
     try:
-        # Construct the Firestore query to count relevant orders for the client
-        query = firebase_db.get_collection("Orders") \
-            .where("client_id", "==", client_id) \
-            .where("order_type", "in", ["sale", "delivery_challan"]) # Filter by specific order types
-
-        # Stream the results and count them.
-        # NOTE: For very large order counts (e.g., millions), streaming all documents
-        # to count them (`len(list(query.stream()))`) can be inefficient and costly.
-        # Consider using Firestore's aggregate queries (if available and suitable for your plan)
-        # or maintaining a separate counter for total client orders if performance is critical for this endpoint.
-        total_orders = len(list(query.stream()))
+        # Single-document read of the client's stats, maintained by the order write path
+        stats = get_entity_stats("client", client_id)
+        total_orders = stats.get("total_orders", 0)
 
-        # Removed ActivityLogger.log_activity as per request
-
-        return {"client_id": client_id, "total_orders": total_orders}
+        return {
+            "client_id": client_id,
+            "total_orders": total_orders,
+            "by_type": stats.get("order_count", {})
+        }
     except Exception as e:
         # Removed ActivityLogger.log_error as per request
         raise HTTPException(status_code=500, detail=f"Failed to fetch client total orders: {str(e)}")
@@ -1593,6 +1683,34 @@ async def get_expense_stats(
         raise HTTPException(status_code=500, detail="Failed to fetch expense statistics")
 
 
+@app.get("/api/v1/dashboard-expenses/rollups")
+async def get_expense_rollups(
+    request: Request,
+    dimension: str = Query("category", description="month, category, payer, month_category or month_payer"),
+    month: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$", description="Month in YYYY-MM format"),
+    current_user: str = Depends(get_current_user)
+):
+    """Expense totals grouped by month, category or payer, read from pre-aggregated rollups."""
+    if dimension not in EXPENSE_ROLLUP_DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"dimension must be one of: {', '.join(EXPENSE_ROLLUP_DIMENSIONS)}")
+    if month and dimension in ("category", "payer"):
+        dimension = f"month_{dimension}"
+
+    try:
+        rows = get_rollups(dimension, month)
+        return {
+            "dimension": dimension,
+            "month": month,
+            "items": [
+                {"key": row.get("key"), "count": row.get("count", 0), "amount": row.get("amount", 0)}
+                for row in rows
+            ]
+        }
+    except Exception as e:
+        loggerr.error(f"[expense_rollups] Failed to read '{dimension}' rollups: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to fetch expense rollups")
+
+
 @app.get("/api/v1/dashboard/charts")
 async def get_dashboard_chart_data(
     request: Request,
@@ -1930,30 +2048,69 @@ async def get_expenses(
     request: Request,
     page: int = Query(1, ge=1),
     limit: int = Query(50, le=100),
-    search: Optional[str] = None,  # Search in category / remarks / paid_by
+    search: Optional[str] = None,  # Case-insensitive match at a word start in category / paid_by / remarks
+    category: Optional[str] = Query(None),
+    paid_by: Optional[str] = Query(None),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     current_user: str = Depends(get_current_user)
 ):
     """
-    Get paginated expenses with optional search by category, remarks, or paid_by.
+    Get expenses newest first, filtered by category, paid_by and created_at range.
+    `search` matches, case-insensitively, text starting at any word of category,
+    paid_by or remarks (via the stored `search_terms`).
+    Filters are indexed equality/range queries; pass `next_cursor` back as `cursor`
+    to page without offsets.
     """
     try:
         collection_ref = firebase_db.get_collection("Expenses")
+        query = collection_ref
 
-        result = await OffsetPaginator.optimized_paginate_orders(
-            collection_ref=collection_ref,
-            page=page,
+        if category:
+            query = query.where(filter=FieldFilter("category", "==", category))
+        if paid_by:
+            query = query.where(filter=FieldFilter("paid_by", "==", paid_by))
+        if search and search_key(search):
+            query = query.where(filter=FieldFilter("search_terms", "array_contains", search_key(search)))
+        if date_from:
+            query = query.where(filter=FieldFilter("created_at", ">=", date_from))
+        if date_to:
+            query = query.where(filter=FieldFilter("created_at", "<=", date_to))
+
+        # Aggregation count over the same filters (no document reads)
+        count_result = query.count().get()
+        total_items = count_result[0][0].value if count_result else 0
+        total_pages = (total_items + limit - 1) // limit if total_items > 0 else 0
+
+        result = CursorPaginator.paginate(
+            collection_ref,
+            query.order_by("created_at", direction=firestore.Query.DESCENDING),
             limit=limit,
-            order_by="created_at",
-            order_direction="desc",
-            lightweight_search=search  # This will check across text fields
+            cursor=cursor,
+            offset=0 if cursor else (page - 1) * limit
         )
 
-        # Ensure each item has an 'id' field
         for item in result["items"]:
-            item.setdefault("id", item.get("id"))
+            item.pop("search_terms", None)
 
-        return result  # Full paginated response
+        return {
+            "items": result["items"],
+            "next_cursor": result["next_cursor"],
+            "total_count": total_items,
+            "total_pages": total_pages,
+            "pagination": {
+                "current_page": page,
+                "items_per_page": limit,
+                "total_items": total_items,
+                "total_pages": total_pages,
+                "has_next": result["next_cursor"] is not None,
+                "has_prev": page > 1 or cursor is not None
+            }
+        }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch expenses: {str(e)}")
 
@@ -2019,6 +2176,7 @@ async def create_expense(
         # 2. Add to Expenses with auto-generated ID
         expense_ref = firebase_db.get_collection("Expenses").document()
         expense_data["id"] = expense_ref.id
+        expense_data["search_terms"] = search_terms(expense_data)
         expense_ref.set(expense_data)
 
         # 3. Update doc_counters/expenses using firestore.Increment()
@@ -2071,16 +2229,15 @@ async def create_expense(
             })
 
         # 5. Update doc_counters/financial_summary for total_expenses (NEW LOGIC)
-        financial_summary_ref = firebase_db.get_document("doc_counters", "financial_summary")
-        financial_summary_ref.update({
-            "total_expense": firestore.Increment(expense_data["amount"]),
-            "last_updated_at": now # Update the timestamp for the financial summary
-        })
+        CounterService.apply_financial_delta(expense_delta=expense_data["amount"])
         month_key = now.strftime("%Y-%m")
         update_monthly_doc_counters(month_key, {
             "expenses.total": firestore.Increment(1),
             "expenses.total_amount": firestore.Increment(expense_data["amount"])
         })
+
+        # 6. Month / category / payer rollups
+        apply_expense(expense_data)
         # Optional: Log activity after all operations are attempted
         fields = expense_data_in.dict()
         field_summary = ', '.join(f"{k}: {v}" for k, v in fields.items())
@@ -2162,8 +2319,14 @@ async def update_expense(
             })
 
         # 2. Update the main expense document
+        if any(field in update_data for field in EXPENSE_SEARCH_FIELDS):
+            update_data["search_terms"] = search_terms({**old_expense_data, **update_data})
         expense_doc_ref.update(update_data)
 
+        # Move the expense between month / category / payer rollups
+        if any(field in update_data for field in ("amount", "category", "paid_by")):
+            move_expense(old_expense_data, {**old_expense_data, **update_data})
+
         # 3. Update all financial counters if the amount changed
         if amount_difference != 0:
             # Update main expense counter
@@ -2173,10 +2336,7 @@ async def update_expense(
             })
         
             # Update financial summary
-            firebase_db.get_document("doc_counters", "financial_summary").update({
-                "total_expense": firestore.Increment(amount_difference),
-                "updated_at": datetime.utcnow()
-            })
+            CounterService.apply_financial_delta(expense_delta=amount_difference)
 
             # Update monthly summary
             month_key = old_expense_data["created_at"].strftime("%Y-%m")
@@ -2237,19 +2397,19 @@ async def delete_expense(
         })
 
         # Update financial summary
-        firebase_db.get_document("doc_counters", "financial_summary").update({
-            "total_expense": firestore.Increment(-deleted_amount),
-            "updated_at": now
-        })
+        CounterService.apply_financial_delta(expense_delta=-deleted_amount)
 
         # 4. Update monthly summary (NEW LOGIC)
         if creation_date:
             month_key = creation_date.strftime("%Y-%m")
             update_monthly_doc_counters(month_key, {
-                "expenses.count": firestore.Increment(-1),
+                "expenses.total": firestore.Increment(-1),
                 "expenses.total_amount": firestore.Increment(-deleted_amount)
             })
 
+        # Remove it from the month / category / payer rollups
+        apply_expense(expense_data, sign=-1)
+
         # 5. Update employee stats if applicable
         if paid_by_value:
             # This assumes get_employee_id_from_paid_by is available
@@ -2281,64 +2441,180 @@ async def delete_expense(
         raise HTTPException(status_code=500, detail=f"Failed to delete expense: {str(e)}")
 
 
+def ledger_entry_to_payment_record(entry: dict) -> PaymentRecord:
+    """Maps a payments-ledger entry onto the PaymentRecord shape the finance tab expects."""
+    is_client = entry.get("party_type") == "client"
+    return PaymentRecord(
+        id=entry["id"],
+        entry_key=entry.get("entry_key"),
+        kind=entry.get("kind"),
+        order_id=entry.get("order_id"),
+        order_type=entry.get("order_type") or "payment",
+        invoice_number=entry.get("invoice_number"),
+        challan_number=entry.get("challan_number"),
+        payment_type=entry.get("direction", "received"),
+        party_id=entry.get("party_id"),
+        client_name=entry.get("party_name") if is_client else None,
+        supplier_name=None if is_client else entry.get("party_name"),
+        amount_paid=entry.get("amount", 0.0),
+        payment_status=entry.get("payment_status") or "paid",
+        payment_method=entry.get("payment_method"),
+        amount_collected_by=entry.get("collected_by"),
+        paid_by=entry.get("recorded_by"),
+        running_total=entry.get("running_total"),
+        created_at=entry.get("created_at"),
+    )
+
+
 @app.get("/api/v1/payments", response_model=PaymentListResponse, summary="Get All Payments")
 async def get_all_payments(
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    party_type: Optional[str] = Query(None, pattern=r'^(client|supplier)$'),
+    party_id: Optional[str] = Query(None),
+    direction: Optional[str] = Query(None, pattern=r'^(received|paid)$'),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
     current_user: str = Depends(get_current_user),
     request: Request = None,
 ):
     """
-    Get a paginated list of all payments from the Orders collection efficiently.
+    Get payments from the append-only payments ledger, newest first.
+
+    Prefer `cursor` pagination: pass the returned `next_cursor` to get the next page.
+    `page` is still honoured for page-number clients when no cursor is given.
     """
     try:
-        collection_ref = firebase_db.get_collection("Orders")
-        base_query = collection_ref.where("amount_paid", ">", 0)
-
-        # Use .count() for an efficient total count
-        count_query = base_query.count()
-        total_items_result = count_query.get()
-        total_items = total_items_result[0][0].value if total_items_result else 0
-        total_pages = (total_items + limit - 1) // limit if total_items > 0 else 0
+        filters = {
+            "party_type": party_type,
+            "party_id": party_id,
+            "direction": direction,
+            "date_from": date_from,
+            "date_to": date_to,
+        }
 
-        # Apply pagination directly in the database query
-        paginated_query = base_query.order_by("created_at", direction=firestore.Query.DESCENDING).offset((page - 1) * limit).limit(limit)
-        docs_stream = paginated_query.stream()
+        result = list_payments(
+            limit=limit,
+            cursor=cursor,
+            offset=0 if cursor else (page - 1) * limit,
+            **filters
+        )
 
-        payments = []
-        for doc in docs_stream:
-            data = doc.to_dict()
-            
-            payment_record = {
-                "id": doc.id,
-                "amount_paid": data.get("amount_paid", 0.0),
-                "payment_status": data.get("payment_status"),
-                "created_at": data.get("created_at"),
-                "client_name": data.get("client_name"),
-                "supplier_name": data.get("supplier_name"),
-                "amount_collected_by": data.get("amount_collected_by"),
-                "paid_by": data.get("paid_by"),
-                "order_type": data.get("order_type"),
-                "payment_type": "received" if data.get("order_type") in ["sale", "delivery_challan"] else "paid",
-                "invoice_number": data.get("invoice_number"),
-                "challan_number": data.get("challan_number"),
-                
-            }
-            payments.append(PaymentRecord(**payment_record))
+        # Aggregation count — billed as a single read per 1000 entries
+        total_items = count_payments(**filters)
+        total_pages = (total_items + limit - 1) // limit if total_items > 0 else 0
 
         return {
-            "payments": payments,
+            "payments": [ledger_entry_to_payment_record(entry) for entry in result["entries"]],
+            "next_cursor": result["next_cursor"],
             "pagination": {
                 "current_page": page,
                 "total_pages": total_pages,
                 "total_items": total_items,
                 "items_per_page": limit,
-                "has_next": page < total_pages,
-                "has_prev": page > 1,
+                "has_next": result["next_cursor"] is not None,
+                "has_prev": page > 1 or cursor is not None,
             }
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch payments: {str(e)}")
+
+
+@app.get("/api/v1/payments/summary", response_model=PaymentSummaryResponse, summary="Get Payment Totals")
+async def get_payments_summary(
+    party_type: Optional[str] = Query(None, pattern=r'^(client|supplier)$'),
+    party_id: Optional[str] = Query(None),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    current_user: str = Depends(get_current_user),
+):
+    """
+    Totals for a date range (and optionally a single party) computed with
+    aggregation queries, plus the party's running balance when one is given.
+    """
+    if party_id and not party_type:
+        raise HTTPException(status_code=400, detail="party_type is required when party_id is given")
+
+    try:
+        filters = {
+            "party_type": party_type,
+            "party_id": party_id,
+            "date_from": date_from,
+            "date_to": date_to,
+        }
+        received = payment_totals(direction="received", **filters)
+        paid = payment_totals(direction="paid", **filters)
+
+        return {
+            "count": received["count"] + paid["count"],
+            "amount": received["amount"] + paid["amount"],
+            "received": received["amount"],
+            "paid": paid["amount"],
+            "balance": get_party_balance(party_type, party_id) if party_id else None,
+        }
+    except Exception as e:
+        loggerr.error(f"[payments_summary] Failed for party '{party_id}': {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch payment summary: {str(e)}")
+
+
+# ================================
+# STATEMENT ROUTES
+# ================================
+@app.get("/api/v1/statements/{party_type}/{party_id}", summary="Get Statement of Account")
+async def get_statement(
+    party_type: str,
+    party_id: str,
+    date_from: Optional[datetime] = Query(None, description="Defaults to 1 January of the current year"),
+    date_to: Optional[datetime] = Query(None, description="Defaults to now"),
+    format: str = Query("json", pattern=r'^(json|csv|pdf)$'),
+    current_user: str = Depends(get_current_user),
+):
+    """
+    Chronological statement (orders, payments, running balance) for a client or supplier.
+    `format=csv` streams rows as they are read; `format=pdf` returns a rendered statement.
+    """
+    collections = {"client": "Clients", "supplier": "Suppliers"}
+    if party_type not in collections:
+        raise HTTPException(status_code=400, detail="party_type must be 'client' or 'supplier'")
+
+    party_doc = firebase_db.get_document(collections[party_type], party_id).get()
+    if not party_doc.exists:
+        raise HTTPException(status_code=404, detail=f"{party_type.title()} not found")
+    party_name = party_doc.to_dict().get("name", "")
+
+    # Query strings may or may not carry an offset; compare both bounds as naive UTC
+    date_to = _naive_utc(date_to) or datetime.utcnow()
+    date_from = _naive_utc(date_from) or datetime(date_to.year, 1, 1)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must be before date_to")
+
+    filename = f"statement_{party_id}_{date_from:%Y%m%d}_{date_to:%Y%m%d}"
+    try:
+        if format == "csv":
+            return StreamingResponse(
+                statement_csv_chunks(party_type, party_id, date_from, date_to),
+                media_type="text/csv",
+                headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'}
+            )
+
+        if format == "pdf":
+            pdf_bytes = await asyncio.to_thread(
+                statement_pdf_bytes, party_type, party_id, party_name, date_from, date_to
+            )
+            return StreamingResponse(
+                io.BytesIO(pdf_bytes),
+                media_type="application/pdf",
+                headers={"Content-Disposition": f'attachment; filename="{filename}.pdf"'}
+            )
+
+        statement = await asyncio.to_thread(build_statement, party_type, party_id, date_from, date_to)
+        statement["party_name"] = party_name
+        return statement
+
+    except Exception as e:
+        loggerr.error(f"[statement] Failed to build {party_type} statement for '{party_id}': {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to build statement: {str(e)}")
     
 
 
@@ -3291,54 +3567,15 @@ class InventoryService:
         
     
 
-class SupplierService:
-    @staticmethod
-    def update_due(supplier_id: str, delta_due: float):
-        """
-        Update the due amount for a specific supplier and also update counters.
-        `delta_due` can be positive (increase due) or negative (reduce due on payment).
-        """
-        supplier_ref = firebase_db.get_document("Suppliers", supplier_id)
-        supplier_doc = supplier_ref.get()
-
-        if supplier_doc.exists:
-            supplier_data = supplier_doc.to_dict()
-            current_due = supplier_data.get("due", 0)
-            new_due = current_due + delta_due
-
-            supplier_ref.update({
-                "due": new_due,
-                "updated_at": datetime.utcnow()
-            })
-
-            # Update doc_counters for suppliers
-            firebase_db.get_document("doc_counters", "suppliers").update({
-                "due": firestore.Increment(delta_due)
-            })
-
-        
-
 def update_monthly_doc_counters(month_key: str, updates: dict):
     """
-    Safely updates or creates a monthly summary document in 'doc_counters' collection.
-    Will set initial values to 0 if the document doesn't exist.
+    Applies counter updates to a monthly summary document in 'doc_counters',
+    creating the document on first use. Dotted keys ("expenses.total") address
+    nested maps. A merge write applies each Increment to a missing field as 0,
+    so a new month starts from the actual delta.
     """
-    monthly_ref = firebase_db.get_document("doc_counters", month_key)
-    monthly_doc = monthly_ref.get()
-
-    if not monthly_doc.exists:
-        # First time — set values to 0 or fallback for counters
-        initial_data = {}
-        for k, v in updates.items():
-            if isinstance(v, firestore.Increment):
-                initial_data[k] = 1  # assume you're incrementing by 1
-            else:
-                initial_data[k] = v
-        initial_data["updated_at"] = datetime.utcnow()
-        monthly_ref.set(initial_data)
-    else:
-        updates["updated_at"] = datetime.utcnow()
-        monthly_ref.update(updates)
+    updates = dict(updates, updated_at=datetime.utcnow())
+    firebase_db.get_document("doc_counters", month_key).set(nest_fields(updates), merge=True)
 
 def calculate_order_totals(items: List[Dict[str, Any]]) -> Dict[str, float]:
     """Calculate order totals from items"""
@@ -3415,8 +3652,10 @@ async def create_sale_order(
                 "total": firestore.Increment(1),
                 "total_sales.count": firestore.Increment(1),
                 "total_sales.amount": firestore.Increment(order.total_amount),
+                "total_revenue": firestore.Increment(order.amount_paid),
                 "last_id": invoice_number
             })
+            CounterService.apply_financial_delta(income_delta=order.amount_paid)
             
             # 🟡 Optional: Track challans placed by clients
             if order.client_id:
@@ -3436,6 +3675,13 @@ async def create_sale_order(
         # ✅ ONLY AFTER ALL ABOVE: Save order to Firestore
         firebase_db.get_document("Orders", invoice_number).set(order_data)
 
+        # ✅ Record the upfront payment in the payments ledger
+        if not order.draft and order.amount_paid > 0:
+            record_order_payment(invoice_number, order_data, order.amount_paid, recorded_by=current_user)
+
+        # ✅ Keep the client's order stats document current
+        record_order_created(order_data)
+
         # ✅ Log activity
         loggerr.info(
             f"[create_order] Sale order '{invoice_number}' created by '{current_user}' | "
@@ -3512,9 +3758,10 @@ async def create_purchase_order(
             firebase_db.get_document("doc_counters", "orders").update({
                 "total": firestore.Increment(1),
                 "total_purchase.count": firestore.Increment(1),
-                "total_purchase.amount": firestore.Increment(order.amount_paid),
+                "total_purchase.amount": firestore.Increment(order.total_amount),
                 "last_id": invoice_number
             })
+            CounterService.apply_financial_delta(expense_delta=order.amount_paid)
 
                 # 🟡 Optional: Increment total orders placed by clients
             # 🟡 Optional: Increment total orders placed with suppliers
@@ -3530,12 +3777,19 @@ async def create_purchase_order(
             month_key = datetime.utcnow().strftime("%Y-%m")
             update_monthly_doc_counters(month_key, {
                 "purchase_orders_count": firestore.Increment(1),
-                "purchase_orders_amount": firestore.Increment(order.amount_paid)
+                "purchase_orders_amount": firestore.Increment(order.total_amount)
             })
 
         # ✅ 7. Final step: Save order to Firestore
         firebase_db.get_document("Orders", invoice_number).set(order_data)
 
+        # ✅ 8. Record the upfront payment in the payments ledger
+        if not order.draft and order.amount_paid > 0:
+            record_order_payment(invoice_number, order_data, order.amount_paid, recorded_by=current_user)
+
+        # ✅ 9. Keep the supplier's order stats document current
+        record_order_created(order_data)
+
         # ✅ 8. Log activity
         # ✅ 8. Log activity
         loggerr.info(
@@ -3619,19 +3873,16 @@ async def create_delivery_challan(
                     order_id=challan_number
                 )
                 employee_updated = True
-                
-                # Also update the aggregate total_collected counter
-                firebase_db.get_document("doc_counters", "employees").update({
-                    "total_collected": firestore.Increment(order.amount_paid)
-                })
 
             # 4. Update Document Counters
             firebase_db.get_document("doc_counters", "orders").update({
                 "total": firestore.Increment(1),
-                "delivery_challan.count.count": firestore.Increment(1),
-                "delivery_challan.amount": firestore.Increment(order.amount_paid),
+                "delivery_challan.count": firestore.Increment(1),
+                "delivery_challan.amount": firestore.Increment(order.total_amount),
+                "total_revenue": firestore.Increment(order.amount_paid),
                 "last_id": challan_number
             })
+            CounterService.apply_financial_delta(income_delta=order.amount_paid)
             
             if order.client_id:
                 firebase_db.get_document("doc_counters", "clients").update({
@@ -3642,12 +3893,19 @@ async def create_delivery_challan(
             month_key = datetime.utcnow().strftime("%Y-%m")
             update_monthly_doc_counters(month_key, {
                 "delivery_challan_count": firestore.Increment(1),
-                "delivery_challan_amount": firestore.Increment(order.amount_paid)
+                "delivery_challan_amount": firestore.Increment(order.total_amount)
             })
 
         # Save challan to Firestore
         firebase_db.get_document("Orders", challan_number).set(order_data)
 
+        # Record the collected amount in the payments ledger
+        if not order.draft and order.amount_paid > 0:
+            record_order_payment(challan_number, order_data, order.amount_paid, recorded_by=current_user)
+
+        # Keep the client's order stats document current
+        record_order_created(order_data)
+
         loggerr.info(
             f"[create_order][delivery_challan] Challan '{challan_number}' created by '{current_user}' | "
             f"Client: {order.client_name} | Amount: ₹{order.total_amount} | "
@@ -3858,11 +4116,32 @@ async def update_order(
         # Apply update to the Order document
         doc_ref.update(update_data)
 
+        # Corrections to amount_paid are appended to the ledger, never edited in place
+        if amount_paid_delta != 0 and not old_data.get("draft", False):
+            record_order_payment(
+                order_id,
+                {**old_data, **update_data},
+                amount_paid_delta,
+                recorded_by=current_user,
+                kind="adjustment"
+            )
+
+        # Keep the party's lifetime value / paid / outstanding due in step with the edit
+        if (total_amount_delta != 0 or amount_paid_delta != 0) and not old_data.get("draft", False):
+            record_order_stats(old_data, value=total_amount_delta, paid=amount_paid_delta)
+
+        # Closed-month statement balances that included the old total are now stale
+        if total_amount_delta != 0 and not old_data.get("draft", False):
+            party_type = "supplier" if order_type == OrderTypeEnum.purchase else "client"
+            invalidate_checkpoints(party_type, old_data.get(f"{party_type}_id"), old_data.get("created_at"))
+
         # ---------- SYNC DEPENDENT COLLECTIONS AND DOC_COUNTERS ---------- #
 
         # Update doc_counters/orders (total_sales.amount, total_purchase.amount, delivery_challan.amount)
         # These reflect the *total value* of the order, so update if total_amount changed.
-        if total_amount_delta != 0:
+        # Drafts never count towards doc_counters.
+        is_draft = old_data.get("draft", False)
+        if total_amount_delta != 0 and not is_draft:
             orders_counter_updates = {}
             if order_type == OrderTypeEnum.sale:
                 orders_counter_updates["total_sales.amount"] = firestore.Increment(total_amount_delta)
@@ -3875,33 +4154,20 @@ async def update_order(
                 firebase_db.get_document("doc_counters", "orders").update(orders_counter_updates)
 
         # Update doc_counters/orders.total_revenue and financial_summary (based on amount_paid)
-        if amount_paid_delta != 0:
+        if amount_paid_delta != 0 and not is_draft:
             if order_type == OrderTypeEnum.sale or order_type == OrderTypeEnum.delivery_challan:
                 firebase_db.get_document("doc_counters", "orders").update({
                     "total_revenue": firestore.Increment(amount_paid_delta),
                     "updated_at": datetime.utcnow()
                 })
-                firebase_db.get_document("doc_counters", "financial_summary").update({
-                    "total_income": firestore.Increment(total_amount_delta),
-                    "updated_at": datetime.utcnow()
-                })
+                CounterService.apply_financial_delta(income_delta=amount_paid_delta)
             elif order_type == OrderTypeEnum.purchase:
-                firebase_db.get_document("doc_counters", "financial_summary").update({
-                    "total_expense": firestore.Increment(amount_paid_delta),
-                    "updated_at": datetime.utcnow()
-                })
+                CounterService.apply_financial_delta(expense_delta=amount_paid_delta)
 
-        # Update monthly doc_counters (based on amount_paid or total_amount if only total_amount changes)
-        # Prioritize amount_paid_delta for monthly cash flow tracking.
+        # Update monthly doc_counters. Monthly amounts track order value
+        # (total_amount), like doc_counters/orders; payments are tracked above.
         monthly_updates = {}
-        if amount_paid_delta != 0:
-            if order_type == OrderTypeEnum.sale:
-                monthly_updates["sales_orders_amount"] = firestore.Increment(amount_paid_delta)
-            elif order_type == OrderTypeEnum.purchase:
-                monthly_updates["purchase_orders_amount"] = firestore.Increment(amount_paid_delta)
-            elif order_type == OrderTypeEnum.delivery_challan:
-                monthly_updates["delivery_challan_amount"] = firestore.Increment(amount_paid_delta)
-        elif total_amount_delta != 0: # If amount_paid didn't change but total_amount did
+        if total_amount_delta != 0 and not is_draft:
             if order_type == OrderTypeEnum.sale:
                 monthly_updates["sales_orders_amount"] = firestore.Increment(total_amount_delta)
             elif order_type == OrderTypeEnum.purchase:
@@ -4066,6 +4332,17 @@ async def update_order_payment_status(
 
         # If the paid amount changed, trigger all cascading updates.
         if amount_paid_delta != 0:
+            # Append the change to the payments ledger.
+            record_order_payment(
+                order_id,
+                {**old_data, **update_payload},
+                amount_paid_delta,
+                recorded_by=current_user,
+                kind="payment" if amount_paid_delta > 0 else "adjustment"
+            )
+            if not old_data.get("draft", False):
+                record_order_stats(old_data, paid=amount_paid_delta)
+
             # Update the due amount for the associated Client or Supplier.
             if order_type in [OrderTypeEnum.sale, OrderTypeEnum.delivery_challan] and old_data.get("client_id"):
                 ClientService.update_due(client_id=old_data["client_id"], delta_due=-amount_paid_delta)
@@ -4079,19 +4356,19 @@ async def update_order_payment_status(
                     amount=amount_paid_delta
                 )
 
-            # Update the relevant monthly and global financial counters.
-            month_key = old_data.get("created_at").strftime("%Y-%m")
-            
-            if order_type in [OrderTypeEnum.sale, OrderTypeEnum.delivery_challan]:
-                # For sales/challans, INCREMENT income.
-                field_name = "sales_orders_amount" if order_type == OrderTypeEnum.sale else "delivery_challan_amount"
-                update_monthly_doc_counters(month_key, {field_name: firestore.Increment(amount_paid_delta)})
-                firebase_db.get_document("doc_counters", "financial_summary").update({"total_income": firestore.Increment(amount_paid_delta)})
-            
-            elif order_type == OrderTypeEnum.purchase:
-                # For purchases, DECREMENT income as it's money spent.
-                update_monthly_doc_counters(month_key, {"purchase_orders_amount": firestore.Increment(amount_paid_delta)})
-                firebase_db.get_document("doc_counters", "financial_summary").update({"total_income": firestore.Increment(-amount_paid_delta)})
+            # Update the global cash counters. Monthly order amounts track
+            # order value, which a payment does not change.
+            if not old_data.get("draft", False):
+                if order_type in [OrderTypeEnum.sale, OrderTypeEnum.delivery_challan]:
+                    # For sales/challans, money received is income.
+                    firebase_db.get_document("doc_counters", "orders").update({
+                        "total_revenue": firestore.Increment(amount_paid_delta),
+                        "updated_at": datetime.utcnow()
+                    })
+                    CounterService.apply_financial_delta(income_delta=amount_paid_delta)
+                elif order_type == OrderTypeEnum.purchase:
+                    # For purchases, money paid is an expense.
+                    CounterService.apply_financial_delta(expense_delta=amount_paid_delta)
 
         loggerr.info(
             f"[update_payment] Payment for order '{order_id}' updated by '{current_user}'. "
@@ -4164,18 +4441,18 @@ async def delete_order(
                     amount=amount_paid,
                     order_id=order_id
                 )
-                # Also revert the aggregate total_collected counter
-                firebase_db.get_document("doc_counters", "employees").update({
-                    "total_collected": firestore.Increment(-amount_paid),
-                    "updated_at": datetime.utcnow()
-                })
 
-            # 4. Revert Financial Summary (total_income/total_expense)
+            # Closed-month statement balances that included this order are now stale
+            party_type = "supplier" if order_type == OrderTypeEnum.purchase else "client"
+            invalidate_checkpoints(party_type, order_data.get(f"{party_type}_id"), order_data.get("created_at"))
+
+            # 4. Reverse the order's payments in the ledger and revert Financial Summary
             if amount_paid > 0:
+                record_order_payment(order_id, order_data, -amount_paid, recorded_by=current_user, kind="reversal")
                 if order_type in [OrderTypeEnum.sale, OrderTypeEnum.delivery_challan]:
-                    firebase_db.get_document("doc_counters", "financial_summary").update({
-                        "total_income": firestore.Increment(-amount_paid)
-                    })
+                    CounterService.apply_financial_delta(income_delta=-amount_paid)
+                else:
+                    CounterService.apply_financial_delta(expense_delta=-amount_paid)
                 
 
             # 5. Revert Order Counters
@@ -4185,14 +4462,16 @@ async def delete_order(
             }
             if order_type == OrderTypeEnum.sale:
                 orders_counter_updates["total_sales.count"] = firestore.Increment(-1)
-                orders_counter_updates["total_sales.amount"] = firestore.Increment(-amount_paid)
+                orders_counter_updates["total_sales.amount"] = firestore.Increment(-total_amount)
+                orders_counter_updates["total_revenue"] = firestore.Increment(-amount_paid)
             elif order_type == OrderTypeEnum.purchase:
                 orders_counter_updates["total_purchase.count"] = firestore.Increment(-1)
-                orders_counter_updates["total_purchase.amount"] = firestore.Increment(-amount_paid)
+                orders_counter_updates["total_purchase.amount"] = firestore.Increment(-total_amount)
             elif order_type == OrderTypeEnum.delivery_challan:
                 orders_counter_updates.update({
                     "delivery_challan.count": firestore.Increment(-1), # Assuming DC counts as a sale
-                    "delivery_challan.amount": firestore.Increment(-amount_paid)
+                    "delivery_challan.amount": firestore.Increment(-total_amount),
+                    "total_revenue": firestore.Increment(-amount_paid)
                 })
             
             firebase_db.get_document("doc_counters", "orders").update(orders_counter_updates)
@@ -4214,13 +4493,13 @@ async def delete_order(
             monthly_updates = {}
             if order_type == OrderTypeEnum.sale:
                 monthly_updates["sales_orders_count"] = firestore.Increment(-1)
-                monthly_updates["sales_orders_amount"] = firestore.Increment(-amount_paid)
+                monthly_updates["sales_orders_amount"] = firestore.Increment(-total_amount)
             elif order_type == OrderTypeEnum.purchase:
                 monthly_updates["purchase_orders_count"] = firestore.Increment(-1)
-                monthly_updates["purchase_orders_amount"] = firestore.Increment(-amount_paid)
+                monthly_updates["purchase_orders_amount"] = firestore.Increment(-total_amount)
             elif order_type == OrderTypeEnum.delivery_challan:
                 monthly_updates["delivery_challan_count"] = firestore.Increment(-1)
-                monthly_updates["delivery_challan_amount"] = firestore.Increment(-amount_paid)
+                monthly_updates["delivery_challan_amount"] = firestore.Increment(-total_amount)
             
             if monthly_updates:
                 update_monthly_doc_counters(month_key, monthly_updates)
@@ -4228,6 +4507,9 @@ async def delete_order(
         # 8. Delete the Order Document
         order_ref.delete()
 
+        # 9. Roll the order out of the client/supplier stats document
+        record_order_deleted(order_data)
+
         loggerr.info(
             f"[delete_order] Order {order_id} deleted by {current_user} | "
             f"Type: {order_type.value} | Amount: {total_amount}"
@@ -4298,6 +4580,28 @@ async def get_order_stats(
         
         raise HTTPException(status_code=500, detail="Failed to fetch order statistics")
 
+
+@app.post("/api/v1/doc-counters/reconcile")
+async def reconcile_doc_counters(
+    request: Request,
+    repair: bool = Query(False, description="Overwrite drifted counters with the recomputed values"),
+    section: Optional[List[str]] = Query(None, description="Limit to counter sections (repeatable)"),
+    current_user: str = Depends(get_current_user)
+):
+    """Recompute doc_counters from the source collections and report drift per field."""
+    if section and any(name not in COUNTER_SECTIONS for name in section):
+        raise HTTPException(status_code=400, detail=f"section must be one of: {', '.join(COUNTER_SECTIONS)}")
+    try:
+        report = await asyncio.to_thread(reconcile_counters, repair=repair, sections=section)
+        loggerr.info(
+            f"[reconcile_counters] Run by '{current_user}' | repair={repair} | "
+            f"drifted fields: {report['drift_count']} | repaired docs: {report['repaired_docs']}"
+        )
+        return report
+    except Exception as e:
+        loggerr.error(f"[reconcile_counters] Failed: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to reconcile doc_counters")
+
 @app.get("/api/v1/suppliers", response_model=SupplierPaginatedResponse)
 async def get_suppliers(
     page: int = Query(1, ge=1),
@@ -4493,10 +4797,9 @@ async def get_supplier_history(
     try:
         base_query = firebase_db.get_collection("Orders").where("supplier_id", "==", supplier_id).where("order_type", "==", "purchase")
 
-        # PERFORMANCE FIX: Use .count() for an efficient total count.
-        count_query = base_query.count()
-        total_items_result = count_query.get()
-        total_items = total_items_result[0][0].value if total_items_result else 0
+        # Total comes from the supplier's stats document instead of a count query
+        stats = get_entity_stats("supplier", supplier_id)
+        total_items = history_total_from_stats(stats, ["purchase"])
         total_pages = (total_items + limit - 1) // limit if total_items > 0 else 0
 
         # Fetch just the documents for the current page
@@ -4519,6 +4822,17 @@ async def get_supplier_history(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch supplier history: {str(e)}")
 
+@app.get("/api/v1/suppliers/{supplier_id}/stats", response_model=EntityStats, summary="Get Supplier Order Stats")
+async def get_supplier_stats(
+    supplier_id: str,
+    current_user: str = Depends(get_current_user),
+):
+    """Order count, lifetime value, last order date, outstanding due and average order size."""
+    try:
+        return {"id": supplier_id, **get_entity_stats("supplier", supplier_id)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch supplier stats: {str(e)}")
+
 @app.get("/api/v1/suppliers/{supplier_id}/total-orders")
 async def get_total_orders_for_supplier(
     supplier_id: str,
@@ -4527,13 +4841,10 @@ async def get_total_orders_for_supplier(
 ):
     """Get total purchase orders for a supplier"""
     try:
-        query = firebase_db.get_collection("Orders") \
-            .where("supplier_id", "==", supplier_id) \
-            .where("order_type", "==", "purchase")
-
-        total_orders = len(list(query.stream()))
+        # Single-document read of the supplier's stats, maintained by the order write path
+        stats = get_entity_stats("supplier", supplier_id)
 
-        return {"supplier_id": supplier_id, "total_orders": total_orders}
+        return {"supplier_id": supplier_id, "total_orders": stats.get("total_orders", 0)}
     except Exception as e:
         
         raise HTTPException(status_code=500, detail="Failed to fetch supplier total orders.")
@@ -4712,172 +5023,232 @@ def auth_callback(request: Request):
         return JSONResponse(status_code=400, content={"error": "Token exchange failed", "details": str(e)})
     
 
+def sse_event(event: str, data: dict) -> str:
+    """One Server-Sent Events frame. JSON keeps newlines inside tokens from breaking the framing."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
 class ChatRequest(BaseModel):
     prompt: str
-    chat_history: List[dict] = []
+    session_id: Optional[str] = None
+    chat_history: List[dict] = []  # only used to seed a new session
+    debug: bool = False  # append a `debug` event with the run's timings
+
+
+@app.get("/api/v1/chat/status")
+async def chat_status(current_user: str = Depends(get_current_user)):
+    """Agent slots in use, requests waiting for one, and answer cache counters."""
+    return {**agent_gate.stats(), "answer_cache": answer_cache.stats()}
+
+
+@app.get("/api/v1/chat/metrics")
+async def chat_metrics(reset: bool = False, current_user: str = Depends(get_current_user)):
+    """
+    Assistant latency breakdown since start (or the last reset): per model
+    step, tool, retrieval and embedding call — count, errors, latency
+    percentiles, tokens and payload bytes.
+    """
+    return instrumentation.metrics(reset=reset)
+
+
+@app.get("/api/v1/vector-sync/status")
+async def vector_sync_status(current_user: str = Depends(get_current_user)):
+    """
+    Per-collection state of the Firestore -> Qdrant sync service: pending
+    changes, lag, errors and watermark, as last reported by the service.
+    """
+    try:
+        docs = await asyncio.to_thread(lambda: list(firebase_db.get_collection("vector_sync_state").stream()))
+        now = datetime.now(timezone.utc)
+        collections = {}
+        for doc in docs:
+            state = doc.to_dict()
+            heartbeat = state.get("heartbeat_at")
+            state["seconds_since_heartbeat"] = round((now - heartbeat).total_seconds(), 1) if heartbeat else None
+            collections[doc.id] = state
+        return {"collections": collections}
+    except Exception as e:
+        loggerr.error(f"[vector_sync_status] Failed: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to fetch vector sync status")
 
 
 @app.post("/api/v1/chat")
 async def chat_endpoint(request: Request):
+    received = time.perf_counter()
     body = await request.json()
     prompt = body.get("prompt")
-    # For history, ensure you convert the frontend's simplified history
-    # back into LangChain's expected format (e.g., HumanMessage, AIMessage)
-    # This is a crucial step for the agent's memory to work correctly.
-    # Assuming `Message` from frontend maps to LangChain's internal format for simplicity here.
-    history_from_frontend = body.get("chat_history", [])
-    
-    # Convert frontend history format to LangChain's expected format
-    # Example: [{"type": "user", "content": "hi"}, {"type": "assistant", "content": "hello"}]
-    # Needs to become: [HumanMessage(content="hi"), AIMessage(content="hello")]
-    from langchain_core.messages import HumanMessage, AIMessage
-    langchain_history = []
-    for msg in history_from_frontend:
-        if msg['type'] == "user":
-            langchain_history.append(HumanMessage(content=msg['content']))
-        elif msg['type'] == "assistant":
-            langchain_history.append(AIMessage(content=msg['content']))
-
+    debug = bool(body.get("debug"))
+    # Conversation memory lives server-side, per session. The first request
+    # gets a new session id (sent back as the first SSE event and the
+    # X-Session-ID header); a legacy chat_history only seeds a new session.
+    session_id = body.get("session_id")
+    if not session_id:
+        session_id = new_session_id()
+        if body.get("chat_history"):
+            seed_session(session_id, body["chat_history"])
+    history = await asyncio.to_thread(render_history, session_id)
 
     if not prompt:
         return {"error": "No prompt provided."}
 
-    async def event_stream(): # Make this async if run_agent_streaming is not async
+    # Simple lookups are answered straight from the database (no agent slot,
+    # no LLM); everything else goes to the agent.
+    try:
+        routed = await asyncio.to_thread(route_question, prompt)
+    except Exception as e:
+        loggerr.warning(f"[chat] Fast-path routing failed, using the agent: {str(e)}")
+        routed = None
+
+    # A still-valid answer to the same (or a near-identical) question needs no agent run.
+    cached = None
+    if routed is None:
         try:
-            # Pass the correctly formatted history
-            for chunk in run_agent_streaming(prompt, langchain_history):
-                # Ensure the chunk is string and add SSE prefix
-                yield f"data: {chunk}\n\n"
-                # Add a small async sleep to allow the client to process and prevent blocking
-                await asyncio.sleep(0.01) 
+            cached = await asyncio.to_thread(answer_cache.lookup, prompt, history)
         except Exception as e:
-            # Send errors in SSE format as well, or as a distinct error message
-            yield f"data: [Error]: {str(e)}\n\n" 
-
-    return StreamingResponse(event_stream(), media_type="text/event-stream") # Change media type
+            loggerr.warning(f"[chat] Answer cache lookup failed: {str(e)}")
+
+    # Refuse up front when every slot and queue place is taken, so an
+    # overloaded server answers with a plain 503 instead of an SSE error.
+    if routed is None and cached is None and agent_gate.is_full():
+        raise HTTPException(status_code=503, detail="The assistant is busy, please try again shortly.",
+                            headers={"Retry-After": "10"})
+
+    async def event_stream():
+        # Events are forwarded as soon as the agent produces them: queue
+        # position while waiting, progress while tools run, then one frame per
+        # LLM token chunk.
+        yield sse_event("session", {"session_id": session_id})
+        if routed is not None:
+            answer.append(routed.text)
+            yield sse_event("progress", {"type": "progress", "stage": "routed", "intent": routed.intent})
+            yield sse_event("token", {"text": routed.text})
+            if debug:
+                yield sse_event("debug", {"type": "debug", "path": "routed", "total_ms": elapsed_ms()})
+            yield sse_event("done", {})
+            return
+        if cached is not None:
+            answer.append(cached.answer)
+            yield sse_event("progress", {"type": "progress", "stage": "cached",
+                                         "similarity": cached.similarity, "age_seconds": cached.age_seconds})
+            yield sse_event("token", {"text": cached.answer})
+            if debug:
+                yield sse_event("debug", {"type": "debug", "path": "cached", "total_ms": elapsed_ms()})
+            yield sse_event("done", {})
+            return
+        try:
+            async for event in run_agent_streaming(prompt, history, debug=debug):
+                if event["type"] == "token":
+                    answer.append(event["text"])
+                    yield sse_event("token", {"text": event["text"]})
+                else:
+                    yield sse_event(event["type"], event)
+            yield sse_event("done", {})
+        except AgentBusyError as e:
+            yield sse_event("error", {"message": str(e), "busy": True})
+        except AgentTimeoutError as e:
+            loggerr.warning(f"[chat] Agent run timed out: {str(e)}")
+            yield sse_event("error", {"message": str(e), "timeout": True})
+        except Exception as e:
+            loggerr.error(f"[chat] Agent run failed: {str(e)}")
+            yield sse_event("error", {"message": str(e)})
+
+    answer: List[str] = []
+
+    def elapsed_ms():
+        return round((time.perf_counter() - received) * 1000, 1)
+
+    def remember_turn():
+        # Runs after the stream is sent; may call Gemini to roll old turns
+        # into the session summary.
+        if answer:
+            append_turn(session_id, prompt, "".join(answer), summarize=summarize_turns)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Stop proxies (nginx, Render) from buffering the stream into one response
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Session-ID": session_id},
+        background=BackgroundTask(remember_turn)
+    )
 
 
 
-# Initialize Gemini model (API key is read from the GOOGLE_API_KEY environment
-# variable — never hard-code secrets in source).
-gemini = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    google_api_key=os.getenv("GOOGLE_API_KEY"),
-)
-
-# ----------- Helper Functions -----------
-
-def extract_invoice_data_from_pdf(file_path: str):
-    all_text = ""
-    all_tables = []
-
-    with pdfplumber.open(file_path) as pdf:
-        for page in pdf.pages:
-            # Extract plain text
-            text = page.extract_text()
-            if text:
-                all_text += text + "\n"
-
-            # Extract tables
-            table = page.extract_table()
-            if table:
-                all_tables.append(table)
-
-    return all_text.strip(), all_tables
-
-def format_tables_as_text(tables):
-    if not tables:
-        return ""
-
-    formatted = []
-    for table in tables:
-        rows = ["\t".join(cell if cell is not None else "" for cell in row) for row in table if row]
-        formatted.append("\n".join(rows))
-    return "\n\n".join(formatted)
-
-def get_structured_invoice(text: str, table_text: str):
-    print("====== SENDING PROMPT TO GEMINI ======")
-    print(text[:500])  # Print part of text for debug
-    print("====== TABLE TEXT ======")
-    print(table_text[:500])
-    full_prompt = f"""
-You are an invoice parser.
-
-Extract a structured JSON object matching the following fields:
-
-- order_type: one of ["sale", "purchase", "delivery_challan"] (string)
-- client_name (string)
-- client_id (string, optional)
-- invoice_number OR challan_number (string)
-- order_date (format: YYYY-MM-DD or ISO)
-- amount_paid (number)
-- amount_collected_by (string, optional)
-- payment_method (string)
-- payment_status: one of ["paid", "pending", "partial"] (string)
-- remarks (string)
-- status (string)
-- total_amount (number)
-- total_quantity (number)
-- total_tax (number)
-- discount (number)
-- discount_type: one of ["flat", "percentage"] (string)
-- draft (boolean)
-- items (array of objects), each with:
-    - item_id (string, optional)
-    - item_name (string)
-    - batch_number (string, optional)
-    - Expiry (string, e.g., "06/2026")
-    - quantity (number)
-    - price (number)
-    - discount (number)
-    - tax (number)
-    - link (string, optional)
-
-Here is the raw invoice content:
-{text}
-
-Here are the extracted tables from the invoice:
-{table_text}
-
-Output a clean and valid JSON. Use null for missing fields. Do not include explanations.
-"""
-
-    response = gemini.invoke([HumanMessage(content=full_prompt)])
-    return response.content
-
-# ----------- FastAPI Endpoint -----------
-import traceback
-import json  # make sure this is at the top
+# ----------- Invoice scanning -----------
+# Extraction (process pool), the async Gemini call and the SHA-256 result cache
+# live in firebase_config/invoice_scan.py, so a scan never blocks the event loop.
 
 @app.post("/api/v1/invoice/scan")
 async def scan_invoice(file: UploadFile = File(...)):
     try:
-        # Save the uploaded PDF to a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(await file.read())
-            tmp_path = tmp.name
+        result = await invoice_scan.scan_invoice(await file.read())
+        return {"structured": result.structured, "cached": result.cached, "sha256": result.sha256}
 
-        # Extract data from PDF
-        raw_text, tables = extract_invoice_data_from_pdf(tmp_path)
-        table_text = format_tables_as_text(tables)
+    except invoice_scan.InvoiceScanError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        loggerr.error(f"[scan_invoice] Failed to process {file.filename}: {str(e)}\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Failed to process invoice: {str(e)}")
 
-        # Ask Gemini to structure it
-        structured_json = get_structured_invoice(raw_text, table_text)
 
-        # Clean ```json ... ``` if present
-        if structured_json.strip().startswith("```"):
-            structured_json = structured_json.strip().strip("`")
-            if structured_json.lower().startswith("json"):
-                structured_json = structured_json[4:]
-            structured_json = structured_json.strip()
+@app.post("/api/v1/invoice/scan-batch", status_code=202)
+async def scan_invoice_batch(
+    files: List[UploadFile] = File(...),
+    create_drafts: bool = Form(False),
+    order_type: Optional[str] = Form(None),
+    current_user: str = Depends(get_current_user)
+):
+    """
+    Starts a background job over many invoice PDFs (or zips of PDFs) and returns
+    its id at once. With `create_drafts`, valid invoices become draft orders;
+    `order_type` ("sale" / "purchase") overrides the type read from each PDF.
+    """
+    uploads = [(file.filename or f"file-{i}", await file.read()) for i, file in enumerate(files)]
+    try:
+        job = await invoice_jobs.submit(uploads, current_user, create_drafts=create_drafts, order_type=order_type)
+    except invoice_scan.InvoiceScanError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Parse into Python dict to validate
-        parsed_data = json.loads(structured_json)
+    loggerr.info(
+        f"[scan_invoice_batch] Job '{job.id}' started by '{current_user}' | "
+        f"Files: {len(job.files)} | Create drafts: {create_drafts}"
+    )
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "total": len(job.files),
+        "status_url": f"/api/v1/jobs/{job.id}",
+        "events_url": f"/api/v1/jobs/{job.id}/events",
+    }
 
-        return {"structured": parsed_data}
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to process invoice: {str(e)}")
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job(job_id: str, current_user: str = Depends(get_current_user)):
+    """State of a bulk invoice job: counts by status and every file's result."""
+    job = invoice_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.snapshot()
+
+
+@app.get("/api/v1/jobs/{job_id}/events")
+async def stream_job(job_id: str, current_user: str = Depends(get_current_user)):
+    """The job's progress over SSE: `snapshot`, a `file` event per change, then `done`."""
+    job = invoice_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        async for item in job.events():
+            if item is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield sse_event(*item)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
     
 
 @app.get("/api/v1/logs")